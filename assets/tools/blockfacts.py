@@ -5,6 +5,8 @@ import os
 import subprocess
 import json
 
+from rpc_cache import CachingRPC
+
 
 #Set this to your evrmore-cli program
 cli = "evrmore-cli"
@@ -15,6 +17,8 @@ rpc_port = 18819
 #Set this information in your evrmore.conf file (in datadir, not testnet)
 rpc_user = 'rpcuser'
 rpc_pass = 'rpcpass555'
+#Answers to buried blocks and transactions are cached here across runs (set to None to only cache in memory)
+rpc_cache_file = 'rpc_cache.sqlite'
 
 
 def rpc_call(params):
@@ -23,7 +27,6 @@ def rpc_call(params):
     return(out)
 
 def get_blockinfo(num):
-    rpc_connection = get_rpc_connection()
     hash = rpc_connection.getblockhash(num)
     blockinfo = rpc_connection.getblock(hash)
     return(blockinfo)
@@ -33,7 +36,9 @@ def get_rpc_connection():
     connection = "http://%s:%s@127.0.0.1:%s"%(rpc_user, rpc_pass, rpc_port)
     #print("Connection: " + connection)
     rpc_connection = AuthServiceProxy(connection)
-    return(rpc_connection)
+    return(CachingRPC(rpc_connection, db_path=rpc_cache_file))
+
+rpc_connection = get_rpc_connection()
 
 for i in range(1,1000):
     dta = get_blockinfo(i)
@@ -24,6 +24,8 @@ import subprocess
 import json
 import signal  #Used for timeout
 
+from rpc_cache import CachingRPC
+
 JSON_ONLY_CHECK = False
 FILESIZE_THRESHOLD = 100000000
 
@@ -36,6 +38,8 @@ rpc_port = 18819
 #Set this information in your evrmore.conf file (in datadir, not testnet)
 rpc_user = 'rpcuser'
 rpc_pass = 'rpcpass555'
+#Answers to buried blocks and transactions are cached here across runs (set to None to only cache in memory)
+rpc_cache_file = 'rpc_cache.sqlite'
 
 def print_debug(str):
 	if args.debug:
@@ -57,7 +61,7 @@ def get_rpc_connection():
     from bitcoinrpc.authproxy import AuthServiceProxy, JSONRPCException
     connection = "http://%s:%s@127.0.0.1:%s"%(rpc_user, rpc_pass, rpc_port)
     rpc_conn = AuthServiceProxy(connection)
-    return(rpc_conn)
+    return(CachingRPC(rpc_conn, db_path=rpc_cache_file))
 
 rpc_connection = get_rpc_connection()
 
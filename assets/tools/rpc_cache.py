@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+# Copyright (c) 2017-2020 The Raven Core developers
+# Distributed under the MIT software license, see the accompanying
+# file COPYING or http://www.opensource.org/licenses/mit-license.php.
+
+"""
+Caching wrapper for evrmored RPC connections used by the chain scanning tools.
+
+Only answers that cannot change once they are buried deeper than a reorg
+safety depth are cached:
+
+    getblockhash <height>            height <= tip - depth
+    getblock <hash> [verbosity]      block on the active chain, more than depth confirmations
+    getrawtransaction <txid> [v]     tx confirmed in a buried block
+    getassetdata <name>              asset is not reissuable
+    decoderawtransaction, decodescript (do not depend on the chain at all)
+
+Entries are kept in a memory-bounded LRU and, optionally, in an SQLite file
+so that restarts and repeat scans do not hit the node. Asset data is not tied
+to a block, so each getassetdata answer is tagged with the tip it was read at
+and is only served while that block is on the active chain; it is moved into
+the LRU and the SQLite file once the tip is buried. The cache remembers an
+anchor block (the deepest buried block it has seen); whenever the best block
+changes the anchor is checked with getblockhash, and if it was reorganised
+away getchaintips is used to find the fork point and every entry above it is
+dropped.
+
+Usage:
+
+    from rpc_cache import CachingRPC
+    rpc_connection = CachingRPC(get_rpc_connection(), db_path='rpc_cache.sqlite')
+    rpc_connection.getblockhash(100)
+"""
+
+import atexit
+from collections import OrderedDict
+import decimal
+import json
+import sqlite3
+import time
+
+# Evrmore refuses to reorganise more than 60 blocks (-maxreorg), so anything
+# below that depth is final.
+DEFAULT_REORG_DEPTH = 60
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+# How often (in seconds) to ask the node whether the best block changed
+DEFAULT_CHECK_INTERVAL = 5
+
+# Methods whose result depends only on their arguments
+PURE_METHODS = ('decoderawtransaction', 'decodescript')
+
+
+def _encode(value):
+    def encode_decimal(o):
+        if isinstance(o, decimal.Decimal):
+            return {'__decimal__': str(o)}
+        raise TypeError(repr(o) + " is not JSON serializable")
+    return json.dumps(value, default=encode_decimal, separators=(',', ':'))
+
+
+def _decode(data):
+    def decode_decimal(d):
+        if '__decimal__' in d and len(d) == 1:
+            return decimal.Decimal(d['__decimal__'])
+        return d
+    return json.loads(data, parse_float=decimal.Decimal, object_hook=decode_decimal)
+
+
+class LRUCache:
+    """An LRU mapping of key to (height, serialized value), bounded by the total size of the values."""
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key, height, data):
+        self.pop(key)
+        self.entries[key] = (height, data)
+        self.size += len(key) + len(data)
+        while self.size > self.max_bytes and self.entries:
+            old_key, (_, old_data) = self.entries.popitem(last=False)
+            self.size -= len(old_key) + len(old_data)
+
+    def pop(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(key) + len(entry[1])
+
+    def invalidate_above(self, height):
+        for key in [k for k, (h, _) in self.entries.items() if h is not None and h > height]:
+            self.pop(key)
+
+
+class SQLiteStore:
+    """On-disk key/value store backing the LRU across restarts."""
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, height INTEGER, value TEXT)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS cache_height ON cache (height)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+        self.pending = 0
+
+    def get(self, key):
+        row = self.conn.execute("SELECT height, value FROM cache WHERE key = ?", (key,)).fetchone()
+        return row
+
+    def put(self, key, height, data):
+        self.conn.execute("INSERT OR REPLACE INTO cache (key, height, value) VALUES (?, ?, ?)", (key, height, data))
+        self.pending += 1
+        if self.pending >= 1000:
+            self.commit()
+
+    def invalidate_above(self, height):
+        self.conn.execute("DELETE FROM cache WHERE height IS NOT NULL AND height > ?", (height,))
+        self.commit()
+
+    def get_meta(self, name):
+        row = self.conn.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()
+        return None if row is None else row[0]
+
+    def set_meta(self, name, value):
+        self.conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)", (name, value))
+
+    def commit(self):
+        self.conn.commit()
+        self.pending = 0
+
+    def close(self):
+        self.commit()
+        self.conn.close()
+
+
+class CachingRPC:
+    """Wraps an RPC connection (e.g. bitcoinrpc's AuthServiceProxy) and caches immutable answers.
+
+    Any method that is not cacheable is passed straight through to the wrapped connection."""
+
+    CACHED_METHODS = ('getblockhash', 'getblock', 'getrawtransaction', 'getassetdata') + PURE_METHODS
+
+    def __init__(self, rpc, max_bytes=DEFAULT_MAX_BYTES, db_path=None, reorg_depth=DEFAULT_REORG_DEPTH, check_interval=DEFAULT_CHECK_INTERVAL):
+        self.rpc = rpc
+        self.lru = LRUCache(max_bytes)
+        self.store = SQLiteStore(db_path) if db_path else None
+        if self.store:
+            atexit.register(self.close)
+        self.reorg_depth = reorg_depth
+        self.check_interval = check_interval
+        self.hits = 0
+        self.misses = 0
+        self.best_hash = None
+        self.tip_height = -1
+        self.last_check = 0
+        self.anchor = None  # (height, hash) of the deepest buried block seen
+        # key -> (tip height, tip hash, serialized value) of getassetdata answers read at a tip that is not buried yet
+        self.recent = {}
+        if self.store:
+            anchor = self.store.get_meta('anchor')
+            if anchor is not None:
+                self.anchor = tuple(json.loads(anchor))
+
+    def __getattr__(self, name):
+        if name.startswith('__') and name.endswith('__'):
+            raise AttributeError(name)
+        if name in self.CACHED_METHODS:
+            return lambda *args: self.call(name, *args)
+        return getattr(self.rpc, name)
+
+    def close(self):
+        if self.store:
+            self.store.close()
+            self.store = None
+
+    # Cache lookups
+
+    def _lookup(self, key):
+        entry = self.recent.get(key)
+        if entry is not None:
+            return entry[0], entry[2]
+        entry = self.lru.get(key)
+        if entry is None and self.store:
+            entry = self.store.get(key)
+            if entry is not None:
+                self.lru.put(key, entry[0], entry[1])
+        return entry
+
+    def _remember(self, key, height, value):
+        data = _encode(value)
+        self.lru.put(key, height, data)
+        if self.store:
+            self.store.put(key, height, data)
+
+    def _buried_height(self):
+        return self.tip_height - self.reorg_depth
+
+    def call(self, method, *args):
+        self.check_reorg()
+        key = method + _encode(list(args))
+        entry = self._lookup(key)
+        if entry is not None:
+            self.hits += 1
+            return self._fixup(_decode(entry[1]), entry[0])
+        self.misses += 1
+        result = getattr(self.rpc, method)(*args)
+        if method == 'getassetdata':
+            self._remember_recent(key, result)
+            return result
+        height = self._cacheable_height(method, args, result)
+        if height is not False:
+            self._remember(key, height, result)
+        return result
+
+    def _remember_recent(self, key, result):
+        """Remember a getassetdata answer, tagged with the current tip, if the asset is not reissuable."""
+        if not isinstance(result, dict) or result.get('reissuable', 1):
+            return
+        # The answer is only known to belong to the tip if the tip did not move since it was last checked
+        if self.best_hash is None or self.rpc.getbestblockhash() != self.best_hash:
+            return
+        self.recent[key] = (self.tip_height, self.best_hash, _encode(result))
+
+    def _cacheable_height(self, method, args, result):
+        """Return the height to tag a cache entry with, None for entries not tied to a block, or False if not cacheable."""
+        buried = self._buried_height()
+        if method in PURE_METHODS:
+            return None
+        if method == 'getblockhash':
+            height = args[0]
+            if height > buried:
+                return False
+            self._set_anchor(height, result)
+            return height
+        if method == 'getblock':
+            # Blocks off the active chain report -1 confirmations
+            if not isinstance(result, dict) or result.get('confirmations', 0) <= self.reorg_depth:
+                return False
+            self._set_anchor(result['height'], result['hash'])
+            for txid in result.get('tx', []):
+                # Remember which block confirmed each transaction so plain getrawtransaction calls can be cached
+                txid = txid['txid'] if isinstance(txid, dict) else txid
+                self._remember('confirmed' + txid, result['height'], result['height'])
+            return result['height']
+        if method == 'getrawtransaction':
+            if isinstance(result, dict):
+                if result.get('confirmations', 0) <= self.reorg_depth:
+                    return False
+                return self.tip_height - result['confirmations'] + 1
+            entry = self._lookup('confirmed' + args[0])
+            return False if entry is None else entry[0]
+        return False
+
+    def _fixup(self, value, height):
+        """Recompute the confirmation count of a cached answer against the current tip."""
+        if isinstance(value, dict) and 'confirmations' in value and height is not None:
+            value['confirmations'] = self.tip_height - height + 1
+        return value
+
+    # Reorg handling
+
+    def _set_anchor(self, height, block_hash):
+        if self.anchor is None or height > self.anchor[0]:
+            self.anchor = (height, block_hash)
+            if self.store:
+                self.store.set_meta('anchor', json.dumps(self.anchor))
+
+    def _check_recent(self):
+        """Drop the getassetdata answers whose tip left the active chain, and persist those whose tip is buried."""
+        buried = self._buried_height()
+        on_chain = {}
+        for key, (height, block_hash, data) in list(self.recent.items()):
+            tag = (height, block_hash)
+            if tag not in on_chain:
+                on_chain[tag] = height <= self.tip_height and self.rpc.getblockhash(height) == block_hash
+            if not on_chain[tag]:
+                del self.recent[key]
+            elif height <= buried:
+                del self.recent[key]
+                self.lru.put(key, height, data)
+                if self.store:
+                    self.store.put(key, height, data)
+                self._set_anchor(height, block_hash)
+
+    def check_reorg(self, force=False):
+        """Refresh the tip and drop cache entries invalidated by a reorg."""
+        now = time.time()
+        if not force and now - self.last_check < self.check_interval:
+            return
+        self.last_check = now
+        best_hash = self.rpc.getbestblockhash()
+        if best_hash == self.best_hash:
+            return
+        self.best_hash = best_hash
+        self.tip_height = self.rpc.getblockcount()
+        self._check_recent()
+        if self.anchor is None:
+            return
+        anchor_height, anchor_hash = self.anchor
+        if anchor_height <= self.tip_height and self.rpc.getblockhash(anchor_height) == anchor_hash:
+            return
+        # The anchor is no longer on the active chain. Find the lowest fork point among the
+        # non-active chain tips and forget everything above it.
+        fork_height = -1
+        for tip in self.rpc.getchaintips():
+            if tip['status'] != 'active':
+                tip_fork = tip['height'] - tip['branchlen']
+                if tip_fork < anchor_height:
+                    fork_height = tip_fork if fork_height < 0 else min(fork_height, tip_fork)
+        self.lru.invalidate_above(fork_height)
+        if self.store:
+            self.store.invalidate_above(fork_height)
+        self.anchor = None
+        if fork_height >= 0:
+            self._set_anchor(fork_height, self.rpc.getblockhash(fork_height))
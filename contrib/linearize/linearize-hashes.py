@@ -69,33 +69,78 @@ class EvrmoreRPC:
 	def response_is_error(resp_obj):
 		return 'error' in resp_obj and resp_obj['error'] is not None
 
+def rpc_call(rpc, method, params=None):
+	reply = rpc.execute(rpc.build_request(0, method, params))
+	if reply is None:
+		print('Cannot continue. Program will halt.')
+		sys.exit(1)
+	if rpc.response_is_error(reply):
+		print('JSON-RPC: error in', method, ': ', reply['error'], file=sys.stderr)
+		sys.exit(1)
+	return reply['result']
+
+def load_hash_cache(rpc, settings):
+	""" Load the height -> hash cache, dropping it if the chain was reorganised below the cached blocks """
+	cache = {}
+	if not os.path.isfile(settings['hashcache']):
+		return cache
+	with open(settings['hashcache'], 'r', encoding="utf8") as f:
+		for line in f:
+			height, blockhash = line.split()
+			cache[int(height)] = blockhash
+	if cache:
+		top = max(cache)
+		if top > rpc_call(rpc, 'getblockcount') or rpc_call(rpc, 'getblockhash', [top]) != cache[top]:
+			print('Hash cache does not match the active chain, discarding it.', file=sys.stderr)
+			cache = {}
+			os.remove(settings['hashcache'])
+	return cache
+
 def get_block_hashes(settings, max_blocks_per_call=10000):
 	rpc = EvrmoreRPC(settings['host'], settings['port'],
 			 settings['rpcuser'], settings['rpcpassword'])
 
+	cache = {}
+	cache_file = None
+	if 'hashcache' in settings:
+		cache = load_hash_cache(rpc, settings)
+		# Only blocks buried deeper than the maximum reorg depth are final and can be cached
+		buried_height = rpc_call(rpc, 'getblockcount') - settings['reorg_depth']
+		cache_file = open(settings['hashcache'], 'a', encoding="utf8")
+
 	height = settings['min_height']
 	while height < settings['max_height']+1:
 		num_blocks = min(settings['max_height']+1-height, max_blocks_per_call)
 		batch = []
 		for x in range(num_blocks):
-			batch.append(rpc.build_request(x, 'getblockhash', [height + x]))
+			if height + x not in cache:
+				batch.append(rpc.build_request(x, 'getblockhash', [height + x]))
 
-		reply = rpc.execute(batch)
+		reply = rpc.execute(batch) if batch else []
 		if reply is None:
 			print('Cannot continue. Program will halt.')
 			return None
 
-		for x,resp_obj in enumerate(reply):
+		for resp_obj in reply:
+			x = resp_obj['id']
 			if rpc.response_is_error(resp_obj):
 				print('JSON-RPC: error at height', height+x, ': ', resp_obj['error'], file=sys.stderr)
 				sys.exit(1)
-			assert(resp_obj['id'] == x) # assume replies are in-sequence
+			cache[height + x] = resp_obj['result']
+			if cache_file is not None and height + x <= buried_height:
+				cache_file.write('%d %s\n' % (height + x, resp_obj['result']))
+
+		for x in range(num_blocks):
+			blockhash = cache[height + x]
 			if settings['rev_hash_bytes'] == 'true':
-				resp_obj['result'] = hex_switchEndian(resp_obj['result'])
-			print(resp_obj['result'])
+				blockhash = hex_switchEndian(blockhash)
+			print(blockhash)
 
 		height += num_blocks
 
+	if cache_file is not None:
+		cache_file.close()
+
 def get_rpc_cookie():
 	# Open the cookie file
 	with open(os.path.join(os.path.expanduser(settings['datadir']), '.cookie'), 'r', encoding="ascii") as f:
@@ -133,6 +178,8 @@ if __name__ == '__main__':
 		settings['max_height'] = 313000
 	if 'rev_hash_bytes' not in settings:
 		settings['rev_hash_bytes'] = 'false'
+	if 'reorg_depth' not in settings:
+		settings['reorg_depth'] = 60
 
 	use_userpass = True
 	use_datadir = False
@@ -147,6 +194,7 @@ if __name__ == '__main__':
 	settings['port'] = int(settings['port'])
 	settings['min_height'] = int(settings['min_height'])
 	settings['max_height'] = int(settings['max_height'])
+	settings['reorg_depth'] = int(settings['reorg_depth'])
 
 	# Force hash byte format setting to be lowercase to make comparisons easier.
 	settings['rev_hash_bytes'] = settings['rev_hash_bytes'].lower()
@@ -1,4 +1,4 @@
-#!/usr/bin/env python
+#!/usr/bin/env python3
 # Copyright (c) 2012-2016 The Bitcoin Core developers
 # Copyright (c) 2017-2020 The Raven Core developers
 # Distributed under the MIT software license, see the accompanying
@@ -13,18 +13,24 @@ Usage:
 # 2012 Wladimir J. van der Laan
 # Released under MIT License
 import os
+import sys
 from itertools import islice
-from base58 import b58encode_chk, b58decode_chk, b58chars
 import random
 from binascii import b2a_hex
 
-# key types
-PUBKEY_ADDRESS = 0
-SCRIPT_ADDRESS = 5
-PUBKEY_ADDRESS_TEST = 111
-SCRIPT_ADDRESS_TEST = 196
-PRIVKEY = 128
-PRIVKEY_TEST = 239
+# Base58 and the version bytes are shared with the functional test framework
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'test', 'functional'))
+from test_framework.base58 import (  # noqa: E402
+    B58_CHARS as b58chars,
+    b58decode_chk,
+    b58encode_chk,
+    PUBKEY_ADDRESS,
+    PUBKEY_ADDRESS_TEST,
+    SCRIPT_ADDRESS,
+    SCRIPT_ADDRESS_TEST,
+    SECRET_KEY as PRIVKEY,
+    SECRET_KEY_TEST as PRIVKEY_TEST,
+)
 
 metadata_keys = ['isPrivkey', 'isTestnet', 'addrType', 'isCompressed']
 # templates for valid sequences
@@ -43,12 +49,13 @@ templates = [
 
 def is_valid(v):
     '''Check vector v for validity'''
-    result = b58decode_chk(v)
-    if result is None:
+    try:
+        result = b58decode_chk(v)
+    except ValueError:
         return False
     for template in templates:
-        prefix = str(bytearray(template[0]))
-        suffix = str(bytearray(template[2]))
+        prefix = bytes(template[0])
+        suffix = bytes(template[2])
         if result.startswith(prefix) and result.endswith(suffix):
             if (len(result) - len(prefix) - len(suffix)) == template[1]:
                 return True
@@ -58,21 +65,21 @@ def gen_valid_vectors():
     '''Generate valid test vectors'''
     while True:
         for template in templates:
-            prefix = str(bytearray(template[0]))
-            payload = os.urandom(template[1]) 
-            suffix = str(bytearray(template[2]))
+            prefix = bytes(template[0])
+            payload = os.urandom(template[1])
+            suffix = bytes(template[2])
             rv = b58encode_chk(prefix + payload + suffix)
             assert is_valid(rv)
             metadata = dict([(x,y) for (x,y) in zip(metadata_keys,template[3]) if y is not None])
-            yield (rv, b2a_hex(payload), metadata)
+            yield (rv, b2a_hex(payload).decode('ascii'), metadata)
 
 def gen_invalid_vector(template, corrupt_prefix, randomize_payload_size, corrupt_suffix):
     '''Generate possibly invalid vector'''
     if corrupt_prefix:
         prefix = os.urandom(1)
     else:
-        prefix = str(bytearray(template[0]))
-    
+        prefix = bytes(template[0])
+
     if randomize_payload_size:
         payload = os.urandom(max(int(random.expovariate(0.5)), 50))
     else:
@@ -81,7 +88,7 @@ def gen_invalid_vector(template, corrupt_prefix, randomize_payload_size, corrupt
     if corrupt_suffix:
         suffix = os.urandom(len(template[2]))
     else:
-        suffix = str(bytearray(template[2]))
+        suffix = bytes(template[2])
 
     return b58encode_chk(prefix + payload + suffix)
 
@@ -112,7 +119,7 @@ def gen_invalid_vectors():
                 yield val,
 
 if __name__ == '__main__':
-    import sys, json
+    import json
     iters = {'valid':gen_valid_vectors, 'invalid':gen_invalid_vectors}
     try:
         uiter = iters[sys.argv[1]]
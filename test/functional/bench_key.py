@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# Copyright (c) 2017-2020 The Raven Core developers
+# Distributed under the MIT software license, see the accompanying
+# file COPYING or http://www.opensource.org/licenses/mit-license.php.
+
+"""
+Cross-check and benchmark the secp256k1 point multiplication of test_framework/key.py.
+
+EllipticCurve.mul() (fixed-base tables for the generator, Strauss-Shamir with
+wNAF for the other points) is compared with the plain double-and-add
+mul_double_and_add() on edge-case and random scalars, then both are timed on
+public key derivation, signing and verification. Exits with status 1 if the
+two implementations disagree. sign_many() and verify_many() are timed with one
+process and with a pool (--processes).
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+from test_framework.key import (
+    ECKey,
+    SECP256K1,
+    SECP256K1_G,
+    SECP256K1_ORDER,
+    sign_many,
+    verify_many,
+)
+
+
+def edge_scalars():
+    n = SECP256K1_ORDER
+    return [0, 1, 2, 3, 63, 64, 65, (1 << 128) - 1, 1 << 255, (1 << 256) - 1, n - 2, n - 1, n, n + 1]
+
+
+def cross_check(count):
+    """Return a list of the multiplications on which mul() and mul_double_and_add() disagree."""
+    failures = []
+    points = [SECP256K1_G]
+    for _ in range(4):
+        # Jacobian as well as affine points
+        points.append(SECP256K1.mul_double_and_add([(SECP256K1_G, random.randrange(1, SECP256K1_ORDER))]))
+    cases = [[(p, n)] for p in points for n in edge_scalars()]
+    for _ in range(count):
+        scalar = random.randrange(SECP256K1_ORDER)
+        cases.append([(SECP256K1_G, scalar)])
+        cases.append([(random.choice(points), scalar)])
+        cases.append([(SECP256K1_G, random.randrange(SECP256K1_ORDER)), (random.choice(points), scalar)])
+        cases.append([(p, random.randrange(SECP256K1_ORDER)) for p in points])
+    # The same point twice, and a point and its negation
+    cases.append([(points[1], 5), (points[1], 7)])
+    cases.append([(points[1], 5), (SECP256K1.negate(points[1]), 5)])
+    cases.append([(SECP256K1_G, 3), (SECP256K1_G, SECP256K1_ORDER - 3)])
+    for ps in cases:
+        if SECP256K1.affine(SECP256K1.mul(ps)) != SECP256K1.affine(SECP256K1.mul_double_and_add(ps)):
+            failures.append(ps)
+    return failures
+
+
+def timed(func, count):
+    """Return the mean time of a call of func, in milliseconds."""
+    start = time.perf_counter()
+    for i in range(count):
+        func(i)
+    return (time.perf_counter() - start) * 1e3 / count
+
+
+def benchmark(count, processes):
+    keys = []
+    for _ in range(count):
+        key = ECKey()
+        key.generate()
+        keys.append(key)
+    pubkeys = [key.get_pubkey() for key in keys]
+    msgs = [random.getrandbits(256).to_bytes(32, 'big') for _ in range(count)]
+    sigs = [key.sign_ecdsa(msg) for key, msg in zip(keys, msgs)]
+    assert all(pubkey.verify_ecdsa(sig, msg) for pubkey, sig, msg in zip(pubkeys, sigs, msgs))
+
+    start = time.perf_counter()
+    SECP256K1.fixed_base_tables.clear()
+    SECP256K1.fixed_base_table(SECP256K1_G)
+    print("Generator table built in %.1f ms" % ((time.perf_counter() - start) * 1e3))
+
+    print("%-12s %14s %14s %8s" % ("OPERATION", "MUL (ms)", "REFERENCE (ms)", "SPEEDUP"))
+    for name, func in (
+            ("get_pubkey", lambda i: keys[i].get_pubkey()),
+            ("sign_ecdsa", lambda i: keys[i].sign_ecdsa(msgs[i], rfc6979=True)),
+            ("verify_ecdsa", lambda i: pubkeys[i].verify_ecdsa(sigs[i], msgs[i]))):
+        fast = timed(func, count)
+        # Shadow the method on the instance for the reference timing
+        SECP256K1.mul = SECP256K1.mul_double_and_add
+        try:
+            reference = timed(func, count)
+        finally:
+            del SECP256K1.mul
+        print("%-12s %14.3f %14.3f %7.1fx" % (name, fast, reference, reference / fast))
+
+    processes = processes or os.cpu_count() or 1
+    print("%-12s %14s %14s %8s" % ("BATCH", "1 PROC (ms)", "%d PROCS (ms)" % processes, "SPEEDUP"))
+    for name, func in (
+            ("sign_many", lambda p: sign_many(list(zip(keys, msgs)), processes=p)),
+            ("verify_many", lambda p: verify_many(list(zip(pubkeys, sigs, msgs)), processes=p))):
+        start = time.perf_counter()
+        serial = func(1)
+        serial_time = (time.perf_counter() - start) * 1e3
+        start = time.perf_counter()
+        pooled = func(processes)
+        pooled_time = (time.perf_counter() - start) * 1e3
+        assert serial == pooled, "%s results depend on the number of processes" % name
+        print("%-12s %14.1f %14.1f %7.1fx" % (name, serial_time, pooled_time, serial_time / pooled_time))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--count', type=int, default=200, help='number of random cases and of timed operations (default: %(default)s)')
+    parser.add_argument('--seed', type=int, help='random seed')
+    parser.add_argument('--processes', type=int, help='size of the process pool for sign_many() and verify_many() (default: one per CPU)')
+    args = parser.parse_args()
+
+    seed = args.seed if args.seed is not None else random.randrange(1 << 32)
+    random.seed(seed)
+    failures = cross_check(args.count)
+    if failures:
+        for ps in failures:
+            print("Mismatch: %s" % ps, file=sys.stderr)
+        print("mul() and mul_double_and_add() disagree on %d multiplications (seed %d)" % (len(failures), seed), file=sys.stderr)
+        sys.exit(1)
+    print("mul() matches mul_double_and_add() (seed %d)" % seed)
+    benchmark(args.count, args.processes)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+# Copyright (c) 2017-2020 The Raven Core developers
+# Distributed under the MIT software license, see the accompanying
+# file COPYING or http://www.opensource.org/licenses/mit-license.php.
+
+"""
+Summarize the block validation timings that evrmored logs with -debug=bench.
+
+Each path is a debug.log, a datadir or a test temporary directory (whose
+node*/regtest/debug.log are read). With --candidate, the timings of the paths
+(the baseline) are compared to those of the candidate paths on the blocks both
+runs connected, e.g. to compare two evrmored binaries on the same blocks.
+
+See test_framework/benchlog.py.
+"""
+
+import argparse
+import json
+import sys
+
+from test_framework import benchlog
+
+
+def main():
+    parser = argparse.ArgumentParser(usage='%(prog)s [options] <path>... [--candidate <path>...]', description=__doc__)
+    parser.add_argument('paths', nargs='+', help='debug.logs, datadirs or test directories (the baseline when comparing)')
+    parser.add_argument('--candidate', nargs='+', metavar='path', help='compare with the timings at these paths')
+    parser.add_argument('--by-height', dest='by_height', action='store_true', help='match blocks of the two runs by height instead of hash')
+    parser.add_argument('--records', action='store_true', help='print one JSON object per block instead of the summary')
+    args = parser.parse_args()
+
+    baseline = benchlog.read_run(args.paths)
+    if not baseline:
+        print("No -debug=bench block timings found in %s" % " ".join(args.paths), file=sys.stderr)
+        sys.exit(1)
+
+    if args.records:
+        for record in baseline:
+            print(json.dumps(record._asdict()))
+        return
+
+    if args.candidate is None:
+        print(benchlog.format_stats(benchlog.phase_stats(baseline)))
+        return
+
+    candidate = benchlog.read_run(args.candidate)
+    comparison = benchlog.compare(baseline, candidate, by_height=args.by_height)
+    if not comparison:
+        print("The two runs have no blocks in common. Try --by-height.", file=sys.stderr)
+        sys.exit(1)
+    print(benchlog.format_comparison(comparison))
+
+
+if __name__ == '__main__':
+    main()
@@ -9,12 +9,18 @@ Combine logs from multiple Evrmore nodes as well as the test_framework log.
 
 This streams the combined log output to stdout. Use combine_logs.py > outputfile
 to write to an outputfile.
+
+Events can be filtered by time window (--since/--until, any prefix of
+"YYYY-MM-DD HH:MM:SS.ffffff"), by source (--source) and by regular expression
+(--grep). For time windows, an index of timestamps to file offsets is kept
+next to each log (<log>.idx), so only the requested part of the logs is read.
 """
 
 import argparse
 from collections import defaultdict, namedtuple
 import heapq
 import itertools
+import json
 import os
 import re
 import sys
@@ -22,22 +28,32 @@ import sys
 # Matches on the date format at the start of the log event
 TIMESTAMP_PATTERN = re.compile(r"^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\.\d{6}")
 
+# Bytes of log between two entries of the offset index
+INDEX_INTERVAL = 1 << 16
+INDEX_SUFFIX = ".idx"
+INDEX_VERSION = 1
+
 LogEvent = namedtuple('LogEvent', ['timestamp', 'source', 'event'])
 
 def main():
-    """Main function. Parses args, reads the log files and renders them as text or html."""
+    """Main function. Parses args, reads the log files and renders them as text, html or JSON lines."""
 
     parser = argparse.ArgumentParser(usage='%(prog)s [options] <test temporary directory>', description=__doc__)
     parser.add_argument('-c', '--color', dest='color', action='store_true', help='outputs the combined log with events colored by source (requires posix terminal colors. Use less -r for viewing)')
     parser.add_argument('--html', dest='html', action='store_true', help='outputs the combined log as html. Requires jinja2. pip install jinja2')
+    parser.add_argument('--jsonl', dest='jsonl', action='store_true', help='outputs the combined log as one JSON object per event')
+    parser.add_argument('--since', dest='since', help='only show events at or after this time (a prefix of YYYY-MM-DD HH:MM:SS.ffffff)')
+    parser.add_argument('--until', dest='until', help='only show events up to this time (a prefix of YYYY-MM-DD HH:MM:SS.ffffff, inclusive)')
+    parser.add_argument('--source', dest='sources', action='append', help='only show events of this source (test, node0, node1, ...). Can be given multiple times')
+    parser.add_argument('--grep', dest='grep', help='only show events matching this regular expression')
     args, unknown_args = parser.parse_known_args()
 
     if args.color and os.name != 'posix':
         print("Color output requires posix terminal colors.")
         sys.exit(1)
 
-    if args.html and args.color:
-        print("Only one out of --color or --html should be specified")
+    if sum([args.html, args.color, args.jsonl]) > 1:
+        print("Only one out of --color, --html or --jsonl should be specified")
         sys.exit(1)
 
     # There should only be one unknown argument - the path of the temporary test directory
@@ -45,11 +61,14 @@ def main():
         print("Unexpected arguments" + str(unknown_args))
         sys.exit(1)
 
-    log_events = read_logs(unknown_args[0])
+    log_events = read_logs(unknown_args[0], since=args.since, until=args.until, sources=args.sources)
+    if args.grep:
+        pattern = re.compile(args.grep)
+        log_events = (event for event in log_events if pattern.search(event.event))
 
-    print_logs(log_events, color=args.color, html=args.html)
+    print_logs(log_events, color=args.color, html=args.html, jsonl=args.jsonl)
 
-def read_logs(tmp_dir):
+def read_logs(tmp_dir, since=None, until=None, sources=None):
     """Reads log files.
 
     Delegates to generator function get_log_events() to provide individual log events
@@ -61,42 +80,109 @@ def read_logs(tmp_dir):
         if not os.path.isfile(logfile):
             break
         files.append(("node%d" % i, logfile))
+    if sources:
+        files = [(source, logfile) for source, logfile in files if source in sources]
+
+    return heapq.merge(*[get_log_events(source, f, since, until) for source, f in files])
 
-    return heapq.merge(*[get_log_events(source, f) for source, f in files])
+def load_index(logfile):
+    """Return the offset index of logfile, brought up to date with what was appended since it was written.
+
+    The index is a list of (timestamp, offset) of event starts, one per
+    INDEX_INTERVAL bytes of log."""
+    index_file = logfile + INDEX_SUFFIX
+    try:
+        with open(index_file, 'r', encoding='utf8') as f:
+            index = json.load(f)
+        assert index['version'] == INDEX_VERSION
+    except (OSError, ValueError, KeyError, AssertionError):
+        index = {'version': INDEX_VERSION, 'size': 0, 'entries': []}
+    size = os.path.getsize(logfile)
+    if size < index['size']:
+        # The log was rewritten (-shrinkdebugfile)
+        index = {'version': INDEX_VERSION, 'size': 0, 'entries': []}
+    if size == index['size']:
+        return index['entries']
+
+    entries = index['entries']
+    # Logs are only appended to: continue from the last complete line indexed
+    offset = entries[-1][1] if entries else 0
+    next_entry = offset + INDEX_INTERVAL if entries else 0
+    with open(logfile, 'rb') as infile:
+        infile.seek(offset)
+        for line in infile:
+            if not line.endswith(b"\n"):
+                break
+            if offset >= next_entry:
+                time_match = TIMESTAMP_PATTERN.match(line.decode('utf-8', 'replace'))
+                if time_match:
+                    if not entries or entries[-1][1] != offset:
+                        entries.append((time_match.group(), offset))
+                    next_entry = offset + INDEX_INTERVAL
+            offset += len(line)
+    try:
+        with open(index_file + ".new", 'w', encoding='utf8') as f:
+            json.dump({'version': INDEX_VERSION, 'size': offset, 'entries': entries}, f)
+        os.replace(index_file + ".new", index_file)
+    except OSError:
+        pass
+    return entries
+
+def seek_offset(logfile, since):
+    """Return an offset in logfile at which an event no later than since starts."""
+    offset = 0
+    for timestamp, entry_offset in load_index(logfile):
+        if timestamp >= since:
+            break
+        offset = entry_offset
+    return offset
 
-def get_log_events(source, logfile):
+def get_log_events(source, logfile, since=None, until=None):
     """Generator function that returns individual log events.
 
     Log events may be split over multiple lines. We use the timestamp
     regex match as the marker for a new log event."""
     try:
-        with open(logfile, 'r') as infile:
-            event = ''
+        with open(logfile, 'rb') as infile:
+            if since:
+                infile.seek(seek_offset(logfile, since))
+            event = []
             timestamp = ''
-            for line in infile:
+            for raw_line in infile:
+                line = raw_line.decode('utf-8', 'replace')
                 # skip blank lines
                 if line == '\n':
                     continue
                 # if this line has a timestamp, it's the start of a new log event.
                 time_match = TIMESTAMP_PATTERN.match(line)
                 if time_match:
-                    if event:
-                        yield LogEvent(timestamp=timestamp, source=source, event=event.rstrip())
-                    event = line
+                    if event and in_window(timestamp, since, until):
+                        yield LogEvent(timestamp=timestamp, source=source, event="".join(event).rstrip())
+                    event = [line]
                     timestamp = time_match.group()
+                    # Timestamps only go up: nothing later can be in the window
+                    if until and timestamp[:len(until)] > until:
+                        return
                 # if it doesn't have a timestamp, it's a continuation line of the previous log.
                 else:
-                    event += "\n" + line
+                    event.append(line)
             # Flush the final event
-            yield LogEvent(timestamp=timestamp, source=source, event=event.rstrip())
+            if event and in_window(timestamp, since, until):
+                yield LogEvent(timestamp=timestamp, source=source, event="".join(event).rstrip())
     except FileNotFoundError:
         print("File %s could not be opened. Continuing without it." % logfile, file=sys.stderr)
 
+def in_window(timestamp, since, until):
+    return (not since or timestamp >= since) and (not until or timestamp[:len(until)] <= until)
 
 # noinspection PyProtectedMember
-def print_logs(log_events, color=False, html=False):
-    """Renders the iterator of log events into text or html."""
-    if not html:
+def print_logs(log_events, color=False, html=False, jsonl=False):
+    """Renders the iterator of log events into text, html or JSON lines."""
+    if jsonl:
+        for event in log_events:
+            print(json.dumps(event._asdict()))
+
+    elif not html:
         colors = defaultdict(lambda: '')
         if color:
             colors["test"] = "\033[0;36m"   # CYAN
@@ -115,9 +201,11 @@ def print_logs(log_events, color=False, html=False):
         except ImportError:
             print("jinja2 not found. Try `pip install jinja2`")
             sys.exit(1)
-        print(jinja2.Environment(loader=jinja2.FileSystemLoader('./'))
-                    .get_template('combined_log_template.html')
-                    .render(title="Combined Logs from testcase", log_events=[event._asdict() for event in log_events]))
+        # Render event by event instead of building the whole page in memory
+        template = jinja2.Environment(loader=jinja2.FileSystemLoader(os.path.dirname(os.path.abspath(__file__))), autoescape=True) \
+            .get_template('combined_log_template.html')
+        for chunk in template.generate(title="Combined Logs from testcase", log_events=(event._asdict() for event in log_events)):
+            sys.stdout.write(chunk)
 
 if __name__ == '__main__':
     main()
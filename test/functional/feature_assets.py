@@ -14,20 +14,10 @@ import string
 
 class AssetTest(EvrmoreTestFramework):
     def set_test_params(self):
-        self.setup_clean_chain = True
+        self.fixture = "assets-active"
         self.num_nodes = 3
         self.extra_args = [['-assetindex'], ['-assetindex'], ['-assetindex']]
 
-    def activate_assets(self):
-        self.log.info("Generating EVR for node[0] and activating assets...")
-        n0 = self.nodes[0]
-
-        n0.generate(1)
-        self.sync_all()
-        n0.generate(431)
-        self.sync_all()
-        #assert_equal("active", n0.getblockchaininfo()['bip9_softforks']['assets']['status'])
-
     def big_test(self):
         self.log.info("Running big test!")
         n0, n1 = self.nodes[0], self.nodes[1]
@@ -352,7 +342,6 @@ class AssetTest(EvrmoreTestFramework):
         assert_equal(Decimal('11.11111111'), n0.listassets("*", True)[asset_name]["amount"])
 
     def run_test(self):
-        self.activate_assets()
         self.big_test()
         self.issue_param_checks()
         self.chain_assets()
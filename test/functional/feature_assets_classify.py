@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# Copyright (c) 2017-2020 The Raven Core developers
+# Distributed under the MIT software license, see the accompanying
+# file COPYING or http://www.opensource.org/licenses/mit-license.php.
+
+"""Test classify_script() of test_framework/script.py against the node's decoding of output scripts.
+
+The outputs of issue, transfer, reissue, qualifier, tag, freeze and OP_RETURN
+transactions are classified in Python and compared with the type, addresses
+and asset name of their scriptPubKey in getrawtransaction.
+"""
+
+from test_framework.address import keyhash_to_p2pkh, scripthash_to_p2sh
+from test_framework.script import (
+    classify_script,
+    NULL_ASSET_GLOBAL_RESTRICTION,
+    NULL_ASSET_TAG,
+    NULL_ASSET_VERIFIER,
+    TX_NEW_ASSET,
+    TX_NULL_DATA,
+    TX_PUBKEYHASH,
+    TX_REISSUE_ASSET,
+    TX_RESTRICTED_ASSET_DATA,
+    TX_SCRIPTHASH,
+    TX_TRANSFER_ASSET,
+)
+from test_framework.test_framework import EvrmoreTestFramework
+from test_framework.util import assert_equal, hex_str_to_bytes, satoshi_round
+
+ASSET_TYPES = (TX_NEW_ASSET, TX_TRANSFER_ASSET, TX_REISSUE_ASSET)
+
+
+class AssetsClassifyTest(EvrmoreTestFramework):
+    def set_test_params(self):
+        self.fixture = "assets-active"
+        self.num_nodes = 1
+        self.extra_args = [['-assetindex']]
+
+    def check_outputs(self, txid, expected):
+        """Compare the classification of every output of txid with the node's, and check that the
+        (type, subtype) pairs in expected are among them. Then mine the transaction."""
+        n0 = self.nodes[0]
+        found = set()
+        for vout in n0.getrawtransaction(txid, True)['vout']:
+            script_pub_key = vout['scriptPubKey']
+            template = classify_script(hex_str_to_bytes(script_pub_key['hex']))
+            assert_equal(template.type, script_pub_key['type'])
+            found.add((template.type, template.subtype))
+
+            if template.type == TX_PUBKEYHASH or (template.type in ASSET_TYPES and template.subtype == TX_PUBKEYHASH):
+                assert_equal(script_pub_key['addresses'], [keyhash_to_p2pkh(template.solution)])
+            elif template.type == TX_SCRIPTHASH or (template.type in ASSET_TYPES and template.subtype == TX_SCRIPTHASH):
+                assert_equal(script_pub_key['addresses'], [scripthash_to_p2sh(template.solution)])
+            elif template.type == TX_RESTRICTED_ASSET_DATA and template.subtype == NULL_ASSET_TAG:
+                assert_equal(script_pub_key['addresses'], [keyhash_to_p2pkh(template.solution)])
+                assert_equal(script_pub_key['asset_data']['address'], keyhash_to_p2pkh(template.solution))
+            else:
+                assert 'addresses' not in script_pub_key
+
+            if template.type in ASSET_TYPES:
+                # The operation byte, then the asset name (serialized with a one byte length)
+                operation, name_length = template.asset_data[0], template.asset_data[1]
+                assert_equal(chr(operation) in ('q', 'o'), template.type == TX_NEW_ASSET)
+                assert_equal(template.asset_data[2:2 + name_length].decode('ascii'), script_pub_key['asset']['name'])
+        for pair in expected:
+            assert pair in found, "%s not among the outputs of %s: %s" % (pair, txid, found)
+        n0.generate(1)
+
+    def run_test(self):
+        n0 = self.nodes[0]
+        address = n0.getnewaddress()
+        multisig_address = n0.createmultisig(1, [n0.getnewaddress()])['address']
+
+        self.log.info("Issuing, transferring and reissuing assets...")
+        txid = n0.issue(asset_name="CLASSIFY", qty=1000, to_address=address, change_address="", units=0, reissuable=True, has_ipfs=False)[0]
+        self.check_outputs(txid, [(TX_NEW_ASSET, TX_PUBKEYHASH), (TX_PUBKEYHASH, None)])
+        txid = n0.issue(asset_name="ABC", qty=1, to_address=address, change_address="", units=0, reissuable=False, has_ipfs=False)[0]
+        self.check_outputs(txid, [(TX_NEW_ASSET, TX_PUBKEYHASH)])
+        txid = n0.issue(asset_name="CLASSIFY_P2SH", qty=1000, to_address=multisig_address, change_address="", units=8, reissuable=True,
+                        has_ipfs=True, ipfs_hash="QmcvyefkqQX3PpjpY5L8B2yMd47XrVwAipr6cxUt2zvYU8")[0]
+        self.check_outputs(txid, [(TX_NEW_ASSET, TX_SCRIPTHASH)])
+        txid = n0.transfer(asset_name="CLASSIFY", qty=200, to_address=n0.getnewaddress())[0]
+        self.check_outputs(txid, [(TX_TRANSFER_ASSET, TX_PUBKEYHASH)])
+        txid = n0.reissue(asset_name="CLASSIFY", qty=2000, to_address=address, change_address="", reissuable=True, new_units=-1)[0]
+        self.check_outputs(txid, [(TX_REISSUE_ASSET, TX_PUBKEYHASH)])
+        txid = n0.sendtoaddress(multisig_address, 10)
+        self.check_outputs(txid, [(TX_SCRIPTHASH, None)])
+
+        self.log.info("Issuing qualifier and restricted assets...")
+        self.check_outputs(n0.issuequalifierasset("#CLASSIFY")[0], [(TX_NEW_ASSET, TX_PUBKEYHASH)])
+        txid = n0.issuerestrictedasset("$CLASSIFY", 1000, "#CLASSIFY", address)[0]
+        self.check_outputs(txid, [(TX_NEW_ASSET, TX_PUBKEYHASH), (TX_RESTRICTED_ASSET_DATA, NULL_ASSET_VERIFIER)])
+
+        self.log.info("Tagging and freezing addresses...")
+        self.check_outputs(n0.addtagtoaddress("#CLASSIFY", address)[0], [(TX_RESTRICTED_ASSET_DATA, NULL_ASSET_TAG)])
+        self.check_outputs(n0.freezeaddress("$CLASSIFY", address)[0], [(TX_RESTRICTED_ASSET_DATA, NULL_ASSET_TAG)])
+        self.check_outputs(n0.freezerestrictedasset("$CLASSIFY")[0], [(TX_RESTRICTED_ASSET_DATA, NULL_ASSET_GLOBAL_RESTRICTION)])
+
+        self.log.info("Sending an OP_RETURN output...")
+        utxo = n0.listunspent()[0]
+        raw_tx = n0.createrawtransaction([{'txid': utxo['txid'], 'vout': utxo['vout']}],
+                                         {n0.getnewaddress(): satoshi_round(utxo['amount'] - 1), 'data': '00112233'})
+        txid = n0.sendrawtransaction(n0.signrawtransaction(raw_tx)['hex'])
+        self.check_outputs(txid, [(TX_NULL_DATA, None), (TX_PUBKEYHASH, None)])
+
+
+if __name__ == '__main__':
+    AssetsClassifyTest().main()
@@ -14,20 +14,10 @@ import string
 
 class AssetTest(EvrmoreTestFramework):
     def set_test_params(self):
-        self.setup_clean_chain = True
+        self.fixture = "assets-active"
         self.num_nodes = 3
         self.extra_args = [['-assetindex'], ['-assetindex'], ['-assetindex']]
 
-    def activate_p2sh_assets(self):
-        self.log.info("Generating EVR for node[0] and activating assets...")
-        n0 = self.nodes[0]
-
-        n0.generate(1)
-        self.sync_all()
-        n0.generate(431)
-        self.sync_all()
-        #assert_equal("active", n0.getblockchaininfo()['bip9_softforks']['p2sh_assets']['status'])
-
     def p2sh_issue_asset_test(self):
         self.log.info("Running p2sh_issue_asset_test")
         n0 = self.nodes[0]
@@ -530,7 +520,6 @@ class AssetTest(EvrmoreTestFramework):
 
 
     def run_test(self):
-        self.activate_p2sh_assets()
         self.p2sh_issue_asset_test()
         self.p2sh_1of2_single_node_asset_transfer_test()
         self.p2sh_2of3_multi_nodes_evr_send_test()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# Copyright (c) 2017-2020 The Raven Core developers
+# Distributed under the MIT software license, see the accompanying
+# file COPYING or http://www.opensource.org/licenses/mit-license.php.
+
+"""Test the caching of assets/tools/rpc_cache.py across a shallow reorg.
+
+getassetdata answers are tagged with the tip they were read at. They must be
+dropped when that tip is invalidated, even though the reorg is far shallower
+than the safety depth and no buried anchor block exists yet, and must only be
+written to the SQLite file once the tip is buried. getblock of the
+invalidated block must not be cached, however deep its height is.
+"""
+
+import configparser
+import json
+import os
+import sys
+
+from test_framework.test_framework import EvrmoreTestFramework
+from test_framework.util import assert_equal
+
+
+def cache_key(method, *args):
+    return method + json.dumps(list(args))
+
+
+class AssetsRpcCacheTest(EvrmoreTestFramework):
+    def set_test_params(self):
+        self.fixture = "assets-active"
+        self.num_nodes = 1
+        self.reorg_depth = 10
+
+    def import_rpc_cache(self):
+        # Get the configuration file to find src and assets/tools
+        config = configparser.ConfigParser()
+        if not self.options.configfile:
+            self.options.configfile = os.path.abspath(os.path.join(os.path.dirname(__file__), "../config.ini"))
+        config.read_file(open(self.options.configfile))
+        sys.path.insert(0, os.path.join(config["environment"]["SRCDIR"], "assets", "tools"))
+        import rpc_cache
+        return rpc_cache
+
+    def issue(self, asset_name):
+        n0 = self.nodes[0]
+        n0.issue(asset_name=asset_name, qty=1000, to_address=n0.getnewaddress(), change_address="",
+                 units=0, reissuable=False, has_ipfs=False)
+        return n0.generate(1)[0]
+
+    def run_test(self):
+        n0 = self.nodes[0]
+        rpc_cache = self.import_rpc_cache()
+        cache = rpc_cache.CachingRPC(n0, db_path=os.path.join(self.options.tmpdir, "rpc_cache.sqlite"),
+                                     reorg_depth=self.reorg_depth, check_interval=0)
+
+        self.log.info("Caching the data of non-reissuable assets...")
+        self.issue("SURVIVOR")
+        assert_equal(cache.getassetdata("SURVIVOR")["reissuable"], 0)
+        orphan_block = self.issue("ORPHAN")
+        assert_equal(cache.getassetdata("ORPHAN")["reissuable"], 0)
+        assert_equal(cache.getassetdata("ORPHAN")["name"], "ORPHAN")
+        assert_equal(cache.hits, 1)
+        assert cache.anchor is None
+        for asset_name in ("SURVIVOR", "ORPHAN"):
+            assert cache_key("getassetdata", asset_name) in cache.recent
+            assert cache.store.get(cache_key("getassetdata", asset_name)) is None
+
+        self.log.info("Invalidating the block of the ORPHAN issuance...")
+        n0.invalidateblock(orphan_block)
+        assert_equal(n0.getassetdata("ORPHAN"), None)
+        assert_equal(cache.getassetdata("ORPHAN"), None)
+        assert_equal(cache.hits, 1)
+        assert cache_key("getassetdata", "ORPHAN") not in cache.recent
+        assert_equal(cache.getassetdata("SURVIVOR")["name"], "SURVIVOR")
+        assert_equal(cache.hits, 2)
+
+        self.log.info("Burying the tip SURVIVOR was read at...")
+        n0.generate(self.reorg_depth)
+        cache.check_reorg(force=True)
+        assert cache_key("getassetdata", "SURVIVOR") not in cache.recent
+        assert cache.store.get(cache_key("getassetdata", "SURVIVOR")) is not None
+        assert_equal(cache.getassetdata("SURVIVOR")["name"], "SURVIVOR")
+        assert_equal(cache.hits, 3)
+
+        self.log.info("Checking that the invalidated block is not cached once it is deep enough...")
+        n0.generate(2)
+        assert_equal(cache.getblock(orphan_block)["confirmations"], -1)
+        orphan = cache.getblock(orphan_block)
+        assert_equal(orphan["confirmations"], -1)
+        assert_equal(cache.hits, 3)
+        assert cache.lru.get(cache_key("getblock", orphan_block)) is None
+        assert cache.anchor[1] != orphan_block
+        for txid in orphan["tx"]:
+            assert cache.lru.get("confirmed" + txid) is None
+        cache.close()
+
+
+if __name__ == '__main__':
+    AssetsRpcCacheTest().main()
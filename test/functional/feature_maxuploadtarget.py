@@ -18,7 +18,7 @@ from collections import defaultdict
 import time
 from test_framework.mininode import NodeConn, NodeConnCB, NetworkThread, MsgGetdata, CInv
 from test_framework.test_framework import EvrmoreTestFramework
-from test_framework.util import p2p_port, mine_large_block, assert_equal
+from test_framework.util import p2p_port, mine_large_block, assert_equal, UtxoPool
 
 
 class TestNode(NodeConnCB):
@@ -42,9 +42,6 @@ class MaxUploadTest(EvrmoreTestFramework):
         self.maxuploadtarget = 11200
         self.extra_args = [["-maxuploadtarget=%s" % self.maxuploadtarget, "-blockmaxsize=999000"]]
 
-        # Cache for utxos, as the listunspent may take a long time later in the test
-        self.utxo_cache = []
-
     def run_test(self):
         # Before we connect anything, we first set the time on the node
         # to be in the past, otherwise things break because the CNode
@@ -55,6 +52,9 @@ class MaxUploadTest(EvrmoreTestFramework):
         # Generate some old blocks
         self.nodes[0].generate(130)
 
+        # Track the utxos locally, as the listunspent may take a long time later in the test
+        self.utxo_cache = UtxoPool(self.nodes[0])
+
         # test_nodes[0] will only request old blocks
         # test_nodes[1] will only request new blocks
         # test_nodes[2] will test resetting the counters
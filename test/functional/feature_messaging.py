@@ -13,20 +13,10 @@ from test_framework.util import assert_equal, assert_raises_rpc_error, assert_co
 
 class MessagingTest(EvrmoreTestFramework):
     def set_test_params(self):
-        self.setup_clean_chain = True
+        self.fixture = "assets-active"
         self.num_nodes = 3
         self.extra_args = [['-assetindex'], ['-assetindex'], ['-assetindex']]
 
-    def activate_messaging(self):
-        self.log.info("Generating EVR for node[0] and activating messaging...")
-        n0 = self.nodes[0]
-
-        n0.generate(1)
-        self.sync_all()
-        n0.generate(431)
-        self.sync_all()
-        #assert_equal("active", n0.getblockchaininfo()['bip9_softforks']['messaging_restricted']['status'])
-
     def test_messaging(self):
         self.log.info("Testing messaging!")
         n0, n1 = self.nodes[0], self.nodes[1]
@@ -131,7 +121,6 @@ class MessagingTest(EvrmoreTestFramework):
 
 
     def run_test(self):
-        self.activate_messaging()
         self.test_messaging()
 
 
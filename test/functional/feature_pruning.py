@@ -15,7 +15,7 @@ This test takes 30 mins or more (up to 2 hours)
 import time
 import os
 from test_framework.test_framework import EvrmoreTestFramework
-from test_framework.util import connect_nodes, sync_blocks, mine_large_block, assert_equal, assert_raises_rpc_error, assert_greater_than
+from test_framework.util import connect_nodes, sync_blocks, mine_large_block, assert_equal, assert_raises_rpc_error, assert_greater_than, UtxoPool
 
 MIN_BLOCKS_TO_KEEP = 288
 
@@ -342,9 +342,9 @@ class PruneTest(EvrmoreTestFramework):
         # Determine default relay fee
         self.relayfee = self.nodes[0].getnetworkinfo()["relayfee"]
 
-        # Cache for utxos, as the listunspent may take a long time later in the test
-        self.utxo_cache_0 = []
-        self.utxo_cache_1 = []
+        # Track the utxos locally, as the listunspent may take a long time later in the test
+        self.utxo_cache_0 = UtxoPool(self.nodes[0])
+        self.utxo_cache_1 = UtxoPool(self.nodes[1])
 
         self.create_big_chain()
         # Chain diagram key:
@@ -58,19 +58,9 @@ def get_tx_issue_hex(self, node, asset_name, asset_quantity, asset_units=0):
 # noinspection PyTypeChecker
 class RawAssetTransactionsTest(EvrmoreTestFramework):
     def set_test_params(self):
-        self.setup_clean_chain = True
+        self.fixture = "assets-active"
         self.num_nodes = 3
 
-    def activate_assets(self):
-        self.log.info("Generating EVR for node[0] and activating assets...")
-        n0 = self.nodes[0]
-
-        n0.generate(1)
-        self.sync_all()
-        n0.generate(431)
-        self.sync_all()
-        #assert_equal("active", n0.getblockchaininfo()['bip9_softforks']['assets']['status'])
-
     def reissue_tampering_test(self):
         self.log.info("Tampering with raw reissues...")
 
@@ -1822,7 +1812,6 @@ class RawAssetTransactionsTest(EvrmoreTestFramework):
         assert_contains_pair(asset_name, asset_amount, n1.listmyassets())
 
     def run_test(self):
-        self.activate_assets()
         self.issue_reissue_transfer_test()
         self.unique_assets_test()
         self.issue_tampering_test()
@@ -12,21 +12,11 @@ from test_framework.util import assert_equal, assert_raises_rpc_error, assert_co
 # noinspection PyAttributeOutsideInit
 class RewardsTest(EvrmoreTestFramework):
     def set_test_params(self):
-        self.setup_clean_chain = True
+        self.fixture = "assets-active"
         self.num_nodes = 4
         self.extra_args = [["-assetindex", "-debug=rewards"], ["-assetindex", "-minrewardheight=15"], ["-assetindex"],
                            ["-assetindex"]]
 
-    def activate_assets(self):
-        self.log.info("Generating EVR for node[0] and activating assets...")
-        n0, n1, n2 = self.nodes[0], self.nodes[1], self.nodes[2]
-
-        n0.generate(1)
-        self.sync_all()
-        n0.generate(431)
-        self.sync_all()
-        #assert_equal("active", n0.getblockchaininfo()["bip9_softforks"]["assets"]["status"])
-
     # Basic functionality test - EVR reward
     # - create the main owner address
     # - mine blocks to have enough EVR for the reward payments, plus purchasing the asset
@@ -1248,7 +1238,6 @@ class RewardsTest(EvrmoreTestFramework):
             assert_equal(n3.listassetbalancesbyaddress(address_list[i + 2])['TTTTTTTTTTTTTTTTTTTTTTTTTTTTT1'], Decimal(str(10.0010)))
 
     def run_test(self):
-        self.activate_assets()
         self.basic_test_evr()
         self.basic_test_asset()
         self.payout_without_snapshot()
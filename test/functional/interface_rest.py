@@ -10,6 +10,7 @@ from struct import unpack, pack
 from io import BytesIO
 from codecs import encode
 from test_framework.test_framework import EvrmoreTestFramework
+from test_framework.rest import RESTClient
 from test_framework.util import connect_nodes_bi, assert_equal, Decimal, json, hex_str_to_bytes, assert_greater_than
 
 import http.client
@@ -325,5 +326,15 @@ class RESTTest (EvrmoreTestFramework):
         json_obj = json.loads(json_string)
         assert_equal(json_obj['bestblockhash'], bb_hash)
 
+        #walk the whole chain over a pipelined binary connection
+        rest = RESTClient.from_node(self.nodes[0])
+        headers = list(rest.walk_headers(self.nodes[0].getblockhash(0), page_size=50))
+        assert_equal(len(headers), self.nodes[0].getblockcount() + 1)
+        assert_equal([header.hash for header in headers], [self.nodes[0].getblockhash(height) for height in range(len(headers))])
+        for block in rest.scan_blocks(self.nodes[0].getblockhash(100)):
+            block.vtx[0].rehash()
+            assert_equal(block.vtx[0].hash, self.nodes[0].getblock(block.hash)['tx'][0])
+        rest.close()
+
 if __name__ == '__main__':
     RESTTest ().main ()
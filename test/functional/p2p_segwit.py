@@ -12,11 +12,12 @@ import time
 import random
 from binascii import hexlify
 from test_framework.mininode import (NodeConnCB, mininode_lock, MsgInv, CInv, MsgBlock, CBlockHeader, MsgHeaders, MsgGetdata, MsgTx, MsgWitnessTx, MsgWitnessBlock, NODE_WITNESS, CTxIn, COutPoint,
-                                     CTxInWitness, CTxWitness, MAX_BLOCK_BASE_SIZE, ser_vector, MSG_WITNESS_FLAG, CBlock, NodeConn, NODE_NETWORK, NetworkThread)
+                                     CTxInWitness, CTxWitness, MAX_BLOCK_BASE_SIZE, ser_vector, MSG_WITNESS_FLAG, CBlock, NodeConn, NODE_NETWORK, NetworkThread, ser_uint256,
+                                     uint256_from_str)
 from test_framework.test_framework import EvrmoreTestFramework
 from test_framework.util import assert_equal, connect_nodes, get_bip9_status, sync_blocks, bytes_to_hex_str, hex_str_to_bytes, sync_mempools, p2p_port
 from test_framework.script import (CScript, CScriptOp, OP_DUP, OP_HASH160, OP_EQUALVERIFY, OP_CHECKMULTISIG, segwit_version1_signature_hash, OP_CHECKSIG, CTransaction, CTxOut, OP_TRUE, CScriptNum,
-                                   hash160, OP_EQUAL, sha256, OP_0, OP_RETURN, ser_uint256, OP_2DROP, uint256_from_str, OP_DROP, struct, OP_1, OP_16, SIGHASH_ANYONECANPAY, SIGHASH_ALL, SIGHASH_NONE,
+                                   hash160, OP_EQUAL, sha256, OP_0, OP_RETURN, OP_2DROP, OP_DROP, struct, OP_1, OP_16, SIGHASH_ANYONECANPAY, SIGHASH_ALL, SIGHASH_NONE,
                                    SIGHASH_SINGLE, OP_IF, OP_ELSE, OP_ENDIF, signature_hash)
 from test_framework.blocktools import create_block, create_coinbase, add_witness_commitment, get_witness_script, WITNESS_COMMITMENT_HEADER
 from test_framework.key import ECKey
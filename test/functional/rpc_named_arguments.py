@@ -14,6 +14,7 @@ from test_framework.util import assert_equal, assert_raises_rpc_error
 class NamedArgumentTest(EvrmoreTestFramework):
     def set_test_params(self):
         self.num_nodes = 1
+        self.poolable = True
 
     def run_test(self):
         node = self.nodes[0]
@@ -27,10 +27,10 @@ class SetBanTests(EvrmoreTestFramework):
 
         # Node 0 should not be able to reconnect
         self.restart_node(1, [])
-        self.nodes[0].addnode("127.0.0.1:" + str(p2p_port(1)), "onetry")
-        time.sleep(1)
+        with self.nodes[1].assert_debug_log(expected_msgs=['dropped (banned)\n'], timeout=5):
+            self.nodes[0].addnode("127.0.0.1:" + str(p2p_port(1)), "onetry")
+            time.sleep(1)
         assert_equal(self.nodes[0].getconnectioncount(), 0)
-        self.nodes[1].assert_debug_log(expected_msgs=['dropped (banned)\n'], timeout=5)
         assert_equal(self.nodes[1].getconnectioncount(), 0)
 
         # However, node 0 should be able to reconnect if it has noban permission
@@ -6,8 +6,13 @@
 
 """Test transaction signing using the signrawtransaction RPC."""
 
+from test_framework.address import byte_to_base58
+from test_framework.key import ECKey
+from test_framework.messages import COIN
+from test_framework.script import hash160, SIGHASH_ALL, SIGHASH_ANYONECANPAY, SIGHASH_NONE, SIGHASH_SINGLE
 from test_framework.test_framework import EvrmoreTestFramework
-from test_framework.util import assert_equal, assert_raises_rpc_error
+from test_framework.txbuilder import TxBuilder, multisig_redeem_script, p2pkh_script, p2sh_p2wpkh_redeem_script, p2sh_script
+from test_framework.util import assert_equal, assert_raises_rpc_error, bytes_to_hex_str
 
 class SignRawTransactionsTest(EvrmoreTestFramework):
     def set_test_params(self):
@@ -135,9 +140,109 @@ class SignRawTransactionsTest(EvrmoreTestFramework):
         assert_equal(rawTxSigned['errors'][1]['witness'], ["304402203609e17b84f6a7d30c80bfa610b5b4542f32a8a0d5447a12fb1366d7f01cc44a0220573a954c4518331561406f90300e8f3358f51928d43c212a8caed02de67eebee01", "025476c2e83188368da1ff3e292e7acafcdb3566bb0ad253f62fc70f07aeee6357"])
         assert not rawTxSigned['errors'][0]['witness']
 
+    def offline_signing_test(self):
+        """Sign P2PKH, P2SH-multisig and P2SH-P2WPKH inputs without the node, paying to an asset transfer among others.
+
+        Expected results:
+
+        10) signrawtransaction produces exactly the same transaction from the same keys"""
+        keys = []
+        for _ in range(3):
+            key = ECKey()
+            key.generate()
+            keys.append(key)
+        pubkeys = [key.get_pubkey().get_bytes() for key in keys]
+        redeem_script = multisig_redeem_script(2, pubkeys)
+        witness_program = p2sh_p2wpkh_redeem_script(pubkeys[2])
+
+        builder = TxBuilder()
+        builder.add_p2pkh_input('9b907ef1e3c26fc71fe4a4b3580bc75264112f95050014157059c736f0202e71', 0, keys[0])
+        builder.add_p2sh_multisig_input('83a4f6a6b73660e13ee6cb3c6063fa3759c50c9b7521d0536022961898f4fb02', 0, keys, redeem_script)
+        builder.add_p2sh_p2wpkh_input('83a4f6a6b73660e13ee6cb3c6063fa3759c50c9b7521d0536022961898f4fb02', 1, keys[2], 10 * COIN)
+        builder.add_output(p2pkh_script(hash160(pubkeys[0])), 29 * COIN)
+        builder.add_asset_transfer_output(p2pkh_script(hash160(pubkeys[1])), "OFFLINE", 100 * COIN)
+        unsigned_tx = bytes_to_hex_str(builder.tx.serialize())
+
+        prevtxs = [
+            {'txid': '9b907ef1e3c26fc71fe4a4b3580bc75264112f95050014157059c736f0202e71', 'vout': 0,
+             'scriptPubKey': bytes_to_hex_str(p2pkh_script(hash160(pubkeys[0])))},
+            {'txid': '83a4f6a6b73660e13ee6cb3c6063fa3759c50c9b7521d0536022961898f4fb02', 'vout': 0,
+             'scriptPubKey': bytes_to_hex_str(p2sh_script(redeem_script)), 'redeemScript': bytes_to_hex_str(redeem_script)},
+            {'txid': '83a4f6a6b73660e13ee6cb3c6063fa3759c50c9b7521d0536022961898f4fb02', 'vout': 1,
+             'scriptPubKey': bytes_to_hex_str(p2sh_script(witness_program)), 'redeemScript': bytes_to_hex_str(witness_program), 'amount': 10},
+        ]
+        privKeys = [byte_to_base58(key.get_bytes() + b'\x01', 239) for key in keys]
+        rawTxSigned = self.nodes[0].signrawtransaction(unsigned_tx, prevtxs, privKeys)
+        assert_equal(rawTxSigned['complete'], True)
+
+        # 10) Byte-identical result
+        builder.sign()
+        assert_equal(builder.serialize(), rawTxSigned['hex'])
+
+    def sighash_types_test(self):
+        """Sign a P2SH-P2WPKH, a P2SH-multisig and a P2PKH input with each hash type without the node.
+
+        The inputs have different nSequence values, which SIGHASH_NONE and SIGHASH_SINGLE leave out
+        of the signature hash of the other inputs.
+
+        Expected results:
+
+        11) signrawtransaction produces exactly the same transaction from the same keys and hash type
+        12) signrawtransaction without keys verifies the signatures, including SIGHASH_SINGLE
+            signatures of inputs without a corresponding output (which sign the hash 1)"""
+        keys = []
+        for _ in range(3):
+            key = ECKey()
+            key.generate()
+            keys.append(key)
+        pubkeys = [key.get_pubkey().get_bytes() for key in keys]
+        redeem_script = multisig_redeem_script(2, pubkeys)
+        witness_program = p2sh_p2wpkh_redeem_script(pubkeys[2])
+        prevtxs = [
+            {'txid': '83a4f6a6b73660e13ee6cb3c6063fa3759c50c9b7521d0536022961898f4fb02', 'vout': 1,
+             'scriptPubKey': bytes_to_hex_str(p2sh_script(witness_program)), 'redeemScript': bytes_to_hex_str(witness_program), 'amount': 10},
+            {'txid': '83a4f6a6b73660e13ee6cb3c6063fa3759c50c9b7521d0536022961898f4fb02', 'vout': 0,
+             'scriptPubKey': bytes_to_hex_str(p2sh_script(redeem_script)), 'redeemScript': bytes_to_hex_str(redeem_script)},
+            {'txid': '9b907ef1e3c26fc71fe4a4b3580bc75264112f95050014157059c736f0202e71', 'vout': 0,
+             'scriptPubKey': bytes_to_hex_str(p2pkh_script(hash160(pubkeys[0])))},
+        ]
+        privKeys = [byte_to_base58(key.get_bytes() + b'\x01', 239) for key in keys]
+
+        def build(hash_type, num_outputs):
+            builder = TxBuilder()
+            builder.add_p2sh_p2wpkh_input(prevtxs[0]['txid'], prevtxs[0]['vout'], keys[2], 10 * COIN, 0xfffffffd, hash_type)
+            builder.add_p2sh_multisig_input(prevtxs[1]['txid'], prevtxs[1]['vout'], keys, redeem_script, 0xfffffffe, hash_type)
+            builder.add_p2pkh_input(prevtxs[2]['txid'], prevtxs[2]['vout'], keys[0], None, 0xffffffff, hash_type)
+            for i in range(num_outputs):
+                builder.add_output(p2pkh_script(hash160(pubkeys[i])), (i + 1) * COIN)
+            return builder
+
+        for name, base_type in (("ALL", SIGHASH_ALL), ("NONE", SIGHASH_NONE), ("SINGLE", SIGHASH_SINGLE)):
+            for anyonecanpay in (False, True):
+                hash_type_name = name + "|ANYONECANPAY" if anyonecanpay else name
+                hash_type = base_type | SIGHASH_ANYONECANPAY if anyonecanpay else base_type
+                self.log.info("Signing with %s" % hash_type_name)
+                builder = build(hash_type, 3)
+                rawTxSigned = self.nodes[0].signrawtransaction(bytes_to_hex_str(builder.tx.serialize()), prevtxs, privKeys, hash_type_name)
+                assert_equal(rawTxSigned['complete'], True)
+
+                # 11) Byte-identical result
+                builder.sign()
+                assert_equal(builder.serialize(), rawTxSigned['hex'])
+
+                # 12) The node accepts the signatures, also of inputs without a corresponding output
+                for num_outputs in (3, 1) if base_type == SIGHASH_SINGLE else (3,):
+                    builder = build(hash_type, num_outputs)
+                    builder.sign()
+                    rawTxVerified = self.nodes[0].signrawtransaction(builder.serialize(), prevtxs, [])
+                    assert_equal(rawTxVerified['complete'], True)
+                    assert_equal(rawTxVerified['hex'], builder.serialize())
+
     def run_test(self):
         self.successful_signing_test()
         self.script_verification_error_test()
+        self.offline_signing_test()
+        self.sighash_types_test()
 
 
 if __name__ == '__main__':
@@ -6,40 +6,65 @@
 
 """Encode and decode BASE58, P2PKH and P2SH addresses."""
 
-from .script import hash256, hash160, sha256, CScript, OP_0
+from .base58 import (
+    ADDRESS_VERSIONS,
+    B58_CHARS,
+    decode_versioned,
+    decode_versioned_many,
+    encode_versioned,
+    encode_versioned_many,
+    PUBKEY_ADDRESS,
+    PUBKEY_ADDRESS_TEST,
+    SCRIPT_ADDRESS,
+    SCRIPT_ADDRESS_TEST,
+)
+from .script import hash160, sha256, CScript, OP_0
 from .util import hex_str_to_bytes
 
 ADDRESS_BCRT1_UNSPENDABLE = 'n1BurnXXXXXXXXXXXXXXXXXXXXXXU1qejP'
-chars = '123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz'
+chars = B58_CHARS
 
 
 def byte_to_base58(b, version):
-    result = ''
-    hex_str = b.hex()
-    hex_str = chr(version).encode('latin-1').hex() + hex_str
-    checksum = hash256(hex_str_to_bytes(hex_str)).hex()
-    hex_str += checksum[:8]
-    value = int('0x' + hex_str, 0)
-    while value > 0:
-        result = chars[value % 58] + result
-        value //= 58
-    while hex_str[:2] == '00':
-        result = chars[0] + result
-        hex_str = hex_str[2:]
-    return result
-
-
-# TODO: def base58_decode
+    return encode_versioned(version, b)
+
+
+def base58_to_byte(s, versions=None):
+    """Decode a Base58Check string into (payload, version).
+
+    Raises ValueError if it is invalid, or if its version is not in versions
+    (e.g. ADDRESS_VERSIONS)."""
+    version, payload = decode_versioned(s, versions)
+    return payload, version
+
+
+def byte_to_base58_many(items):
+    """Encode a list of (payload, version) pairs."""
+    return encode_versioned_many([(version, b) for b, version in items])
+
+
+def base58_to_byte_many(strings, versions=None):
+    """Decode a list of Base58Check strings into (payload, version) pairs."""
+    return [(payload, version) for version, payload in decode_versioned_many(strings, versions)]
+
+
+def address_to_hash(address):
+    """Return the 20-byte hash of a P2PKH or P2SH address. Raises ValueError for other strings."""
+    payload, _ = base58_to_byte(address, ADDRESS_VERSIONS)
+    if len(payload) != 20:
+        raise ValueError("Invalid address length: %s" % address)
+    return payload
+
 
 def keyhash_to_p2pkh(hash_input, main=False):
     assert (len(hash_input) == 20)
-    version = 0 if main else 111
+    version = PUBKEY_ADDRESS if main else PUBKEY_ADDRESS_TEST
     return byte_to_base58(hash_input, version)
 
 
 def scripthash_to_p2sh(hash_in, main=False):
     assert (len(hash_in) == 20)
-    version = 5 if main else 196
+    version = SCRIPT_ADDRESS if main else SCRIPT_ADDRESS_TEST
     return byte_to_base58(hash_in, version)
 
 
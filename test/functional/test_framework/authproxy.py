@@ -45,6 +45,8 @@ import socket
 import time
 import urllib.parse
 
+from . import timeprofile, tracing
+
 HTTP_TIMEOUT = 30
 USER_AGENT = "AuthServiceProxy/0.1"
 
@@ -72,10 +74,13 @@ class AuthServiceProxy:
     __id_count = 0
 
     # ensure_ascii: escape unicode as \uXXXX, passed to json.dumps
-    def __init__(self, service_url, service_name=None, timeout=HTTP_TIMEOUT, connection=None, ensure_ascii=True):
+    # rpc_stats: optional rpcstats.RPCStats that records latency and sizes of each call, under node_label
+    def __init__(self, service_url, service_name=None, timeout=HTTP_TIMEOUT, connection=None, ensure_ascii=True, rpc_stats=None, node_label=None):
         self.__service_url = service_url
         self._service_name = service_name
         self.ensure_ascii = ensure_ascii  # can be toggled on the fly by tests
+        self.rpc_stats = rpc_stats
+        self.node_label = node_label
         self.__url = urllib.parse.urlparse(service_url)
         user = None if self.__url.username is None else self.__url.username.encode('utf8')
         passwd = None if self.__url.password is None else self.__url.password.encode('utf8')
@@ -90,7 +95,7 @@ class AuthServiceProxy:
             raise AttributeError
         if self._service_name is not None:
             name = "%s.%s" % (self._service_name, name)
-        return AuthServiceProxy(self.__service_url, name, connection=self.__conn)
+        return AuthServiceProxy(self.__service_url, name, connection=self.__conn, rpc_stats=self.rpc_stats, node_label=self.node_label)
 
     def _request(self, method, path, post_data):
         """
@@ -107,14 +112,14 @@ class AuthServiceProxy:
             self._set_conn()
         try:
             self.__conn.request(method, path, post_data, headers)
-            return self._get_response()
+            return self._get_response(len(post_data))
         except http.client.BadStatusLine as e:
             if e.line == "''":  # if connection was closed, try again
                 self.__conn.close()
                 self.__conn.request(method, path, post_data, headers)
                 print("~~~~~~~~~~~~~~~~~ Bad Status Exception ~~~~~~~~~~~~~~~~~~~~~~~~~~")
                 print(e)
-                return self._get_response()
+                return self._get_response(len(post_data))
             else:
                 raise
         except (BrokenPipeError, ConnectionResetError) as e:
@@ -124,7 +129,7 @@ class AuthServiceProxy:
             self.__conn.request(method, path, post_data, headers)
             print("~~~~~~~~~~~~~~~~~ Broken Pipe or Connection Reset Exception ~~~~~~~~~~~~~~~~~~~~~~~~~~")
             print(e)
-            return self._get_response()
+            return self._get_response(len(post_data))
 
     def get_request(self, *args, **argsn):
         AuthServiceProxy.__id_count += 1
@@ -139,7 +144,8 @@ class AuthServiceProxy:
 
     def __call__(self, *args, **argsn):
         post_data = json.dumps(self.get_request(*args, **argsn), default=encode_decimal, ensure_ascii=self.ensure_ascii)
-        response, status = self._request('POST', self.__url.path, post_data.encode('utf-8'))
+        with timeprofile.section("rpc", self._service_name), tracing.span(self.node_label or "rpc", "rpc", self._service_name):
+            response, status = self._request('POST', self.__url.path, post_data.encode('utf-8'))
         if response['error'] is not None:
             log.debug("---------------------------<authproxy>---------------------------")
             log.debug("Call failed!  postdata:")
@@ -156,12 +162,13 @@ class AuthServiceProxy:
     def batch(self, rpc_call_list):
         postdata = json.dumps(list(rpc_call_list), default=encode_decimal, ensure_ascii=self.ensure_ascii)
         log.debug("--> " + postdata)
-        response, status = self._request('POST', self.__url.path, postdata.encode('utf-8'))
+        with timeprofile.section("rpc", "batch"), tracing.span(self.node_label or "rpc", "rpc", "batch"):
+            response, status = self._request('POST', self.__url.path, postdata.encode('utf-8'))
         if status != HTTPStatus.OK:
             raise JSONRPCException({'code': -342, 'message': 'non-200 HTTP status code but no JSON-RPC error'}, status)
         return response
 
-    def _get_response(self):
+    def _get_response(self, request_size=0):
         req_start_time = time.time()
         try:
             http_response = self.__conn.getresponse()
@@ -178,9 +185,12 @@ class AuthServiceProxy:
         if content_type != 'application/json':
             raise JSONRPCException({'code': -342, 'message': 'non-JSON HTTP response with \'%i %s\' from server' % (http_response.status, http_response.reason)}, http_response.status)
 
-        response_data = http_response.read().decode('utf8')
+        response_bytes = http_response.read()
+        response_data = response_bytes.decode('utf8')
         response = json.loads(response_data, parse_float=decimal.Decimal)
         elapsed = time.time() - req_start_time
+        if self.rpc_stats is not None:
+            self.rpc_stats.record(self.node_label, self._service_name or 'batch', elapsed, request_size, len(response_bytes))
         if "error" in response and response["error"] is None:
             log.debug("<-%s- [%.6f] %s" % (response["id"], elapsed, json.dumps(response["result"], default=encode_decimal, ensure_ascii=self.ensure_ascii)))
         else:
@@ -188,7 +198,7 @@ class AuthServiceProxy:
         return response, http_response.status
 
     def __truediv__(self, relative_uri):
-        return AuthServiceProxy("{}/{}".format(self.__service_url, relative_uri), self._service_name, connection=self.__conn)
+        return AuthServiceProxy("{}/{}".format(self.__service_url, relative_uri), self._service_name, connection=self.__conn, rpc_stats=self.rpc_stats, node_label=self.node_label)
 
     def _set_conn(self, connection=None):
         port = 80 if self.__url.port is None else self.__url.port
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# Copyright (c) 2017-2020 The Raven Core developers
+# Distributed under the MIT software license, see the accompanying
+# file COPYING or http://www.opensource.org/licenses/mit-license.php.
+
+"""Base58 and Base58Check encoding, and the version bytes of Evrmore addresses and keys.
+
+Values are converted with int.from_bytes()/int.to_bytes(), and digits are
+converted two at a time (58^2 = 3364) with lookup tables. This module only
+depends on hashlib, so that contrib/testgen/gen_base58_test_vectors.py can
+use it outside of the test framework.
+"""
+
+import hashlib
+
+B58_CHARS = '123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz'
+# Base58 digit of each character
+B58_DIGITS = {c: i for i, c in enumerate(B58_CHARS)}
+# Two digit strings of 0 ... 58^2 - 1, and their values
+B58_PAIRS = [a + b for a in B58_CHARS for b in B58_CHARS]
+B58_PAIR_VALUES = {pair: i for i, pair in enumerate(B58_PAIRS)}
+
+# Version bytes (base58Prefixes in chainparams.cpp). Testnet and regtest share theirs.
+PUBKEY_ADDRESS = 33
+SCRIPT_ADDRESS = 92
+SECRET_KEY = 128
+PUBKEY_ADDRESS_TEST = 111
+SCRIPT_ADDRESS_TEST = 196
+SECRET_KEY_TEST = 239
+
+ADDRESS_VERSIONS = (PUBKEY_ADDRESS, SCRIPT_ADDRESS, PUBKEY_ADDRESS_TEST, SCRIPT_ADDRESS_TEST)
+SECRET_KEY_VERSIONS = (SECRET_KEY, SECRET_KEY_TEST)
+
+
+def checksum(data):
+    """Return the 4-byte Base58Check checksum of data (first bytes of its double SHA256)."""
+    return hashlib.sha256(hashlib.sha256(data).digest()).digest()[:4]
+
+
+def b58encode(data):
+    """Encode bytes to base58. Leading zero bytes become leading '1's."""
+    value = int.from_bytes(data, 'big')
+    pairs = []
+    while value:
+        value, pair = divmod(value, 3364)
+        pairs.append(B58_PAIRS[pair])
+    encoded = "".join(reversed(pairs)).lstrip('1')
+    return '1' * (len(data) - len(data.lstrip(b'\x00'))) + encoded
+
+
+def b58decode(s):
+    """Decode a base58 string to bytes. Raises ValueError for characters outside the alphabet."""
+    value = 0
+    start = len(s) % 2
+    try:
+        if start:
+            value = B58_DIGITS[s[0]]
+        for i in range(start, len(s), 2):
+            value = value * 3364 + B58_PAIR_VALUES[s[i:i + 2]]
+    except KeyError:
+        raise ValueError("Invalid base58 character in %r" % s)
+    zeros = len(s) - len(s.lstrip('1'))
+    return b'\x00' * zeros + value.to_bytes((value.bit_length() + 7) // 8, 'big')
+
+
+def b58encode_chk(data):
+    """Encode bytes to base58 with a 4-byte checksum."""
+    return b58encode(data + checksum(data))
+
+
+def b58decode_chk(s):
+    """Decode a Base58Check string and return the data without checksum. Raises ValueError if it is invalid."""
+    data = b58decode(s)
+    if len(data) < 4 or checksum(data[:-4]) != data[-4:]:
+        raise ValueError("Invalid base58 checksum in %r" % s)
+    return data[:-4]
+
+
+def encode_versioned(version, payload):
+    """Base58Check encode a version byte and payload, like an address or WIF key."""
+    return b58encode_chk(bytes([version]) + payload)
+
+
+def decode_versioned(s, versions=None):
+    """Decode a Base58Check string into (version, payload).
+
+    Raises ValueError if it is invalid or, if versions is given, its version
+    byte is not one of versions (e.g. ADDRESS_VERSIONS)."""
+    data = b58decode_chk(s)
+    if not data:
+        raise ValueError("No version byte in %r" % s)
+    if versions is not None and data[0] not in versions:
+        raise ValueError("Unexpected version byte %d in %r" % (data[0], s))
+    return data[0], data[1:]
+
+
+def encode_versioned_many(items):
+    """Encode a list of (version, payload) pairs."""
+    return [b58encode_chk(bytes([version]) + payload) for version, payload in items]
+
+
+def decode_versioned_many(strings, versions=None):
+    """Decode a list of Base58Check strings into (version, payload) pairs (see decode_versioned())."""
+    return [decode_versioned(s, versions) for s in strings]
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# Copyright (c) 2017-2020 The Raven Core developers
+# Distributed under the MIT software license, see the accompanying
+# file COPYING or http://www.opensource.org/licenses/mit-license.php.
+
+"""Block validation timings from debug.logs written with -debug=bench.
+
+While connecting a block, evrmored logs how long each phase took, indented
+by nesting level and ending with the total:
+
+    2020-06-01 12:00:00.000100   - Load block from disk: 0.05ms [0.01s]
+    2020-06-01 12:00:00.000200     - Connect 3 transactions: 0.40ms (0.133ms/tx, 0.200ms/txin) [0.02s (0.10ms/blk)]
+    ...
+    2020-06-01 12:00:00.000800 UpdateTip: new best=00ab... height=201 ...
+    2020-06-01 12:00:00.000900 - Connect block: 1.20ms [0.30s (1.50ms/blk)]
+
+read_blocks() turns these lines into one BlockRecord per connected block.
+Counts in phase names ("Connect 3 transactions") are moved into the record's
+counts, so that phases have the same name for every block. Disconnected
+blocks are not recorded.
+
+phase_stats() computes the distribution of each phase over a set of blocks,
+and compare() compares two runs (e.g. a baseline and a candidate evrmored)
+on the blocks they both connected. Tests can assert on the results, and
+bench_logs.py prints them.
+"""
+
+from collections import namedtuple
+import glob
+import os
+import re
+
+from .logwatch import LogWatcher
+
+# "<indent>- <phase>: <milliseconds>ms ..."
+BENCH_LINE = re.compile(r"^(\s*)- ([^:]+): ([\d.]+)ms")
+# Phase names with a count, like "Connect 3 transactions" or "Verify 5 txins"
+COUNTED_PHASE = re.compile(r"^(\w+) (\d+) (\w+)$")
+UPDATE_TIP = re.compile(r"UpdateTip: new best=(\w+) height=(\d+)")
+
+# The line that ends the record of a connected block
+BLOCK_TOTAL = "Connect block"
+
+BenchLine = namedtuple("BenchLine", "phase level milliseconds counts")
+# phases: phase name -> milliseconds. time: when the block was connected (seconds since the epoch).
+BlockRecord = namedtuple("BlockRecord", "source height hash time phases counts")
+PhaseStats = namedtuple("PhaseStats", "count total mean median p90 p99 max")
+PhaseComparison = namedtuple("PhaseComparison", "blocks baseline candidate change")
+
+
+def parse_bench_line(message):
+    """Parse a -debug=bench timing (a log message without timestamp). Returns a BenchLine or None."""
+    match = BENCH_LINE.match(message)
+    if match is None:
+        return None
+    phase = match.group(2)
+    counts = {}
+    counted = COUNTED_PHASE.match(phase)
+    if counted:
+        phase = "%s %s" % (counted.group(1), counted.group(3))
+        counts[counted.group(3)] = int(counted.group(2))
+    return BenchLine(phase, len(match.group(1)) // 2, float(match.group(3)), counts)
+
+
+def read_blocks(debug_log, source=None):
+    """Return the BlockRecords of the blocks connected in debug_log, in log order."""
+    records = []
+    phases = {}
+    counts = {}
+    height = None
+    block_hash = None
+    for event in LogWatcher(debug_log).read():
+        tip = UPDATE_TIP.search(event.message)
+        if tip:
+            block_hash, height = tip.group(1), int(tip.group(2))
+            continue
+        line = parse_bench_line(event.message)
+        if line is None:
+            continue
+        if line.phase == "Disconnect block":
+            phases, counts = {}, {}
+            continue
+        phases[line.phase] = phases.get(line.phase, 0.0) + line.milliseconds
+        counts.update(line.counts)
+        if line.level == 0 and line.phase == BLOCK_TOTAL:
+            records.append(BlockRecord(source or debug_log, height, block_hash, event.time, phases, counts))
+            phases, counts = {}, {}
+            height = block_hash = None
+    return records
+
+
+def find_logs(path):
+    """Return the debug.logs at path: a debug.log, a datadir or a test directory."""
+    if os.path.isfile(path):
+        return [path]
+    for pattern in ("debug.log", "regtest/debug.log", "node*/regtest/debug.log"):
+        logs = sorted(glob.glob(os.path.join(path, pattern)))
+        if logs:
+            return logs
+    return []
+
+
+def read_run(paths):
+    """Return the BlockRecords of all debug.logs found at paths (see find_logs())."""
+    records = []
+    for path in paths:
+        for debug_log in find_logs(path):
+            records.extend(read_blocks(debug_log))
+    return records
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of a non-empty sorted list."""
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def distribution(values):
+    values = sorted(values)
+    total = sum(values)
+    return PhaseStats(len(values), total, total / len(values), percentile(values, 0.5),
+                      percentile(values, 0.9), percentile(values, 0.99), values[-1])
+
+
+def phase_stats(records):
+    """Return a dict of phase name to the PhaseStats of its milliseconds over records."""
+    values = {}
+    for record in records:
+        for phase, milliseconds in record.phases.items():
+            values.setdefault(phase, []).append(milliseconds)
+    return {phase: distribution(phase_values) for phase, phase_values in values.items()}
+
+
+def block_key(record, by_height=False):
+    return record.height if by_height else record.hash
+
+
+def compare(baseline, candidate, by_height=False):
+    """Compare the phase timings of two runs on the blocks both of them connected.
+
+    Blocks are matched by hash, or by height if by_height (when the runs
+    connected different blocks at the same heights). Returns a dict of phase
+    name to PhaseComparison, whose change is the relative change of the
+    median (0.1 means the candidate is 10% slower)."""
+    common = {block_key(record, by_height) for record in baseline} & {block_key(record, by_height) for record in candidate}
+    common.discard(None)
+    baseline_stats = phase_stats([record for record in baseline if block_key(record, by_height) in common])
+    candidate_stats = phase_stats([record for record in candidate if block_key(record, by_height) in common])
+    comparison = {}
+    for phase in baseline_stats.keys() & candidate_stats.keys():
+        base, cand = baseline_stats[phase], candidate_stats[phase]
+        change = (cand.median - base.median) / base.median if base.median else 0.0
+        comparison[phase] = PhaseComparison(len(common), base, cand, change)
+    return comparison
+
+
+def format_stats(stats):
+    lines = ["%-32s %7s %10s %9s %9s %9s %9s %9s" % ("PHASE (ms)", "BLOCKS", "TOTAL", "MEAN", "MEDIAN", "P90", "P99", "MAX")]
+    for phase, s in sorted(stats.items(), key=lambda item: item[1].total, reverse=True):
+        lines.append("%-32s %7d %10.2f %9.3f %9.3f %9.3f %9.3f %9.3f" % (phase, s.count, s.total, s.mean, s.median, s.p90, s.p99, s.max))
+    return "\n".join(lines)
+
+
+def format_comparison(comparison):
+    lines = ["%-32s %7s %12s %12s %8s %12s %12s" % ("PHASE (ms)", "BLOCKS", "BASE MEDIAN", "CAND MEDIAN", "CHANGE", "BASE P90", "CAND P90")]
+    for phase, c in sorted(comparison.items(), key=lambda item: item[1].baseline.total, reverse=True):
+        lines.append("%-32s %7d %12.3f %12.3f %+7.1f%% %12.3f %12.3f" % (
+            phase, c.blocks, c.baseline.median, c.candidate.median, 100 * c.change, c.baseline.p90, c.candidate.p90))
+    return "\n".join(lines)
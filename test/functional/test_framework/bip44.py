@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+# Copyright (c) 2017-2020 The Raven Core developers
+# Distributed under the MIT software license, see the accompanying
+# file COPYING or http://www.opensource.org/licenses/mit-license.php.
+
+"""BIP39 mnemonics and BIP32/BIP44 key derivation, as done by -bip44=1 wallets.
+
+The node turns its 12 words and passphrase into a seed with PBKDF2 (without
+normalizing them) and derives keys at m/44'/coin_type'/account'/change/index,
+where coin_type is 1 on regtest and testnet and 175 on mainnet. Bip44Wallet
+derives the same keys and addresses without RPC:
+
+    wallet = Bip44Wallet(MNEMONIC, PASSPHRASE)
+    address = node.getnewaddress()
+    assert_equal(wallet.address(node.validateaddress(address)['hdkeypath']), address)
+    addresses = wallet.addresses(0, 10000)  # m/44'/1'/0'/0/0 ... m/44'/1'/0'/0/9999
+
+The extended keys of the path prefixes (like m/44'/1'/0'/0) are cached, so
+every further key of an account costs a single child derivation. Batches of
+keys are derived in a pool of processes.
+"""
+
+from collections import namedtuple
+import hashlib
+import hmac
+
+from .address import keyhash_to_p2pkh
+from .key import ECKey, map_jobs, SECP256K1_ORDER
+from .script import hash160
+from .wallet_util import (
+    bip39_chinese_simplified,
+    bip39_chinese_traditional,
+    bip39_english,
+    bip39_french,
+    bip39_italian,
+    bip39_japanese,
+    bip39_korean,
+    bip39_spanish,
+)
+
+HARDENED = 0x80000000
+BIP44_PURPOSE = 44
+# nExtCoinType of the chain parameters
+COIN_TYPE_MAIN = 175
+COIN_TYPE_TEST = 1
+
+PBKDF2_ROUNDS = 2048
+
+# In the order the node detects the language of a mnemonic
+WORDLISTS = [
+    bip39_english,
+    bip39_spanish,
+    bip39_french,
+    bip39_japanese,
+    bip39_chinese_simplified,
+    bip39_chinese_traditional,
+    bip39_korean,
+    bip39_italian,
+]
+
+# Word -> index dicts of the word lists, built on first use
+_word_indexes = {}
+
+
+class ExtKey(namedtuple("ExtKey", "secret chaincode pubkey depth fingerprint child")):
+    """A BIP32 extended private key. pubkey is the compressed public key."""
+    __slots__ = ()
+
+    def get_key(self):
+        """Return the ECKey of this extended key."""
+        key = ECKey()
+        key.set(self.secret.to_bytes(32, 'big'), True)
+        return key
+
+    def address(self, main=False):
+        return keyhash_to_p2pkh(hash160(self.pubkey), main)
+
+
+def _word_index(wordlist):
+    index = _word_indexes.get(id(wordlist))
+    if index is None:
+        index = {word: i for i, word in enumerate(wordlist)}
+        _word_indexes[id(wordlist)] = index
+    return index
+
+
+def detect_wordlist(words):
+    """Return the word list that contains all of words, or None."""
+    for wordlist in WORDLISTS:
+        index = _word_index(wordlist)
+        if all(word in index for word in words):
+            return wordlist
+    return None
+
+
+def entropy_to_mnemonic(entropy, wordlist=bip39_english):
+    """Return the mnemonic of 16 to 32 bytes of entropy (12 to 24 words)."""
+    assert len(entropy) in (16, 20, 24, 28, 32)
+    checksum_bits = len(entropy) // 4
+    value = int.from_bytes(entropy, 'big') << checksum_bits | hashlib.sha256(entropy).digest()[0] >> (8 - checksum_bits)
+    count = (len(entropy) * 8 + checksum_bits) // 11
+    words = [wordlist[(value >> (11 * (count - 1 - i))) & 0x7ff] for i in range(count)]
+    # Japanese mnemonics are joined with ideographic spaces
+    return ("\u3000" if wordlist is bip39_japanese else " ").join(words)
+
+
+def mnemonic_to_entropy(mnemonic, wordlist=None):
+    """Return the entropy of a mnemonic. Raises ValueError for unknown words or a wrong checksum."""
+    words = mnemonic.replace("\u3000", " ").split()
+    if len(words) not in (12, 15, 18, 21, 24):
+        raise ValueError("Mnemonic has %d words" % len(words))
+    wordlist = wordlist or detect_wordlist(words)
+    if wordlist is None:
+        raise ValueError("Mnemonic words are not all from one BIP39 word list")
+    index = _word_index(wordlist)
+    value = 0
+    for word in words:
+        if word not in index:
+            raise ValueError("Unknown word: %s" % word)
+        value = value << 11 | index[word]
+    checksum_bits = len(words) // 3
+    entropy = (value >> checksum_bits).to_bytes(len(words) * 4 // 3, 'big')
+    if hashlib.sha256(entropy).digest()[0] >> (8 - checksum_bits) != value & ((1 << checksum_bits) - 1):
+        raise ValueError("Mnemonic checksum mismatch")
+    return entropy
+
+
+def mnemonic_to_seed(mnemonic, passphrase=""):
+    """Return the 64-byte BIP39 seed of a mnemonic and passphrase (CMnemonic::ToSeed)."""
+    return hashlib.pbkdf2_hmac('sha512', mnemonic.encode('utf8'), ("mnemonic" + passphrase).encode('utf8'), PBKDF2_ROUNDS)
+
+
+def _pubkey(secret):
+    key = ECKey()
+    key.set(secret.to_bytes(32, 'big'), True)
+    return key.get_pubkey().get_bytes()
+
+
+def master_key(seed):
+    """Return the BIP32 master key of a seed."""
+    i = hmac.new(b"Bitcoin seed", seed, 'sha512').digest()
+    secret = int.from_bytes(i[:32], 'big')
+    assert 0 < secret < SECP256K1_ORDER, "invalid master key"
+    return ExtKey(secret, i[32:], _pubkey(secret), 0, b"\x00" * 4, 0)
+
+
+def derive_child(parent, index):
+    """Return the child index (>= HARDENED for hardened derivation) of an ExtKey."""
+    if index & HARDENED:
+        data = b"\x00" + parent.secret.to_bytes(32, 'big') + index.to_bytes(4, 'big')
+    else:
+        data = parent.pubkey + index.to_bytes(4, 'big')
+    i = hmac.new(parent.chaincode, data, 'sha512').digest()
+    tweak = int.from_bytes(i[:32], 'big')
+    secret = (tweak + parent.secret) % SECP256K1_ORDER
+    # Happens with probability below 2^-127
+    assert tweak < SECP256K1_ORDER and secret != 0, "invalid child key %d" % index
+    return ExtKey(secret, i[32:], _pubkey(secret), parent.depth + 1, hash160(parent.pubkey)[:4], index)
+
+
+def _derive_job(job):
+    parent, index = job
+    return derive_child(parent, index)
+
+
+def parse_path(path):
+    """Parse a key path like "m/44'/1'/0'/0/5" (h also marks hardened steps) into a tuple of indexes."""
+    steps = path.split("/")
+    if steps[0] != "m":
+        raise ValueError("Key path does not start with m: %s" % path)
+    indexes = []
+    for step in steps[1:]:
+        hardened = step[-1:] in ("'", "h", "H")
+        index = int(step[:-1] if hardened else step)
+        if not 0 <= index < HARDENED:
+            raise ValueError("Key path index out of range: %s" % path)
+        indexes.append(index | HARDENED if hardened else index)
+    return tuple(indexes)
+
+
+def format_path(indexes):
+    """Format a tuple of indexes as a key path, the way the node reports hdkeypath."""
+    return "/".join(["m"] + ["%d'" % (i & ~HARDENED) if i & HARDENED else "%d" % i for i in indexes])
+
+
+class Bip44Wallet:
+    """Keys of a -bip44=1 wallet, derived from its mnemonic and passphrase."""
+
+    def __init__(self, mnemonic, passphrase="", coin_type=COIN_TYPE_TEST):
+        self.coin_type = coin_type
+        # Extended keys of the path prefixes derived so far, keyed by tuple of indexes
+        self.cache = {(): master_key(mnemonic_to_seed(mnemonic, passphrase))}
+
+    def keypath(self, index, account=0, internal=False):
+        """Return the path of a key as a tuple of indexes: m/44'/coin_type'/account'/change/index."""
+        return (BIP44_PURPOSE | HARDENED, self.coin_type | HARDENED, account | HARDENED, int(internal), index)
+
+    def _parent(self, path):
+        """Return the ExtKey of path, deriving and caching it from its longest cached prefix."""
+        length = len(path)
+        while path[:length] not in self.cache:
+            length -= 1
+        ext_key = self.cache[path[:length]]
+        for i in range(length, len(path)):
+            ext_key = derive_child(ext_key, path[i])
+            self.cache[path[:i + 1]] = ext_key
+        return ext_key
+
+    def derive(self, path):
+        """Return the ExtKey at path (a key path string or tuple of indexes)."""
+        if isinstance(path, str):
+            path = parse_path(path)
+        if path in self.cache:
+            return self.cache[path]
+        return derive_child(self._parent(path[:-1]), path[-1])
+
+    def derive_many(self, paths, processes=None):
+        """Return the ExtKeys at paths, in order, in a pool of processes (default: one per CPU).
+
+        The parents of the keys are derived (and cached) first, then the keys
+        themselves are derived in parallel."""
+        paths = [parse_path(path) if isinstance(path, str) else path for path in paths]
+        jobs = [(self._parent(path[:-1]), path[-1]) for path in paths if path]
+        ext_keys = iter(map_jobs(_derive_job, jobs, processes))
+        return [next(ext_keys) if path else self.cache[()] for path in paths]
+
+    def keys(self, start, count, account=0, internal=False, processes=None):
+        """Return the ExtKeys of count consecutive indexes of an account's external (or internal) chain."""
+        return self.derive_many([self.keypath(index, account, internal) for index in range(start, start + count)], processes)
+
+    def addresses(self, start, count, account=0, internal=False, processes=None):
+        """Return the (regtest) P2PKH addresses of count consecutive keys."""
+        return [ext_key.address() for ext_key in self.keys(start, count, account, internal, processes)]
+
+    def address(self, path):
+        """Return the (regtest) P2PKH address of the key at path, e.g. the hdkeypath of validateaddress."""
+        return self.derive(path).address()
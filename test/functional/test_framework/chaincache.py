@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+# Copyright (c) 2017-2020 The Raven Core developers
+# Distributed under the MIT software license, see the accompanying
+# file COPYING or http://www.opensource.org/licenses/mit-license.php.
+
+"""Persistent, content-keyed cache of pregenerated node datadirs.
+
+Each cache entry is a directory named after a key that hashes the evrmored
+binary and the parameters the chain was built with, so a rebuilt binary or a
+changed chain layout never picks up a stale chain and an unchanged one is
+reused across test runner invocations. Entries live outside the build dir
+(see default_cache_root()) and are built at most once: concurrent builders
+serialize on a lock file and the entry is renamed into place atomically.
+
+Datadirs are cloned into a test's tmpdir file by file. LevelDB table files
+(*.ldb) are never modified after they are written, so they are hardlinked.
+Every other file may be written to in place by the node, so it is cloned
+with a reflink (FICLONE) where the filesystem supports it and copied
+otherwise.
+"""
+
+import errno
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+
+from .util import MAX_NODES
+
+# Bump when the layout of cached chains changes in a way the parameters don't capture
+CACHE_VERSION = 1
+# Number of entries (most recently used first) kept when pruning
+DEFAULT_KEEP_ENTRIES = 16
+
+# ioctl request to share the extents of one file with another (linux/fs.h)
+FICLONE = 0x40049409
+
+# Files the node never modifies after creating them. Safe to hardlink.
+IMMUTABLE_SUFFIXES = ('.ldb',)
+
+_reflink_supported = True
+
+
+def default_cache_root():
+    """Return $EVRMORE_TEST_CACHE, or evrmore-test-chains in the user's cache directory."""
+    if os.getenv("EVRMORE_TEST_CACHE"):
+        return os.getenv("EVRMORE_TEST_CACHE")
+    xdg_cache = os.getenv("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(xdg_cache, "evrmore-test-chains")
+
+
+def find_binary(binary):
+    """Resolve binary (a path or a name looked up on PATH) to an absolute path."""
+    path = shutil.which(binary)
+    if path is None:
+        raise FileNotFoundError("evrmored binary %s not found" % binary)
+    return os.path.realpath(path)
+
+
+def _file_digest(path):
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def _lock(path):
+    """Take an exclusive lock on path. Closing the returned file releases it."""
+    f = open(path, 'a+b')
+    fcntl.flock(f, fcntl.LOCK_EX)
+    return f
+
+
+def _reflink(src, dst):
+    global _reflink_supported
+    if not _reflink_supported:
+        return False
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+            return True
+        except OSError as e:
+            if e.errno in (errno.EOPNOTSUPP, errno.ENOTTY, errno.EINVAL, errno.ENOSYS):
+                _reflink_supported = False
+            elif e.errno != errno.EXDEV:
+                raise
+    return False
+
+
+def clone_file(src, dst):
+    """Clone one file of a cached datadir. Returns 'link', 'reflink' or 'copy'."""
+    if src.endswith(IMMUTABLE_SUFFIXES):
+        try:
+            os.link(src, dst)
+            return 'link'
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+                raise
+    if _reflink(src, dst):
+        shutil.copystat(src, dst)
+        return 'reflink'
+    shutil.copy2(src, dst)
+    return 'copy'
+
+
+def clone_tree(src, dst):
+    """Clone the directory tree src to dst (which must not exist).
+
+    Returns a dict of clone method to number of files."""
+    counts = {'link': 0, 'reflink': 0, 'copy': 0}
+    for dirpath, dirnames, filenames in os.walk(src):
+        target = os.path.join(dst, os.path.relpath(dirpath, src))
+        os.makedirs(target)
+        for filename in filenames:
+            counts[clone_file(os.path.join(dirpath, filename), os.path.join(target, filename))] += 1
+    return counts
+
+
+class ChainCache:
+    """A directory of cache entries, each holding the datadirs of one pregenerated chain."""
+
+    def __init__(self, root=None):
+        self.root = os.path.abspath(root or default_cache_root())
+        os.makedirs(self.root, exist_ok=True)
+
+    def binary_hash(self, binary):
+        """Return the sha256 of a binary.
+
+        Hashes are remembered by path, size, mtime and inode so that a large
+        binary is only read again after it was rebuilt."""
+        path = find_binary(binary)
+        st = os.stat(path)
+        stamp = [st.st_size, st.st_mtime_ns, st.st_ino]
+        index_file = os.path.join(self.root, "binaries.json")
+        with _lock(os.path.join(self.root, "binaries.lock")):
+            try:
+                with open(index_file, 'r', encoding='utf8') as f:
+                    index = json.load(f)
+            except (OSError, ValueError):
+                index = {}
+            entry = index.get(path)
+            if entry is not None and entry['stamp'] == stamp:
+                return entry['sha256']
+            digest = _file_digest(path)
+            index[path] = {'stamp': stamp, 'sha256': digest}
+            with open(index_file + ".new", 'w', encoding='utf8') as f:
+                json.dump(index, f, indent=1)
+            os.replace(index_file + ".new", index_file)
+        return digest
+
+    def key(self, binary, params):
+        """Return the cache key for chains built by binary with the given (JSON-serializable) parameters."""
+        description = json.dumps({'version': CACHE_VERSION, 'binary': self.binary_hash(binary), 'params': params}, sort_keys=True)
+        return hashlib.sha256(description.encode('utf8')).hexdigest()[:32]
+
+    def default_chain_key(self, binary):
+        """Return the key of the default 200-block chain with MAX_NODES nodes."""
+        return self.key(binary, {'chain': 'default', 'nodes': MAX_NODES})
+
+    def entry_dir(self, key):
+        return os.path.join(self.root, key)
+
+    def get(self, key, build):
+        """Return the directory of the entry for key, calling build(dirname) to create it if it doesn't exist yet.
+
+        build() fills an empty directory; if it raises, nothing is cached."""
+        entry = self.entry_dir(key)
+        if not os.path.isdir(entry):
+            with _lock(entry + ".lock"):
+                # Another process may have built it while we waited for the lock
+                if not os.path.isdir(entry):
+                    staging = "%s.build.%d" % (entry, os.getpid())
+                    shutil.rmtree(staging, ignore_errors=True)
+                    os.makedirs(staging)
+                    try:
+                        build(staging)
+                    except BaseException:
+                        shutil.rmtree(staging, ignore_errors=True)
+                        raise
+                    os.rename(staging, entry)
+                    self.prune(keep_key=key)
+        # The mtime of the entry records when it was last used, for prune()
+        os.utime(entry)
+        return entry
+
+    def entries(self):
+        """Return the keys of all complete entries, most recently used first."""
+        keys = [name for name in os.listdir(self.root) if '.' not in name and os.path.isdir(os.path.join(self.root, name))]
+        return sorted(keys, key=lambda name: os.stat(os.path.join(self.root, name)).st_mtime, reverse=True)
+
+    def prune(self, keep=DEFAULT_KEEP_ENTRIES, keep_key=None):
+        """Delete all but the keep most recently used entries (and keep_key)."""
+        for key in self.entries()[keep:]:
+            if key != keep_key:
+                shutil.rmtree(self.entry_dir(key), ignore_errors=True)
+
+    def clear(self):
+        shutil.rmtree(self.root, ignore_errors=True)
@@ -9,12 +9,27 @@ Utilities for doing coverage analysis on the RPC interface.
 
 Provides a way to track which RPC commands are exercised during
 testing.
+
+Calls are counted and timed in memory, per coverage file (one per node and
+process), and written out once when the process exits or is terminated.
+Each line of a coverage file is "<method> <count> <total seconds>".
 """
 
+import atexit
+from collections import defaultdict
 import os
+import signal
+import threading
+import time
 
 REFERENCE_FILENAME = 'rpc_interface.txt'
 
+# coverage file -> method -> [call count, total seconds]
+_calls = defaultdict(lambda: defaultdict(lambda: [0, 0.0]))
+# Reentrant, as the SIGTERM handler flushes on the main thread, which may hold it
+_calls_lock = threading.RLock()
+_flush_registered = False
+
 
 class AuthServiceProxyWrapper:
     """
@@ -46,17 +61,17 @@ class AuthServiceProxyWrapper:
         called to a file.
 
         """
+        start_time = time.perf_counter()
         return_val = self.auth_service_proxy_instance.__call__(*args, **kwargs)
-        self._log_call()
+        self._log_call(time.perf_counter() - start_time)
         return return_val
 
     # noinspection PyProtectedMember
-    def _log_call(self):
+    def _log_call(self, elapsed=0.0):
         rpc_method = self.auth_service_proxy_instance._service_name
 
         if self.coverage_logfile:
-            with open(self.coverage_logfile, 'a+', encoding='utf8') as f:
-                f.write("%s\n" % rpc_method)
+            record_call(self.coverage_logfile, rpc_method, elapsed)
 
     def __truediv__(self, relative_uri):
         return AuthServiceProxyWrapper(self.auth_service_proxy_instance / relative_uri,
@@ -67,6 +82,54 @@ class AuthServiceProxyWrapper:
         return self.auth_service_proxy_instance.get_request(*args, **kwargs)
 
 
+def record_call(coverage_logfile, rpc_method, elapsed):
+    global _flush_registered
+    with _calls_lock:
+        entry = _calls[coverage_logfile][rpc_method]
+        entry[0] += 1
+        entry[1] += elapsed
+        if not _flush_registered:
+            _flush_registered = True
+            atexit.register(flush)
+            _flush_on_sigterm()
+
+
+def flush():
+    """Append the calls recorded so far to their coverage files."""
+    with _calls_lock:
+        for coverage_logfile, methods in _calls.items():
+            with open(coverage_logfile, 'a+', encoding='utf8') as f:
+                for rpc_method, (count, total_time) in methods.items():
+                    f.write("%s %d %.6f\n" % (rpc_method, count, total_time))
+        _calls.clear()
+
+
+def _flush_on_sigterm():
+    """Flush before the process is terminated, unless someone else handles SIGTERM."""
+    if threading.current_thread() is not threading.main_thread() or signal.getsignal(signal.SIGTERM) != signal.SIG_DFL:
+        return
+
+    def handler(signum, frame):
+        flush()
+        signal.signal(signum, signal.SIG_DFL)
+        os.kill(os.getpid(), signum)
+    signal.signal(signal.SIGTERM, handler)
+
+
+def read_coverage_file(filename):
+    """Return a dict of method to [call count, total seconds] recorded in a coverage file."""
+    calls = defaultdict(lambda: [0, 0.0])
+    with open(filename, 'r', encoding='utf8') as f:
+        for line in f:
+            fields = line.split()
+            if not fields:
+                continue
+            entry = calls[fields[0]]
+            entry[0] += int(fields[1]) if len(fields) > 1 else 1
+            entry[1] += float(fields[2]) if len(fields) > 2 else 0.0
+    return calls
+
+
 def get_filename(dirname, n_node):
     """
     Get a filename unique to the test process ID and node.
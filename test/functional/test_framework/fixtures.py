@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# Copyright (c) 2017-2020 The Raven Core developers
+# Distributed under the MIT software license, see the accompanying
+# file COPYING or http://www.opensource.org/licenses/mit-license.php.
+
+"""Named chain fixtures for expensive setup states.
+
+A fixture is a builder function that takes a freshly started clean chain
+(the test's num_nodes nodes with the test's extra_args, connected as a chain)
+to some state, like a few hundred blocks mined so that assets can be issued.
+A test declares the fixture it starts from in set_test_params():
+
+    self.fixture = "funded-wallet"
+    self.fixture_params = {"utxos": 500}
+
+The framework builds each fixture once per evrmored binary, node count,
+extra_args and parameters, snapshots the datadirs into the chain cache (see
+chaincache.py) and clones them into the test's tmpdir. Snapshots expire
+after FIXTURE_MAX_AGE, well before their tip is old enough (-maxtipage) to
+put the nodes back into initial block download.
+
+New fixtures are registered with the register_fixture decorator. Builders
+may call other builders to extend their state.
+"""
+
+from decimal import Decimal
+
+from .util import UtxoPool
+
+# Seconds after which a fixture is rebuilt. Must stay well below the node's
+# default -maxtipage of 24 hours.
+FIXTURE_MAX_AGE = 6 * 60 * 60
+
+FIXTURES = {}
+
+
+class Fixture:
+    def __init__(self, name, build, defaults):
+        self.name = name
+        self.build = build
+        self.defaults = defaults
+
+    def params(self, overrides=None):
+        """Return the parameters to build with: the defaults updated with overrides."""
+        params = dict(self.defaults)
+        for name, value in (overrides or {}).items():
+            if name not in params:
+                raise KeyError("Fixture %s has no parameter %s" % (self.name, name))
+            params[name] = value
+        return params
+
+
+def register_fixture(name, **defaults):
+    """Register the decorated function as the builder of fixture name.
+
+    The builder is called as build(test, **params) with the test's nodes
+    running. Keyword arguments of the decorator are the parameter defaults."""
+    def decorator(build):
+        assert name not in FIXTURES, "fixture %s registered twice" % name
+        FIXTURES[name] = Fixture(name, build, defaults)
+        return build
+    return decorator
+
+
+def get_fixture(name):
+    if name not in FIXTURES:
+        raise KeyError("Unknown fixture %s (known: %s)" % (name, ", ".join(sorted(FIXTURES))))
+    return FIXTURES[name]
+
+
+@register_fixture("assets-active", blocks=432)
+def build_assets_active(test, blocks):
+    """Mine blocks on node 0 so that it can pay for issuing assets."""
+    test.log.info("Generating EVR for node[0] and activating assets...")
+    test.nodes[0].generate(blocks)
+    test.sync_all()
+
+
+@register_fixture("funded-wallet", utxos=100)
+def build_funded_wallet(test, utxos):
+    """Split coinbase outputs of node 0 into utxos confirmed outputs to one of its addresses."""
+    node = test.nodes[0]
+    build_assets_active(test, 432)
+    pool = UtxoPool(node)
+    pool.refresh()
+    pool.fan_out(utxos, Decimal("0.0001"), node.getnewaddress())
+    node.generate(1)
+    test.sync_all()
+
+
+@register_fixture("restricted-assets", base_asset="FIXTURE", qualifiers=("#KYC",), verifier="#KYC", qty=10000)
+def build_restricted_assets(test, base_asset, qualifiers, verifier, qty):
+    """Issue qualifiers, tag a fresh node 0 address with all of them and issue $<base_asset> with verifier to it.
+
+    The tagged address can be found with listaddressesfortag."""
+    n0 = test.nodes[0]
+    build_assets_active(test, 432)
+    n0.issue(base_asset)
+    for qualifier in qualifiers:
+        n0.issuequalifierasset(qualifier)
+    n0.generate(1)
+    address = n0.getnewaddress()
+    for qualifier in qualifiers:
+        n0.addtagtoaddress(qualifier, address)
+    n0.generate(1)
+    n0.issuerestrictedasset("$" + base_asset, qty, verifier, address)
+    n0.generate(1)
+    test.sync_all()
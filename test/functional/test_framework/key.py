@@ -9,6 +9,9 @@ WARNING: This code is slow, uses bad randomness, does not properly protect
 keys, and is trivially vulnerable to side channel attacks. Do not use for
 anything but tests.
 """
+from concurrent.futures import ProcessPoolExecutor
+import hmac
+import os
 import random
 
 def modinv(a, n):
@@ -67,12 +70,39 @@ def modsqrt(a, p):
         return sqrt
     return None
 
+def wnaf(n, window):
+    """Return the width-window non-adjacent form of n >= 0, least significant digit first.
+
+    Nonzero digits are odd, smaller than 2^(window-1) in absolute value, and
+    followed by at least window-1 zeros."""
+    digits = []
+    while n:
+        if n & 1:
+            d = n & ((1 << window) - 1)
+            if d >= 1 << (window - 1):
+                d -= 1 << window
+            n -= d
+        else:
+            d = 0
+        digits.append(d)
+        n >>= 1
+    return digits
+
+# Bits per window of the fixed base tables, and the scalar size they cover
+FIXED_BASE_WINDOW = 6
+FIXED_BASE_BITS = 256
+# Width of the NAF of the scalars of other points
+WNAF_WINDOW = 5
+
 class EllipticCurve:
     def __init__(self, p, a, b):
         """Initialize elliptic curve y^2 = x^3 + a*x + b over GF(p)."""
         self.p = p
         self.a = a % p
         self.b = b % p
+        # Registered fixed bases (affine point -> window) and their tables, see add_fixed_base()
+        self.fixed_bases = {}
+        self.fixed_base_tables = {}
 
     def affine(self, p1):
         """Convert a Jacobian point tuple p1 to affine form, or None if at infinity.
@@ -202,12 +232,131 @@ class EllipticCurve:
         z3 = (h*z1*z2) % self.p
         return (x3, y3, z3)
 
+    def batch_affine(self, ps):
+        """Convert a list of Jacobian tuples to affine form with a single modular inversion.
+
+        Uses Montgomery's trick: the product of all z coordinates is inverted
+        once, and each z inverse is recovered from it with two multiplications.
+        Points at infinity become None."""
+        prefix = []
+        acc = 1
+        for (_, _, z) in ps:
+            if z != 0:
+                acc = (acc * z) % self.p
+            prefix.append(acc)
+        inv = modinv(acc, self.p)
+        ret = [None] * len(ps)
+        for i in range(len(ps) - 1, -1, -1):
+            x, y, z = ps[i]
+            if z == 0:
+                continue
+            # inv is the inverse of the product of the z coordinates up to i
+            z_inv = (inv * (prefix[i - 1] if i > 0 else 1)) % self.p
+            inv = (inv * z) % self.p
+            z_inv_2 = (z_inv**2) % self.p
+            ret[i] = ((x * z_inv_2) % self.p, (y * z_inv_2 * z_inv) % self.p, 1)
+        return ret
+
+    def add_fixed_base(self, p1, window=FIXED_BASE_WINDOW):
+        """Register the affine point p1 as a base that is multiplied often, like the generator.
+
+        mul() then uses a table of the multiples j * 2^(window*i) * p1 for
+        it, which is built on first use."""
+        assert(p1[2] == 1)
+        self.fixed_bases[p1] = window
+
+    def fixed_base_table(self, p1):
+        """Return the precomputed table of the fixed base p1, building it if needed.
+
+        table[i][j - 1] is the affine point j * 2^(window*i) * p1, so a
+        multiplication takes one addition per window and no doublings."""
+        table = self.fixed_base_tables.get(p1)
+        if table is not None:
+            return table
+        window = self.fixed_bases[p1]
+        table = []
+        base = p1
+        for _ in range(0, FIXED_BASE_BITS, window):
+            multiples = [base]
+            for _ in range((1 << window) - 2):
+                multiples.append(self.add_mixed(multiples[-1], base))
+            multiples = self.batch_affine(multiples)
+            table.append(multiples)
+            # 2^window * base
+            base = self.affine(self.add_mixed(multiples[-1], base))
+        self.fixed_base_tables[p1] = table
+        return table
+
+    def mul_fixed_base(self, p1, n):
+        """Compute n * p1 for a registered fixed base p1 with its precomputed table."""
+        window = self.fixed_bases[p1]
+        mask = (1 << window) - 1
+        r = (0, 1, 0)
+        for multiples in self.fixed_base_table(p1):
+            if n == 0:
+                break
+            j = n & mask
+            if j:
+                r = self.add_mixed(r, multiples[j - 1])
+            n >>= window
+        return r
+
     def mul(self, ps):
         """Compute a (multi) point multiplication
 
         ps is a list of (Jacobian tuple, scalar) pairs.
+
+        Multiples of registered fixed bases come from their precomputed
+        tables. The other points are multiplied together (Strauss-Shamir):
+        each scalar is written in width-WNAF_WINDOW NAF, and the digits of all
+        scalars are added in a single double-and-add pass, from tables of odd
+        multiples converted to affine form with one inversion.
         """
         r = (0, 1, 0)
+        variable = []
+        for (p, n) in ps:
+            if n == 0 or p[2] == 0:
+                continue
+            if p in self.fixed_bases and n.bit_length() <= FIXED_BASE_BITS:
+                r = self.add(r, self.mul_fixed_base(p, n))
+            else:
+                variable.append((p, n))
+        if not variable:
+            return r
+
+        # Odd multiples p, 3p, 5p, ... of every point, in affine form
+        points = self.batch_affine([p for (p, _) in variable])
+        odd_multiples = []
+        for p in points:
+            p_2 = self.double(p)
+            multiples = [p]
+            for _ in range((1 << (WNAF_WINDOW - 2)) - 1):
+                multiples.append(self.add(multiples[-1], p_2))
+            odd_multiples.append(multiples)
+        flat = self.batch_affine([q for multiples in odd_multiples for q in multiples])
+        size = 1 << (WNAF_WINDOW - 2)
+        tables = [flat[i:i + size] for i in range(0, len(flat), size)]
+
+        nafs = [wnaf(n, WNAF_WINDOW) for (_, n) in variable]
+        length = max(len(naf) for naf in nafs)
+        s = (0, 1, 0)
+        for i in range(length - 1, -1, -1):
+            s = self.double(s)
+            for naf, table in zip(nafs, tables):
+                if i < len(naf) and naf[i]:
+                    d = naf[i]
+                    if d > 0:
+                        s = self.add_mixed(s, table[d >> 1])
+                    else:
+                        s = self.add_mixed(s, self.negate(table[(-d) >> 1]))
+        return self.add(r, s)
+
+    def mul_double_and_add(self, ps):
+        """Compute a (multi) point multiplication with plain double-and-add over 256-bit scalars.
+
+        This was mul() before it used precomputed tables. It is kept as the
+        reference implementation to cross-check mul() against (see bench_key.py)."""
+        r = (0, 1, 0)
         for i in range(255, -1, -1):
             r = self.double(r)
             for (p, n) in ps:
@@ -219,6 +368,26 @@ SECP256K1 = EllipticCurve(2**256 - 2**32 - 977, 0, 7)
 SECP256K1_G = (0x79BE667EF9DCBBAC55A06295CE870B07029BFCDB2DCE28D959F2815B16F81798, 0x483ADA7726A3C4655DA4FBFC0E1108A8FD17B448A68554199C47D08FFB10D4B8, 1)
 SECP256K1_ORDER = 0xFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFEBAAEDCE6AF48A03BBFD25E8CD0364141
 SECP256K1_ORDER_HALF = SECP256K1_ORDER // 2
+SECP256K1.add_fixed_base(SECP256K1_G)
+
+# Below this many signatures or verifications, starting worker processes costs more than it saves
+MIN_POOL_JOBS = 32
+
+def rfc6979_nonces(secret, msg):
+    """Yield the RFC6979 (HMAC-SHA256) nonce candidates for a secret key and a 32-byte message.
+
+    This matches libsecp256k1's nonce_function_rfc6979 without extra entropy,
+    which is what the node's wallet signs with."""
+    data = secret.to_bytes(32, 'big') + msg
+    k = hmac.new(b'\x00' * 32, b'\x01' * 32 + b'\x00' + data, 'sha256').digest()
+    v = hmac.new(k, b'\x01' * 32, 'sha256').digest()
+    k = hmac.new(k, v + b'\x01' + data, 'sha256').digest()
+    v = hmac.new(k, v, 'sha256').digest()
+    while True:
+        v = hmac.new(k, v, 'sha256').digest()
+        yield int.from_bytes(v, 'big')
+        k = hmac.new(k, v + b'\x00', 'sha256').digest()
+        v = hmac.new(k, v, 'sha256').digest()
 
 class ECPubKey():
     """A secp256k1 public key"""
@@ -367,18 +536,30 @@ class ECKey():
         ret.compressed = self.compressed
         return ret
 
-    def sign_ecdsa(self, msg, low_s=True):
+    def sign_ecdsa(self, msg, low_s=True, rfc6979=False):
         """Construct a DER-encoded ECDSA signature with this key.
 
+        With rfc6979=True the nonce is derived deterministically, so the
+        signature is the one the node's wallet would produce.
+
         See https://en.wikipedia.org/wiki/Elliptic_Curve_Digital_Signature_Algorithm for the
         ECDSA signer algorithm."""
         assert(self.valid)
         z = int.from_bytes(msg, 'big')
-        # Note: no RFC6979, but a simple random nonce (some tests rely on distinct transactions for the same operation)
-        k = random.randrange(1, SECP256K1_ORDER)
-        R = SECP256K1.affine(SECP256K1.mul([(SECP256K1_G, k)]))
-        r = R[0] % SECP256K1_ORDER
-        s = (modinv(k, SECP256K1_ORDER) * (z + self.secret * r)) % SECP256K1_ORDER
+        if rfc6979:
+            for k in rfc6979_nonces(self.secret, msg):
+                if not 0 < k < SECP256K1_ORDER:
+                    continue
+                r = SECP256K1.affine(SECP256K1.mul([(SECP256K1_G, k)]))[0] % SECP256K1_ORDER
+                s = (modinv(k, SECP256K1_ORDER) * (z + self.secret * r)) % SECP256K1_ORDER
+                if r != 0 and s != 0:
+                    break
+        else:
+            # Note: a simple random nonce by default (some tests rely on distinct transactions for the same operation)
+            k = random.randrange(1, SECP256K1_ORDER)
+            R = SECP256K1.affine(SECP256K1.mul([(SECP256K1_G, k)]))
+            r = R[0] % SECP256K1_ORDER
+            s = (modinv(k, SECP256K1_ORDER) * (z + self.secret * r)) % SECP256K1_ORDER
         if low_s and s > SECP256K1_ORDER_HALF:
             s = SECP256K1_ORDER - s
         # Represent in DER format. The byte representations of r and s have
@@ -387,3 +568,36 @@ class ECKey():
         rb = r.to_bytes((r.bit_length() + 8) // 8, 'big')
         sb = s.to_bytes((s.bit_length() + 8) // 8, 'big')
         return b'\x30' + bytes([4 + len(rb) + len(sb), 2, len(rb)]) + rb + bytes([2, len(sb)]) + sb
+
+def _sign_job(job):
+    key, msg, low_s = job
+    return key.sign_ecdsa(msg, low_s=low_s, rfc6979=True)
+
+def _verify_job(job):
+    pubkey, sig, msg, low_s = job
+    return pubkey.verify_ecdsa(sig, msg, low_s=low_s)
+
+def map_jobs(func, jobs, processes=None):
+    """Return [func(job) for job in jobs], computed in a pool of processes (default: one per CPU) if there is enough work.
+
+    func must be a module-level function, and jobs and results picklable."""
+    processes = processes or os.cpu_count() or 1
+    if processes == 1 or len(jobs) < MIN_POOL_JOBS:
+        return [func(job) for job in jobs]
+    # Build the generator table before the workers start, so that forked workers share it
+    SECP256K1.fixed_base_table(SECP256K1_G)
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        return list(executor.map(func, jobs, chunksize=max(1, len(jobs) // (4 * processes))))
+
+def sign_many(jobs, low_s=True, processes=None):
+    """Sign many (ECKey, 32-byte message) pairs, in a pool of processes (default: one per CPU).
+
+    Nonces are derived with RFC6979, so the signatures only depend on the
+    keys and messages. Returns the DER-encoded signatures in the order of jobs."""
+    return map_jobs(_sign_job, [(key, msg, low_s) for (key, msg) in jobs], processes)
+
+def verify_many(jobs, low_s=True, processes=None):
+    """Verify many (ECPubKey, DER signature, 32-byte message) triples, in a pool of processes (default: one per CPU).
+
+    Returns a list of booleans in the order of jobs."""
+    return map_jobs(_verify_job, [(pubkey, sig, msg, low_s) for (pubkey, sig, msg) in jobs], processes)
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# Copyright (c) 2017-2020 The Raven Core developers
+# Distributed under the MIT software license, see the accompanying
+# file COPYING or http://www.opensource.org/licenses/mit-license.php.
+
+"""Incremental reader for a node's debug.log.
+
+A LogWatcher remembers the byte offset it has read up to, so every check
+only reads what the node appended since the last one, however large the
+log has grown. Complete lines are parsed into LogEvents carrying the time
+the node logged them. Lines are handed out in order and each one at most
+once: a wait consumes the lines up to its last match and leaves the rest
+for the next wait.
+"""
+
+from collections import deque, namedtuple
+import calendar
+import os
+import re
+import time
+
+# Start of a log line: date and time (UTC), microseconds with -logtimemicros and the mocktime if set
+LOG_TIMESTAMP = re.compile(r"^(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d)(\.\d{6})?(?: \(mocktime: [^)]*\))? ")
+
+# Bounds of the backoff between checks for new data, in seconds
+POLL_MIN = 0.005
+POLL_MAX = 0.05
+
+# Number of lines seen during a wait that are shown when it times out
+ERROR_CONTEXT_LINES = 100
+
+# time is in seconds since the epoch, or None for lines without a timestamp
+# (continuation lines of multi-line messages); message excludes the timestamp.
+LogEvent = namedtuple("LogEvent", "time message")
+
+
+def parse_line(line):
+    """Split a debug.log line into a LogEvent."""
+    match = LOG_TIMESTAMP.match(line)
+    if match is None:
+        return LogEvent(None, line)
+    timestamp = calendar.timegm(time.strptime(match.group(1), "%Y-%m-%d %H:%M:%S"))
+    if match.group(2):
+        timestamp += int(match.group(2)[1:]) / 1e6
+    return LogEvent(timestamp, line[match.end():])
+
+
+class LogWatcher:
+    def __init__(self, path, offset=0):
+        self.path = path
+        self.offset = offset
+        # Unterminated last line read, and complete lines not handed out yet
+        self.tail = b""
+        self.pending = deque()
+
+    def mark(self):
+        """Skip everything logged so far."""
+        try:
+            self.offset = os.path.getsize(self.path)
+        except OSError:
+            self.offset = 0
+        self.tail = b""
+        self.pending.clear()
+
+    def _read_new(self):
+        """Parse what was appended since the last read into pending. Returns whether there was new data."""
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            return False
+        if size < self.offset:
+            # The node shrank the log on startup (-shrinkdebugfile)
+            self.offset = 0
+            self.tail = b""
+        if size == self.offset:
+            return False
+        with open(self.path, 'rb') as f:
+            f.seek(self.offset)
+            data = f.read()
+        self.offset += len(data)
+        lines = (self.tail + data).split(b"\n")
+        self.tail = lines.pop()
+        self.pending.extend(parse_line(line.decode('utf-8', 'replace')) for line in lines if line)
+        return True
+
+    def read(self):
+        """Return the events logged since the last call."""
+        self._read_new()
+        events = list(self.pending)
+        self.pending.clear()
+        return events
+
+    def wait_for(self, patterns, timeout=60):
+        """Wait until each of the regular expressions in patterns matched a new event.
+
+        Returns the matching events, in the order of patterns. Raises
+        AssertionError with the events seen if the timeout expires first."""
+        regexes = [re.compile(pattern) for pattern in patterns]
+        matches = [None] * len(regexes)
+        seen = deque(maxlen=ERROR_CONTEXT_LINES)
+        deadline = time.time() + timeout
+        delay = POLL_MIN
+        while True:
+            while self.pending:
+                event = self.pending.popleft()
+                seen.append(event)
+                for i, regex in enumerate(regexes):
+                    if matches[i] is None and regex.search(event.message):
+                        matches[i] = event
+                if all(match is not None for match in matches):
+                    return matches
+            if time.time() >= deadline:
+                break
+            if self._read_new():
+                delay = POLL_MIN
+            else:
+                time.sleep(delay)
+                delay = min(delay * 2, POLL_MAX)
+        missing = [pattern for pattern, match in zip(patterns, matches) if match is None]
+        raise AssertionError("Patterns %s not found in %s within %s s. Last lines:\n%s" % (
+            missing, self.path, timeout, "\n".join(" - " + event.message for event in seen)))
+
+    def wait_for_log(self, pattern, timeout=60):
+        """Wait for an event matching the regular expression pattern and return it."""
+        return self.wait_for([pattern], timeout)[0]
@@ -26,7 +26,8 @@ import logging
 import sys
 from threading import RLock, Thread
 from test_framework.messages import *
-from test_framework.util import wait_until
+from test_framework import tracing
+from test_framework.util import p2p_ports, wait_until
 
 logger = logging.getLogger("TestFramework.mininode")
 
@@ -283,6 +284,8 @@ class NodeConn(asyncore.dispatcher):
         asyncore.dispatcher.__init__(self, map=mininode_socket_map)
         self.dstaddr = dstaddr
         self.dstport = dstport
+        # Name of the node in --trace timelines
+        self.trace_label = next(("node%d" % i for i, port in p2p_ports.items() if port == dstport), "%s:%d" % (dstaddr, dstport))
         self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
         self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
         self.sendbuf = b""
@@ -451,6 +454,7 @@ class NodeConn(asyncore.dispatcher):
         if len(log_message) > 500:
             log_message += "... (msg truncated)"
         logger.debug(log_message)
+        tracing.instant(self.trace_label, "p2p", "%s %s" % (direction, msg.command.decode('ascii', 'replace')))
 
     def disconnect_node(self):
         self.disconnect = True
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# Copyright (c) 2017-2020 The Raven Core developers
+# Distributed under the MIT software license, see the accompanying
+# file COPYING or http://www.opensource.org/licenses/mit-license.php.
+
+"""Warm pool of evrmored processes shared by the tests of a test_runner run.
+
+With test_runner.py --nodepool=N the runner starts N nodes on clones of the
+cached 200-block chain, with the standard test node arguments, and writes
+their datadirs and ports to pool.json in the pool directory. A test that
+sets self.poolable leases nodes by taking an flock on their lock files. It
+resets them to the cached chain and attaches to them instead of starting
+its own. At the end of the test the nodes are left running for the next
+one. The kernel drops the lease if a test dies, and every lease starts with
+a reset, so a crashed test does not leak state into the next one.
+
+The reset only covers the chain and the network:
+- all peers are disconnected and added nodes removed
+- bans and mocktime are cleared
+- blocks above the cached tip are invalidated
+- the mempool is cleared
+A node that cannot be reset (e.g. one that reorged below the cached tip) is
+skipped. So only tests that start from the cached chain with default
+arguments may set poolable, and only if they don't restart nodes, send
+wallet transactions, or look at chain tips, uptime or logging settings.
+"""
+
+from collections import namedtuple
+import fcntl
+import json
+import os
+import time
+
+from . import util
+from .chaincache import clone_tree
+from .test_node import TestNode
+from .util import MAX_NODES, initialize_data_dir, map_nodes, wait_until
+
+POOL_FILE = "pool.json"
+SAVINGS_FILE_PREFIX = "saved."
+
+PoolSavings = namedtuple("PoolSavings", "tests startup_time shutdown_time reset_time saved_time")
+
+
+def reset_node(node, base_hash, base_height):
+    """Bring a pooled node back to the cached chain. Returns False if that is not possible."""
+    node.setnetworkactive(False)
+    wait_until(lambda: node.getconnectioncount() == 0, err_msg="Pooled node disconnected", timeout=10)
+    for added in node.getaddednodeinfo():
+        node.addnode(added["addednode"], "remove")
+    node.setnetworkactive(True)
+    node.clearbanned()
+    node.setmocktime(0)
+    if node.getbestblockhash() != base_hash:
+        if node.getblockcount() <= base_height or node.getblockhash(base_height) != base_hash:
+            return False
+        node.invalidateblock(node.getblockhash(base_height + 1))
+    node.clearmempool()
+    return node.getbestblockhash() == base_hash
+
+
+class NodeLease:
+    """Pool nodes leased by one test process."""
+
+    def __init__(self, pool, state):
+        self.pool = pool
+        self.state = state
+        self.nodes = []
+        self.locks = []
+        self.reset_time = 0.0
+
+    def try_add(self, pool_index, rpc_stats=None, coverage_dir=None):
+        """Lock, attach and reset pool node pool_index. Returns False if it is busy or can't be reset."""
+        fd = os.open(os.path.join(self.pool.pool_dir, "node%d.lock" % pool_index), os.O_CREAT | os.O_RDWR)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        entry = self.state["nodes"][pool_index]
+        i = len(self.nodes)
+        util.p2p_ports[i] = entry["p2p_port"]
+        util.rpc_ports[i] = entry["rpc_port"]
+        node = TestNode(i, None, extra_args=[], rpchost=None, timewait=None, binary=None, stderr=None, mocktime=0,
+                        coverage_dir=coverage_dir, rpc_stats=rpc_stats, datadir=entry["datadir"])
+        start_time = time.time()
+        try:
+            node.attach()
+            healthy = reset_node(node, self.state["base_hash"], self.state["base_height"])
+        except Exception:
+            healthy = False
+        self.reset_time += time.time() - start_time
+        if not healthy:
+            del util.p2p_ports[i]
+            del util.rpc_ports[i]
+            os.close(fd)
+            return False
+        self.nodes.append(node)
+        self.locks.append(fd)
+        return True
+
+    def release(self, test_name):
+        """Hand the nodes back to the pool and record the time they saved."""
+        for node in self.nodes:
+            node.rpc_connected = False
+            node.rpc = None
+        filename = os.path.join(self.pool.pool_dir, "%s%d.json" % (SAVINGS_FILE_PREFIX, os.getpid()))
+        with open(filename, 'w', encoding='utf8') as f:
+            json.dump({'test': test_name, 'nodes': len(self.nodes), 'reset_time': self.reset_time}, f)
+        for fd in self.locks:
+            os.close(fd)
+        self.nodes = []
+        self.locks = []
+
+
+class NodePool:
+    def __init__(self, pool_dir):
+        self.pool_dir = pool_dir
+        self.nodes = []
+        self.startup_time = 0.0
+
+    # Used by test_runner
+
+    def start(self, cache_dir, size):
+        """Start size nodes on clones of the cached chain in cache_dir."""
+        os.makedirs(self.pool_dir, exist_ok=True)
+        for i in range(size):
+            clone_tree(os.path.join(cache_dir, "node%d" % (i % MAX_NODES)), os.path.join(self.pool_dir, "node%d" % i))
+            initialize_data_dir(self.pool_dir, i)
+            self.nodes.append(TestNode(i, self.pool_dir, extra_args=[], rpchost=None, timewait=None, binary=None,
+                                       stderr=None, mocktime=0, coverage_dir=None))
+        start_time = time.time()
+        for node in self.nodes:
+            node.start()
+        map_nodes(lambda node: node.wait_for_rpc_connection(), self.nodes)
+        self.startup_time = time.time() - start_time
+        state = {
+            'base_hash': self.nodes[0].getbestblockhash(),
+            'base_height': self.nodes[0].getblockcount(),
+            'startup_time': self.startup_time,
+            'nodes': [{'datadir': node.datadir, 'p2p_port': util.p2p_port(i), 'rpc_port': util.rpc_port(i)}
+                      for i, node in enumerate(self.nodes)],
+        }
+        with open(os.path.join(self.pool_dir, POOL_FILE + ".new"), 'w', encoding='utf8') as f:
+            json.dump(state, f, indent=1)
+        os.replace(os.path.join(self.pool_dir, POOL_FILE + ".new"), os.path.join(self.pool_dir, POOL_FILE))
+
+    def stop(self):
+        """Stop all pool nodes. Returns the PoolSavings of the run.
+
+        A test is assumed to have saved one concurrent startup and shutdown of
+        its nodes, minus the time it spent resetting them."""
+        start_time = time.time()
+        map_nodes(lambda node: node.stop_node(), self.nodes)
+        map_nodes(lambda node: node.wait_until_stopped(), self.nodes)
+        shutdown_time = time.time() - start_time
+        util.release_ports()
+        tests = 0
+        reset_time = 0.0
+        for filename in os.listdir(self.pool_dir):
+            if filename.startswith(SAVINGS_FILE_PREFIX):
+                with open(os.path.join(self.pool_dir, filename), 'r', encoding='utf8') as f:
+                    reset_time += json.load(f)['reset_time']
+                tests += 1
+        saved_time = tests * (self.startup_time + shutdown_time) - reset_time - (self.startup_time + shutdown_time)
+        return PoolSavings(tests, self.startup_time, shutdown_time, reset_time, saved_time)
+
+    # Used by tests
+
+    def lease(self, num_nodes, rpc_stats=None, coverage_dir=None):
+        """Lease num_nodes idle pool nodes and reset them. Returns a NodeLease, or None if not enough are available."""
+        try:
+            with open(os.path.join(self.pool_dir, POOL_FILE), 'r', encoding='utf8') as f:
+                state = json.load(f)
+        except OSError:
+            return None
+        lease = NodeLease(self, state)
+        for pool_index in range(len(state["nodes"])):
+            if len(lease.nodes) == num_nodes:
+                break
+            lease.try_add(pool_index, rpc_stats, coverage_dir)
+        if len(lease.nodes) < num_nodes:
+            for i in range(len(lease.nodes)):
+                del util.p2p_ports[i]
+                del util.rpc_ports[i]
+            for fd in lease.locks:
+                os.close(fd)
+            return None
+        return lease
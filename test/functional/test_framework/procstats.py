@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# Copyright (c) 2017-2020 The Raven Core developers
+# Distributed under the MIT software license, see the accompanying
+# file COPYING or http://www.opensource.org/licenses/mit-license.php.
+
+"""
+Resource usage of the evrmored processes started by a test, read from /proc.
+
+test_runner samples the process tree of every running test, with one scan
+of /proc for all of them (scan_processes()). For each evrmored process it
+keeps the last values it read: peak RSS (VmHWM), user and system CPU time,
+bytes written to storage (write_bytes in /proc/<pid>/io) and the number of
+open file descriptors. A node that exits
+between two samples loses what it did after the last one, so the runner
+samples often (RESOURCE_SAMPLE_INTERVAL).
+
+Only Linux is supported. Elsewhere no usage is recorded.
+"""
+
+import json
+import os
+import xml.etree.ElementTree as ET
+
+SUPPORTED = os.path.isdir('/proc/self')
+
+# Seconds between samples of a test's process tree
+RESOURCE_SAMPLE_INTERVAL = 0.1
+
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+
+# Columns of the results table: (key, header, format, scale)
+COLUMNS = [
+    ('rss_peak', 'RSS(MB)', '%7.1f', 1 / (1 << 20)),
+    ('cpu_user', 'USER(s)', '%7.1f', 1),
+    ('cpu_sys', 'SYS(s)', '%6.1f', 1),
+    ('write_bytes', 'WRITE(MB)', '%9.1f', 1 / (1 << 20)),
+    ('fds_peak', 'FDS', '%4d', 1),
+]
+
+
+def _read(path):
+    with open(path, 'rb') as f:
+        return f.read().decode('utf8', 'replace')
+
+
+def _stat(pid):
+    """Return (comm, ppid, utime, stime) of a process from /proc/<pid>/stat."""
+    stat = _read('/proc/%d/stat' % pid)
+    # comm is in parentheses and may contain spaces
+    comm = stat[stat.index('(') + 1:stat.rindex(')')]
+    fields = stat[stat.rindex(')') + 2:].split()
+    return comm, int(fields[1]), int(fields[11]) / CLOCK_TICKS, int(fields[12]) / CLOCK_TICKS
+
+
+def scan_processes():
+    """Read /proc once. Returns (children, comms): the child pids of each pid, and the comm of each pid."""
+    parents = {}
+    comms = {}
+    for name in os.listdir('/proc'):
+        if not name.isdigit():
+            continue
+        try:
+            comm, ppid, _, _ = _stat(int(name))
+        except (OSError, ValueError):
+            continue
+        parents[int(name)] = ppid
+        comms[int(name)] = comm
+    children = {}
+    for pid, ppid in parents.items():
+        children.setdefault(ppid, []).append(pid)
+    return children, comms
+
+
+def process_tree(root_pid, processes=None):
+    """Return the pids of all descendants of root_pid, with their comm.
+
+    processes is a result of scan_processes() to reuse, so that the trees of
+    several tests are found with one scan of /proc."""
+    children, comms = processes if processes is not None else scan_processes()
+    tree = {}
+    pending = list(children.get(root_pid, []))
+    while pending:
+        pid = pending.pop()
+        tree[pid] = comms[pid]
+        pending.extend(children.get(pid, []))
+    return tree
+
+
+def read_process(pid):
+    """Return the resource usage of a process, or None if it is gone."""
+    try:
+        _, _, utime, stime = _stat(pid)
+        usage = {'cpu_user': utime, 'cpu_sys': stime, 'rss_peak': 0, 'write_bytes': 0}
+        for line in _read('/proc/%d/status' % pid).splitlines():
+            if line.startswith('VmHWM:'):
+                usage['rss_peak'] = int(line.split()[1]) * 1024
+        try:
+            for line in _read('/proc/%d/io' % pid).splitlines():
+                if line.startswith('write_bytes:'):
+                    usage['write_bytes'] = int(line.split()[1])
+        except PermissionError:
+            pass
+        usage['fds'] = len(os.listdir('/proc/%d/fd' % pid))
+    except (OSError, ValueError):
+        return None
+    return usage
+
+
+class ResourceMonitor:
+    """Usage of the processes named comm in the process tree of one test."""
+
+    def __init__(self, root_pid, comm='evrmored'):
+        self.root_pid = root_pid
+        self.comm = comm
+        # Last usage read per pid, and the peak number of fds
+        self.processes = {}
+        self.fds_peak = 0
+
+    def sample(self, processes=None):
+        """Read the usage of the processes, looking them up in processes (see process_tree()) if given."""
+        for pid, comm in process_tree(self.root_pid, processes).items():
+            if comm != self.comm:
+                continue
+            usage = read_process(pid)
+            if usage is not None:
+                self.processes[pid] = usage
+                self.fds_peak = max(self.fds_peak, usage['fds'])
+
+    def totals(self):
+        """Return the usage of all processes seen: the largest peak RSS, and total CPU time and bytes written."""
+        return {
+            'processes': len(self.processes),
+            'rss_peak': max([usage['rss_peak'] for usage in self.processes.values()], default=0),
+            'cpu_user': sum(usage['cpu_user'] for usage in self.processes.values()),
+            'cpu_sys': sum(usage['cpu_sys'] for usage in self.processes.values()),
+            'write_bytes': sum(usage['write_bytes'] for usage in self.processes.values()),
+            'fds_peak': self.fds_peak,
+        }
+
+
+def format_header():
+    return " | ".join(header for _, header, _, _ in COLUMNS)
+
+
+def format_usage(usage):
+    if usage is None:
+        return " | ".join(" " * len(header) for _, header, _, _ in COLUMNS)
+    return " | ".join((fmt % (usage[key] * scale)).rjust(len(header)) for key, header, fmt, scale in COLUMNS)
+
+
+def write_report(filename, test_results):
+    """Write test results and their resource usage to filename, as JUnit XML if it ends in .xml and as JSON otherwise.
+
+    test_results are (name, status, duration, usage) tuples."""
+    if filename.endswith('.xml'):
+        suite = ET.Element('testsuite', name='functional', tests=str(len(test_results)),
+                           failures=str(sum(1 for result in test_results if result[1] == 'Failed')),
+                           skipped=str(sum(1 for result in test_results if result[1] == 'Skipped')))
+        for name, status, duration, usage in test_results:
+            case = ET.SubElement(suite, 'testcase', classname='functional', name=name, time=str(duration))
+            if status == 'Failed':
+                ET.SubElement(case, 'failure')
+            elif status == 'Skipped':
+                ET.SubElement(case, 'skipped')
+            if usage is not None:
+                properties = ET.SubElement(case, 'properties')
+                for key, value in sorted(usage.items()):
+                    ET.SubElement(properties, 'property', name=key, value=str(value))
+        ET.ElementTree(suite).write(filename, encoding='utf-8', xml_declaration=True)
+    else:
+        with open(filename, 'w', encoding='utf8') as f:
+            json.dump([{'name': name, 'status': status, 'time': duration, 'resources': usage}
+                       for name, status, duration, usage in test_results], f, indent=1)
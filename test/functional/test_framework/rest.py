@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+# Copyright (c) 2017-2020 The Raven Core developers
+# Distributed under the MIT software license, see the accompanying
+# file COPYING or http://www.opensource.org/licenses/mit-license.php.
+
+"""Client for evrmored's binary REST interface (-rest).
+
+RESTClient keeps a single HTTP/1.1 connection open to the node and can
+pipeline many GET requests on it, which makes it much cheaper than RPC for
+pulling whole chains: blocks and headers arrive as raw serialized bytes and are
+deserialized straight into CBlock/CBlockHeader objects without any hex, JSON
+or Decimal round trips.
+
+Note that CBlockHeader only understands the pre-KAWPOW 80-byte header layout
+used on regtest, and that it cannot compute Evrmore block hashes, so header
+hashes are taken from the chain linkage (each header's hashPrevBlock) instead.
+"""
+
+from io import BytesIO
+import json
+import socket
+import struct
+import urllib.parse
+
+from .messages import CBlock, CBlockHeader, COutPoint, CTxOut, deser_compact_size, deser_uint256, deser_vector, ser_vector
+
+HTTP_TIMEOUT = 30
+# Largest number of headers the node returns in one /rest/headers/ request
+MAX_REST_HEADERS = 2000
+# Largest number of outpoints the node accepts in one /rest/getutxos/ request
+MAX_GETUTXOS_OUTPOINTS = 15
+# Number of requests to keep in flight on the connection when pipelining
+PIPELINE_DEPTH = 16
+
+
+class RESTError(Exception):
+    def __init__(self, status, reason, body=b''):
+        super().__init__("REST request failed with %d %s: %s" % (status, reason, body.decode('utf-8', 'replace').strip()))
+        self.status = status
+        self.body = body
+
+
+class RESTUtxo:
+    """An unspent output returned by /rest/getutxos/."""
+    __slots__ = ("height", "txout")
+
+    def __init__(self, height=0, txout=None):
+        self.height = height
+        self.txout = CTxOut() if txout is None else txout
+
+    def deserialize(self, f):
+        struct.unpack("<I", f.read(4))  # nTxVerDummy
+        self.height = struct.unpack("<I", f.read(4))[0]
+        self.txout.deserialize(f)
+
+    def __repr__(self):
+        return "RESTUtxo(height=%i txout=%s)" % (self.height, repr(self.txout))
+
+
+class RESTClient:
+    """A keep-alive, pipelining HTTP/1.1 client for the REST interface of one node."""
+
+    def __init__(self, host, port, timeout=HTTP_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.sock = None
+        self.reader = None
+
+    @classmethod
+    def from_node(cls, node, timeout=HTTP_TIMEOUT):
+        """Create a client for a TestNode, using the host and port of its RPC url."""
+        url = urllib.parse.urlparse(node.url)
+        return cls(url.hostname, url.port, timeout)
+
+    def close(self):
+        if self.sock is not None:
+            self.reader.close()
+            self.sock.close()
+        self.sock = None
+        self.reader = None
+
+    def _connect(self):
+        if self.sock is None:
+            self.sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.reader = self.sock.makefile('rb')
+
+    def _send(self, method, path, body=b''):
+        request = "%s %s HTTP/1.1\r\nHost: %s\r\nConnection: keep-alive\r\nContent-Length: %d\r\n\r\n" % (method, path, self.host, len(body))
+        self.sock.sendall(request.encode('ascii') + body)
+
+    def _read_response(self):
+        """Read one response from the connection. Returns (status, reason, body)."""
+        status_line = self.reader.readline()
+        if not status_line:
+            raise ConnectionResetError("REST connection closed by node")
+        _, status, reason = status_line.decode('ascii').rstrip('\r\n').split(' ', 2)
+        headers = {}
+        while True:
+            line = self.reader.readline().decode('ascii').rstrip('\r\n')
+            if not line:
+                break
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int(self.reader.readline().split(b';', 1)[0], 16)
+                if size == 0:
+                    self.reader.readline()
+                    break
+                chunks.append(self.reader.read(size))
+                self.reader.readline()
+            body = b''.join(chunks)
+        else:
+            body = self.reader.read(int(headers.get('content-length', 0)))
+        if headers.get('connection', '').lower() == 'close':
+            self.close()
+        return int(status), reason, body
+
+    def request(self, method, path, body=b''):
+        """Send a single request and return the response body. Reconnects once if the kept-alive connection went away."""
+        for attempt in range(2):
+            self._connect()
+            try:
+                self._send(method, path, body)
+                status, reason, response = self._read_response()
+                break
+            except (BrokenPipeError, ConnectionResetError):
+                self.close()
+                if attempt:
+                    raise
+        if status != 200:
+            raise RESTError(status, reason, response)
+        return response
+
+    def get(self, path):
+        return self.request('GET', path)
+
+    def get_many(self, paths, depth=PIPELINE_DEPTH):
+        """Pipeline GET requests for all paths, keeping up to depth requests in flight.
+
+        Yields the response bodies in request order."""
+        paths = list(paths)
+        self._connect()
+        sent = received = 0
+        try:
+            while received < len(paths):
+                while sent < len(paths) and sent - received < depth:
+                    self._send('GET', paths[sent])
+                    sent += 1
+                status, reason, body = self._read_response()
+                received += 1
+                if status != 200:
+                    raise RESTError(status, reason, body)
+                yield body
+        finally:
+            if received < sent:
+                # Responses still in flight would be read as answers to later requests
+                self.close()
+
+    # Typed accessors
+
+    def get_block(self, blockhash):
+        """Return the block with the given hash as a CBlock."""
+        block = CBlock()
+        block.deserialize(BytesIO(self.get('/rest/block/%s.bin' % blockhash)))
+        return block
+
+    def get_blocks(self, blockhashes, depth=PIPELINE_DEPTH):
+        """Yield the blocks with the given hashes as CBlocks, fetched over a pipelined connection."""
+        for body in self.get_many(('/rest/block/%s.bin' % h for h in blockhashes), depth):
+            block = CBlock()
+            block.deserialize(BytesIO(body))
+            yield block
+
+    def get_headers(self, count, blockhash):
+        """Return up to count headers starting at (and including) blockhash as CBlockHeaders."""
+        body = self.get('/rest/headers/%d/%s.bin' % (count, blockhash))
+        f = BytesIO(body)
+        headers = []
+        while f.tell() < len(body):
+            header = CBlockHeader()
+            header.deserialize(f)
+            headers.append(header)
+        return headers
+
+    def get_chaininfo(self):
+        return json.loads(self.get('/rest/chaininfo.json').decode('utf-8'))
+
+    def get_utxos(self, outpoints, check_mempool=False):
+        """Query /rest/getutxos/ for a list of COutPoints.
+
+        Returns (chain height, chain tip hash, list with a RESTUtxo or None per outpoint)."""
+        result = []
+        height = tip = None
+        for i in range(0, len(outpoints), MAX_GETUTXOS_OUTPOINTS):
+            batch = outpoints[i:i + MAX_GETUTXOS_OUTPOINTS]
+            request = struct.pack("<?", check_mempool) + ser_vector(batch)
+            f = BytesIO(self.request('POST', '/rest/getutxos.bin', request))
+            height = struct.unpack("<i", f.read(4))[0]
+            tip = "%064x" % deser_uint256(f)
+            bitmap = f.read(deser_compact_size(f))
+            utxos = iter(deser_vector(f, RESTUtxo))
+            for n in range(len(batch)):
+                result.append(next(utxos) if bitmap[n // 8] & (1 << (n % 8)) else None)
+        return height, tip, result
+
+    # Whole-chain scans
+
+    def walk_headers(self, start_hash, page_size=MAX_REST_HEADERS):
+        """Yield every header of the active chain from start_hash up to the tip.
+
+        Headers are fetched in pages of page_size. Each yielded header has its
+        hash and sha256 fields set from the chain linkage."""
+        assert 3 <= page_size <= MAX_REST_HEADERS
+        cursor = start_hash
+        skip = 0
+        prev = None
+        yielded = 0
+        while True:
+            page = self.get_headers(page_size, cursor)
+            for header in page[skip:]:
+                if prev is not None:
+                    _set_hash(prev, header.hashPrevBlock)
+                    yield prev
+                    yielded += 1
+                prev = header
+            if len(page) < page_size:
+                break
+            # The hash of the last header is only known once its successor is
+            # seen, so continue from the one before it (whose hash is known).
+            cursor = "%064x" % page[-1].hashPrevBlock
+            skip = 2
+        if prev is None:
+            return
+        if not yielded:
+            _set_hash(prev, int(start_hash, 16))
+        else:
+            # The tip has no successor: ask for it together with its parent in json form.
+            tip = json.loads(self.get('/rest/headers/2/%064x.json' % prev.hashPrevBlock).decode('utf-8'))
+            _set_hash(prev, int(tip[-1]['hash'], 16))
+        yield prev
+
+    def scan_blocks(self, start_hash, depth=PIPELINE_DEPTH):
+        """Yield every block of the active chain from start_hash up to the tip, in order."""
+        hashes = (header.hash for header in self.walk_headers(start_hash))
+        window = []
+        for blockhash in hashes:
+            window.append(blockhash)
+            if len(window) == MAX_REST_HEADERS:
+                yield from self._blocks_with_hash(window, depth)
+                window = []
+        yield from self._blocks_with_hash(window, depth)
+
+    def _blocks_with_hash(self, blockhashes, depth):
+        for blockhash, block in zip(blockhashes, self.get_blocks(blockhashes, depth)):
+            _set_hash(block, int(blockhash, 16))
+            yield block
+
+
+def _set_hash(header, sha256):
+    header.sha256 = sha256
+    header.hash = "%064x" % sha256
+
+
+def outpoint(txid, n):
+    """Build a COutPoint from a hex txid, for use with RESTClient.get_utxos()."""
+    return COutPoint(int(txid, 16), n)
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# Copyright (c) 2017-2020 The Raven Core developers
+# Distributed under the MIT software license, see the accompanying
+# file COPYING or http://www.opensource.org/licenses/mit-license.php.
+
+"""
+Utilities for measuring RPC call latency and payload sizes.
+
+Each test process records every RPC call made through AuthServiceProxy into
+an RPCStats object, keyed by node and method. Latencies are kept in a
+log-scale histogram so that per-test dumps can be merged by test_runner into
+a suite-wide report without keeping every sample around.
+"""
+
+from collections import defaultdict
+import json
+import math
+import os
+import threading
+
+# Histogram resolution. With 8 buckets per power of two, a bucket's upper
+# bound is at most ~9% above any latency that falls into it.
+BUCKETS_PER_OCTAVE = 8
+
+STATS_FILE_PREFIX = 'rpcstats.'
+
+
+def latency_bucket(elapsed):
+    """Return the histogram bucket for a latency given in seconds."""
+    micros = max(elapsed * 1e6, 1.0)
+    return int(math.log2(micros) * BUCKETS_PER_OCTAVE)
+
+
+def bucket_upper_bound(bucket):
+    """Return the upper bound (in seconds) of a histogram bucket."""
+    return 2 ** ((bucket + 1) / BUCKETS_PER_OCTAVE) / 1e6
+
+
+class MethodStats:
+    """Call accounting for a single RPC method on a single node."""
+
+    def __init__(self):
+        self.count = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.histogram = defaultdict(int)
+
+    def record(self, elapsed, request_bytes, response_bytes):
+        self.count += 1
+        self.total_time += elapsed
+        self.max_time = max(self.max_time, elapsed)
+        self.request_bytes += request_bytes
+        self.response_bytes += response_bytes
+        self.histogram[latency_bucket(elapsed)] += 1
+
+    def merge(self, other):
+        self.count += other.count
+        self.total_time += other.total_time
+        self.max_time = max(self.max_time, other.max_time)
+        self.request_bytes += other.request_bytes
+        self.response_bytes += other.response_bytes
+        for bucket, n in other.histogram.items():
+            self.histogram[bucket] += n
+
+    def percentile(self, pct):
+        """Return the latency (in seconds) below which pct percent of the calls fall."""
+        if not self.count:
+            return 0.0
+        rank = math.ceil(pct / 100 * self.count)
+        seen = 0
+        for bucket in sorted(self.histogram):
+            seen += self.histogram[bucket]
+            if seen >= rank:
+                return min(bucket_upper_bound(bucket), self.max_time)
+        return self.max_time
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'total_time': self.total_time,
+            'max_time': self.max_time,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+            'request_bytes': self.request_bytes,
+            'response_bytes': self.response_bytes,
+            'histogram': {str(bucket): n for bucket, n in sorted(self.histogram.items())},
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        stats = cls()
+        stats.count = d['count']
+        stats.total_time = d['total_time']
+        stats.max_time = d['max_time']
+        stats.request_bytes = d['request_bytes']
+        stats.response_bytes = d['response_bytes']
+        for bucket, n in d['histogram'].items():
+            stats.histogram[int(bucket)] = n
+        return stats
+
+
+class RPCStats:
+    """Per-node, per-method RPC call accounting for one test process."""
+
+    def __init__(self):
+        self.nodes = defaultdict(lambda: defaultdict(MethodStats))
+        self.lock = threading.Lock()
+
+    def record(self, node, method, elapsed, request_bytes, response_bytes):
+        # The sync helpers call several nodes from different threads
+        with self.lock:
+            self.nodes[node][method].record(elapsed, request_bytes, response_bytes)
+
+    def by_method(self):
+        """Return a dict of method name to MethodStats, summed over all nodes."""
+        methods = defaultdict(MethodStats)
+        for node_methods in self.nodes.values():
+            for method, stats in node_methods.items():
+                methods[method].merge(stats)
+        return methods
+
+    def total_time(self):
+        return sum(stats.total_time for stats in self.by_method().values())
+
+    def to_dict(self):
+        return {node: {method: stats.to_dict() for method, stats in sorted(methods.items())}
+                for node, methods in sorted(self.nodes.items())}
+
+    @classmethod
+    def from_dict(cls, d):
+        rpc_stats = cls()
+        for node, methods in d.items():
+            for method, stats in methods.items():
+                rpc_stats.nodes[node][method] = MethodStats.from_dict(stats)
+        return rpc_stats
+
+    def dump(self, dirname, test_name):
+        """Write the stats of this test process to a JSON file in dirname."""
+        filename = os.path.join(dirname, "%spid%d.json" % (STATS_FILE_PREFIX, os.getpid()))
+        with open(filename, 'w', encoding='utf8') as f:
+            json.dump({'test': test_name, 'nodes': self.to_dict()}, f, indent=1)
+        return filename
+
+
+def merge_stats_dir(dirname):
+    """Merge all per-test dumps found in dirname.
+
+    Returns a tuple of (suite-wide RPCStats, dict of test name to RPCStats)."""
+    suite = RPCStats()
+    tests = {}
+    for filename in sorted(os.listdir(dirname)):
+        if not filename.startswith(STATS_FILE_PREFIX):
+            continue
+        with open(os.path.join(dirname, filename), 'r', encoding='utf8') as f:
+            dump = json.load(f)
+        test_stats = RPCStats.from_dict(dump['nodes'])
+        if dump['test'] in tests:
+            for node, methods in test_stats.nodes.items():
+                for method, stats in methods.items():
+                    tests[dump['test']].nodes[node][method].merge(stats)
+        else:
+            tests[dump['test']] = test_stats
+        for node, methods in test_stats.nodes.items():
+            for method, stats in methods.items():
+                suite.nodes[node][method].merge(stats)
+    return suite, tests
+
+
+def format_report(suite, tests, top=20):
+    """Render the slowest RPC methods and tests as a text table."""
+    methods = sorted(suite.by_method().items(), key=lambda item: item[1].total_time, reverse=True)
+    lines = ["%-32s %8s %10s %9s %9s %9s %12s %12s" % ("METHOD", "COUNT", "TOTAL(s)", "P50(ms)", "P95(ms)", "P99(ms)", "REQ(bytes)", "RESP(bytes)")]
+    for method, stats in methods[:top]:
+        lines.append("%-32s %8d %10.3f %9.3f %9.3f %9.3f %12d %12d" % (
+            method, stats.count, stats.total_time, stats.percentile(50) * 1000, stats.percentile(95) * 1000,
+            stats.percentile(99) * 1000, stats.request_bytes, stats.response_bytes))
+    lines.append("")
+    lines.append("%-48s %10s %8s" % ("TEST", "RPC(s)", "CALLS"))
+    for name, test_stats in sorted(tests.items(), key=lambda item: item[1].total_time(), reverse=True)[:top]:
+        lines.append("%-48s %10.3f %8d" % (name, test_stats.total_time(), sum(s.count for s in test_stats.by_method().values())))
+    return "\n".join(lines)
+
+
+def write_report(filename, suite, tests):
+    """Write the merged suite-wide report as JSON."""
+    with open(filename, 'w', encoding='utf8') as f:
+        json.dump({
+            'methods': {method: stats.to_dict() for method, stats in sorted(suite.by_method().items())},
+            'nodes': suite.to_dict(),
+            'tests': {name: {'total_time': test_stats.total_time(),
+                             'methods': {method: stats.to_dict() for method, stats in sorted(test_stats.by_method().items())}}
+                      for name, test_stats in sorted(tests.items())},
+        }, f, indent=1)
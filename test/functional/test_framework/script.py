@@ -5,14 +5,16 @@
 # file COPYING or http://www.opensource.org/licenses/mit-license.php.
 
 """
-Functionality to build scripts, as well as signature_hash().
+Functionality to build scripts, as well as signature_hash() and classify_script().
 
 This file is modified from python-evrmorelib.
 """
 
-from .mininode import CTransaction, CTxOut, sha256, hash256, uint256_from_str, ser_uint256, ser_string
+from .mininode import CTransaction, CTxOut, sha256, hash256, ser_compact_size, ser_string
 from binascii import hexlify
 from .bignum import bn2vch
+from collections import namedtuple
+import functools
 import hashlib
 import struct
 
@@ -616,92 +618,338 @@ def signature_hash(script, tx_to, in_idx, hash_type):
 
     Returns (hash, err) to precisely match the consensus-critical behavior of
     the SIGHASH_SINGLE bug. (inIdx is *not* checked for validity)
-    """
-    hash_one = b'\x01\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00'
-
-    if in_idx >= len(tx_to.vin):
-        return hash_one, "inIdx %d out of range (%d)" % (in_idx, len(tx_to.vin))
-    tx_tmp = CTransaction(tx_to)
-
-    for txin in tx_tmp.vin:
-        txin.scriptSig = b''
-    tx_tmp.vin[in_idx].scriptSig = find_and_delete(script, CScript(OP_CODESEPARATOR))
-
-    if (hash_type & 0x1f) == SIGHASH_NONE:
-        tx_tmp.vout = []
-
-        for i in range(len(tx_tmp.vin)):
-            if i != in_idx:
-                tx_tmp.vin[i].nSequence = 0
-
-    elif (hash_type & 0x1f) == SIGHASH_SINGLE:
-        out_idx = in_idx
-        if out_idx >= len(tx_tmp.vout):
-            return hash_one, "outIdx %d out of range (%d)" % (out_idx, len(tx_tmp.vout))
-
-        tmp = tx_tmp.vout[out_idx]
-        tx_tmp.vout = []
-        for i in range(out_idx):
-            tx_tmp.vout.append(CTxOut(-1))
-        tx_tmp.vout.append(tmp)
-
-        for i in range(len(tx_tmp.vin)):
-            if i != in_idx:
-                tx_tmp.vin[i].nSequence = 0
 
-    if hash_type & SIGHASH_ANYONECANPAY:
-        tmp = tx_tmp.vin[in_idx]
-        tx_tmp.vin = []
-        tx_tmp.vin.append(tmp)
-
-    s = tx_tmp.serialize()
-    s += struct.pack(b"<I", hash_type)
-
-    hash_data = hash256(s)
-
-    return hash_data, None
+    To sign several inputs of a transaction, use a SighashCache.
+    """
+    return SighashCache(tx_to).signature_hash(script, in_idx, hash_type)
 
 
-# TODO: Allow cached hashPrevouts/hashSequence/hashOutputs to be provided.
-# Performance optimization probably not necessary for python tests, however.
 # Note that this corresponds to sigversion == 1 in EvalScript, which is used
 # for version 0 witnesses.
 def segwit_version1_signature_hash(script, tx_to, in_idx, hash_type, amount):
-    hash_prevouts = 0
-    hash_sequence = 0
-    hash_outputs = 0
-
-    if not (hash_type & SIGHASH_ANYONECANPAY):
-        serialize_prevouts = bytes()
-        for i in tx_to.vin:
-            serialize_prevouts += i.prevout.serialize()
-        hash_prevouts = uint256_from_str(hash256(serialize_prevouts))
-
-    if not (hash_type & SIGHASH_ANYONECANPAY) and (hash_type & 0x1f) != SIGHASH_SINGLE and (hash_type & 0x1f) != SIGHASH_NONE:
-        serialize_sequence = bytes()
-        for i in tx_to.vin:
-            serialize_sequence += struct.pack("<I", i.nSequence)
-        hash_sequence = uint256_from_str(hash256(serialize_sequence))
-
-    if (hash_type & 0x1f) != SIGHASH_SINGLE and (hash_type & 0x1f) != SIGHASH_NONE:
-        serialize_outputs = bytes()
-        for o in tx_to.vout:
-            serialize_outputs += o.serialize()
-        hash_outputs = uint256_from_str(hash256(serialize_outputs))
-    elif (hash_type & 0x1f) == SIGHASH_SINGLE and in_idx < len(tx_to.vout):
-        serialize_outputs = tx_to.vout[in_idx].serialize()
-        hash_outputs = uint256_from_str(hash256(serialize_outputs))
-
-    ss = bytes()
-    ss += struct.pack("<i", tx_to.nVersion)
-    ss += ser_uint256(hash_prevouts)
-    ss += ser_uint256(hash_sequence)
-    ss += tx_to.vin[in_idx].prevout.serialize()
-    ss += ser_string(script)
-    ss += struct.pack("<q", amount)
-    ss += struct.pack("<I", tx_to.vin[in_idx].nSequence)
-    ss += ser_uint256(hash_outputs)
-    ss += struct.pack("<i", tx_to.nLockTime)
-    ss += struct.pack("<I", hash_type)
-
-    return hash256(ss)
+    return SighashCache(tx_to).segwit_version1_signature_hash(script, in_idx, hash_type, amount)
+
+
+# Returned by signature_hash() for the SIGHASH_SINGLE bug and out of range inputs
+SIGHASH_ONE = b'\x01' + b'\x00' * 31
+
+
+class SighashCache:
+    """Signature hashes of the inputs of one transaction, sharing the work between inputs.
+
+    The BIP143 hashPrevouts, hashSequence and hashOutputs are computed once
+    per transaction instead of once per input. Legacy signature hashes are
+    hashed from the serialized inputs and outputs, which are also computed
+    once, instead of from a copy of the transaction per input.
+
+    The transaction must not be changed while the cache is used, except for
+    the scriptSigs and witnesses, which are not part of signature hashes."""
+
+    # Serialized size of an input with an empty scriptSig
+    BLANK_INPUT_SIZE = 36 + 1 + 4
+
+    def __init__(self, tx_to):
+        self.tx = tx_to
+        # Built on first use
+        self._blank_inputs = None
+        self._blank_inputs_no_sequence = None
+        self._outputs = None
+        self._hash_prevouts = None
+        self._hash_sequence = None
+        self._hash_outputs = None
+        self._script_codes = {}
+
+    def _script_code(self, script):
+        script = bytes(script)
+        script_code = self._script_codes.get(script)
+        if script_code is None:
+            script_code = bytes(find_and_delete(CScript(script), CScript([OP_CODESEPARATOR])))
+            self._script_codes[script] = script_code
+        return script_code
+
+    def blank_inputs(self, keep_sequence=True):
+        """Return the serialization of all inputs with empty scriptSigs (and with nSequence 0 unless keep_sequence)."""
+        if keep_sequence:
+            if self._blank_inputs is None:
+                self._blank_inputs = b"".join(txin.prevout.serialize() + b"\x00" + struct.pack("<I", txin.nSequence) for txin in self.tx.vin)
+            return self._blank_inputs
+        if self._blank_inputs_no_sequence is None:
+            self._blank_inputs_no_sequence = b"".join(txin.prevout.serialize() + b"\x00" + b"\x00" * 4 for txin in self.tx.vin)
+        return self._blank_inputs_no_sequence
+
+    def outputs(self):
+        """Return the serialization of all outputs, without their count."""
+        if self._outputs is None:
+            self._outputs = b"".join(txout.serialize() for txout in self.tx.vout)
+        return self._outputs
+
+    def signature_hash(self, script, in_idx, hash_type):
+        """Legacy signature hash of input in_idx, as signature_hash() (returns (hash, err))."""
+        tx = self.tx
+        if in_idx >= len(tx.vin):
+            return SIGHASH_ONE, "inIdx %d out of range (%d)" % (in_idx, len(tx.vin))
+        base_type = hash_type & 0x1f
+        txin = tx.vin[in_idx]
+        own_input = txin.prevout.serialize() + ser_string(self._script_code(script)) + struct.pack("<I", txin.nSequence)
+
+        h = hashlib.sha256(struct.pack("<i", tx.nVersion))
+        if hash_type & SIGHASH_ANYONECANPAY:
+            h.update(ser_compact_size(1))
+            h.update(own_input)
+        else:
+            # The other inputs have empty scriptSigs, and nSequence 0 with SIGHASH_NONE and SIGHASH_SINGLE
+            blank = memoryview(self.blank_inputs(keep_sequence=base_type not in (SIGHASH_NONE, SIGHASH_SINGLE)))
+            h.update(ser_compact_size(len(tx.vin)))
+            h.update(blank[:in_idx * self.BLANK_INPUT_SIZE])
+            h.update(own_input)
+            h.update(blank[(in_idx + 1) * self.BLANK_INPUT_SIZE:])
+
+        if base_type == SIGHASH_NONE:
+            h.update(ser_compact_size(0))
+        elif base_type == SIGHASH_SINGLE:
+            if in_idx >= len(tx.vout):
+                return SIGHASH_ONE, "outIdx %d out of range (%d)" % (in_idx, len(tx.vout))
+            h.update(ser_compact_size(in_idx + 1))
+            h.update(CTxOut(-1).serialize() * in_idx)
+            h.update(tx.vout[in_idx].serialize())
+        else:
+            h.update(ser_compact_size(len(tx.vout)))
+            h.update(self.outputs())
+
+        h.update(struct.pack("<I", tx.nLockTime))
+        h.update(struct.pack("<I", hash_type))
+        return sha256(h.digest()), None
+
+    def hash_prevouts(self):
+        if self._hash_prevouts is None:
+            self._hash_prevouts = hash256(b"".join(txin.prevout.serialize() for txin in self.tx.vin))
+        return self._hash_prevouts
+
+    def hash_sequence(self):
+        if self._hash_sequence is None:
+            self._hash_sequence = hash256(b"".join(struct.pack("<I", txin.nSequence) for txin in self.tx.vin))
+        return self._hash_sequence
+
+    def hash_outputs(self):
+        if self._hash_outputs is None:
+            self._hash_outputs = hash256(self.outputs())
+        return self._hash_outputs
+
+    def segwit_version1_signature_hash(self, script, in_idx, hash_type, amount):
+        """BIP143 signature hash of input in_idx, as segwit_version1_signature_hash()."""
+        tx = self.tx
+        base_type = hash_type & 0x1f
+        zero = b"\x00" * 32
+        hash_prevouts = zero
+        hash_sequence = zero
+        hash_outputs = zero
+
+        if not (hash_type & SIGHASH_ANYONECANPAY):
+            hash_prevouts = self.hash_prevouts()
+            if base_type != SIGHASH_SINGLE and base_type != SIGHASH_NONE:
+                hash_sequence = self.hash_sequence()
+
+        if base_type != SIGHASH_SINGLE and base_type != SIGHASH_NONE:
+            hash_outputs = self.hash_outputs()
+        elif base_type == SIGHASH_SINGLE and in_idx < len(tx.vout):
+            hash_outputs = hash256(tx.vout[in_idx].serialize())
+
+        ss = bytes()
+        ss += struct.pack("<i", tx.nVersion)
+        ss += hash_prevouts
+        ss += hash_sequence
+        ss += tx.vin[in_idx].prevout.serialize()
+        ss += ser_string(script)
+        ss += struct.pack("<q", amount)
+        ss += struct.pack("<I", tx.vin[in_idx].nSequence)
+        ss += hash_outputs
+        ss += struct.pack("<I", tx.nLockTime)
+        ss += struct.pack("<I", hash_type)
+
+        return hash256(ss)
+
+
+# Output types, as named by the node (GetTxnOutputType)
+TX_NONSTANDARD = "nonstandard"
+TX_PUBKEY = "pubkey"
+TX_PUBKEYHASH = "pubkeyhash"
+TX_SCRIPTHASH = "scripthash"
+TX_MULTISIG = "multisig"
+TX_NULL_DATA = "nulldata"
+TX_RESTRICTED_ASSET_DATA = "nullassetdata"
+TX_WITNESS_V0_KEYHASH = "witness_v0_keyhash"
+TX_WITNESS_V0_SCRIPTHASH = "witness_v0_scripthash"
+TX_NEW_ASSET = "new_asset"
+TX_TRANSFER_ASSET = "transfer_asset"
+TX_REISSUE_ASSET = "reissue_asset"
+
+# Subtypes of nullassetdata outputs
+NULL_ASSET_TAG = "tag"                                # qualifier or restricted address tag
+NULL_ASSET_GLOBAL_RESTRICTION = "global_restriction"  # freeze of a restricted asset
+NULL_ASSET_VERIFIER = "verifier"                      # verifier string of a restricted asset
+
+# Asset operation after the "evr" marker -> output type
+ASSET_OPERATIONS = {
+    ord('t'): TX_TRANSFER_ASSET,
+    ord('q'): TX_NEW_ASSET,
+    ord('o'): TX_NEW_ASSET,
+    ord('r'): TX_REISSUE_ASSET,
+}
+
+# Number of distinct scripts whose classification is remembered
+CLASSIFY_CACHE_SIZE = 1 << 16
+
+# type: an output type (TX_*). subtype: the wrapped script type of asset
+# outputs (TX_PUBKEYHASH or TX_SCRIPTHASH), or the NULL_ASSET_* kind of
+# nullassetdata outputs. solution: the hash or pubkey the script pays to (a
+# tuple of pubkeys for multisig). asset_data: for asset outputs, the data
+# after the "evr" marker starting with the operation byte (t, q, o or r); for
+# nullassetdata outputs, the last push. sigops: the legacy sigop count, None
+# if the script does not parse.
+ScriptTemplate = namedtuple("ScriptTemplate", "type subtype solution asset_data sigops")
+
+
+def _pushes(script, start):
+    """Return the data pushed by script[start:], or None if it is not push only or does not parse."""
+    pushes = []
+    i = start
+    end = len(script)
+    while i < end:
+        opcode = script[i]
+        i += 1
+        if opcode > OP_16:
+            return None
+        if opcode < OP_PUSHDATA1:
+            size = opcode
+        elif opcode == OP_PUSHDATA1:
+            if i + 1 > end:
+                return None
+            size = script[i]
+            i += 1
+        elif opcode == OP_PUSHDATA2:
+            if i + 2 > end:
+                return None
+            size = script[i] | script[i + 1] << 8
+            i += 2
+        elif opcode == OP_PUSHDATA4:
+            if i + 4 > end:
+                return None
+            size = int.from_bytes(script[i:i + 4], 'little')
+            i += 4
+        else:
+            # OP_1NEGATE, OP_RESERVED, OP_1 ... OP_16
+            pushes.append(b"")
+            continue
+        if i + size > end:
+            return None
+        pushes.append(script[i:i + size])
+        i += size
+    return pushes
+
+
+def _asset_template(script, subtype, solution, marker, sigops):
+    """Classify the asset data following the P2PKH or P2SH script at script[:marker] (marker is the OP_EVR_ASSET index)."""
+    size = len(script)
+    if script[marker + 1] < OP_PUSHDATA1:
+        start = marker + 2
+        length = script[marker + 1]
+    elif script[marker + 1] == OP_PUSHDATA1 and size > marker + 2:
+        start = marker + 3
+        length = script[marker + 2]
+    else:
+        return None
+    if script[start:start + 3] != b"evr" or size < start + 4:
+        return None
+    operation = script[start + 3]
+    output_type = ASSET_OPERATIONS.get(operation)
+    if output_type is None or (operation == ord('q') and size <= 39):
+        return None
+    return ScriptTemplate(output_type, subtype, solution, bytes(script[start + 3:start + length]), sigops)
+
+
+def _multisig_template(script):
+    """Match OP_m <pubkey>... OP_n OP_CHECKMULTISIG."""
+    size = len(script)
+    if size < 37 or script[-1] != OP_CHECKMULTISIG or not OP_1 <= script[0] <= OP_16 or not OP_1 <= script[-2] <= OP_16:
+        return None
+    pubkeys = []
+    i = 1
+    while i < size - 2:
+        length = script[i]
+        if not 33 <= length <= 65 or i + 1 + length > size - 2:
+            return None
+        pubkeys.append(bytes(script[i + 1:i + 1 + length]))
+        i += 1 + length
+    m = script[0] - OP_1 + 1
+    n = script[-2] - OP_1 + 1
+    if n != len(pubkeys) or m > n:
+        return None
+    return ScriptTemplate(TX_MULTISIG, None, tuple(pubkeys), None, 20)
+
+
+@functools.lru_cache(maxsize=CLASSIFY_CACHE_SIZE)
+def _classify(script):
+    size = len(script)
+    first = script[0] if size else None
+
+    # Fixed size templates
+    if size == 25 and first == OP_DUP and script[1] == OP_HASH160 and script[2] == 0x14 and script[23] == OP_EQUALVERIFY and script[24] == OP_CHECKSIG:
+        return ScriptTemplate(TX_PUBKEYHASH, None, bytes(script[3:23]), None, 1)
+    if size == 23 and first == OP_HASH160 and script[1] == 0x14 and script[22] == OP_EQUAL:
+        return ScriptTemplate(TX_SCRIPTHASH, None, bytes(script[2:22]), None, 0)
+    if size == 22 and first == OP_0 and script[1] == 0x14:
+        return ScriptTemplate(TX_WITNESS_V0_KEYHASH, None, bytes(script[2:22]), None, 0)
+    if size == 34 and first == OP_0 and script[1] == 0x20:
+        return ScriptTemplate(TX_WITNESS_V0_SCRIPTHASH, None, bytes(script[2:34]), None, 0)
+    if 35 <= size <= 67 and first == size - 2 and script[-1] == OP_CHECKSIG:
+        return ScriptTemplate(TX_PUBKEY, None, bytes(script[1:-1]), None, 1)
+
+    # Asset outputs: a P2PKH or P2SH script, OP_EVR_ASSET <"evr" + operation + asset data> OP_DROP
+    if size > 31:
+        if first == OP_HASH160 and script[1] == 0x14 and script[22] == OP_EQUAL and script[23] == OP_EVR_ASSET:
+            template = _asset_template(script, TX_SCRIPTHASH, bytes(script[2:22]), 23, 0)
+            if template:
+                return template
+        elif script[25] == OP_EVR_ASSET and first == OP_DUP and script[1] == OP_HASH160 and script[2] == 0x14 and script[23] == OP_EQUALVERIFY and script[24] == OP_CHECKSIG:
+            template = _asset_template(script, TX_PUBKEYHASH, bytes(script[3:23]), 25, 1)
+            if template:
+                return template
+
+    # Data carrying outputs
+    if first == OP_RETURN:
+        if _pushes(script, 1) is not None:
+            return ScriptTemplate(TX_NULL_DATA, None, None, None, 0)
+    elif first == OP_EVR_ASSET:
+        pushes = _pushes(script, 1)
+        if pushes is not None:
+            asset_data = bytes(pushes[-1]) if pushes else None
+            if size >= 23 and script[1] == 0x14:
+                return ScriptTemplate(TX_RESTRICTED_ASSET_DATA, NULL_ASSET_TAG, bytes(script[2:22]), asset_data, 0)
+            if size > 1 and script[1] == OP_RESERVED:
+                subtype = NULL_ASSET_GLOBAL_RESTRICTION if size > 2 and script[2] == OP_RESERVED else NULL_ASSET_VERIFIER
+                return ScriptTemplate(TX_RESTRICTED_ASSET_DATA, subtype, None, asset_data, 0)
+            return ScriptTemplate(TX_RESTRICTED_ASSET_DATA, None, None, asset_data, 0)
+
+    if size and script[-1] == OP_CHECKMULTISIG:
+        template = _multisig_template(script)
+        if template:
+            return template
+
+    # Only nonstandard scripts are tokenized
+    try:
+        sigops = CScript(script).get_sig_op_count(False)
+    except CScriptInvalidError:
+        sigops = None
+    return ScriptTemplate(TX_NONSTANDARD, None, None, None, sigops)
+
+
+def classify_script(script):
+    """Return the ScriptTemplate of an output script (bytes or CScript).
+
+    Standard templates are matched on bytes and lengths; only nonstandard
+    scripts are parsed opcode by opcode. Results are memoized by script
+    bytes, so classifying the outputs of a chain costs one lookup per
+    repeated script."""
+    if not isinstance(script, bytes):
+        script = bytes(script)
+    return _classify(script)
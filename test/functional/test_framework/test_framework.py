@@ -18,10 +18,14 @@ import tempfile
 import time
 
 from .authproxy import JSONRPCException
-from . import coverage
+from .chaincache import ChainCache, clone_tree, default_cache_root
+from .fixtures import FIXTURE_MAX_AGE, get_fixture
+from .nodepool import NodePool
+from . import coverage, timeprofile, tracing, util
+from .rpcstats import RPCStats
 from .test_node import TestNode
-from .util import (MAX_NODES, PortSeed, assert_equal, check_json_precision, connect_nodes_bi, disconnect_nodes,
-                   initialize_data_dir, log_filename, p2p_port, set_node_times, sync_blocks, sync_mempools)
+from .util import (MAX_NODES, PortBroker, assert_equal, check_json_precision, connect_nodes_bi, disconnect_nodes,
+                   initialize_data_dir, log_filename, map_nodes, p2p_port, release_ports, set_node_times, sync_blocks, sync_mempools)
 
 
 class TestStatus(Enum):
@@ -55,8 +59,15 @@ class EvrmoreTestFramework:
         """Sets test framework defaults. Do not override this method. Instead, override the set_test_params() method"""
         self.num_nodes = None
         self.setup_clean_chain = False
+        # Name and parameters of a chain fixture (see fixtures.py) to start from instead
+        self.fixture = None
+        self.fixture_params = None
+        # Whether the test can run on nodes of the warm node pool (see nodepool.py)
+        self.poolable = False
+        self.pool_lease = None
         self.nodes = []
         self.mocktime = 0
+        self.rpc_stats = None
         self.set_test_params()
 
         assert hasattr(self, "num_nodes"), "Test must set self.num_nodes in set_test_params()"
@@ -64,27 +75,41 @@ class EvrmoreTestFramework:
     def main(self):
         """Main function. This should not be overridden by the subclass test scripts."""
         parser = optparse.OptionParser(usage="%prog [options]")
-        parser.add_option("--cachedir", dest="cachedir", default=os.path.normpath(os.path.dirname(os.path.realpath(__file__)) + "/../../cache"), help="Directory for caching pregenerated datadirs")
+        parser.add_option("--cachedir", dest="cachedir", default=default_cache_root(), help="Directory for caching pregenerated datadirs, keyed by evrmored binary and chain parameters (default: %default)")
         parser.add_option("--coveragedir", dest="coveragedir", help="Write tested RPC commands into this directory")
         parser.add_option("--configfile", dest="configfile", help="Location of the test framework config file")
         parser.add_option("--loglevel", dest="loglevel", default="INFO", help="log events at this level and higher to the console. Can be set to DEBUG, INFO, WARNING, ERROR or CRITICAL. Passing --loglevel DEBUG will output all logs to console. Note that logs at all levels are always written to the test_framework.log file in the temporary test directory.")
         parser.add_option("--nocleanup", dest="nocleanup", default=False, action="store_true", help="Leave evrmoreds and test.* datadir on exit or error")
         parser.add_option("--noshutdown", dest="noshutdown", default=False, action="store_true", help="Don't stop evrmoreds after the test execution")
         parser.add_option("--pdbonfailure", dest="pdbonfailure", default=False, action="store_true", help="Attach a python debugger if test fails")
-        parser.add_option("--portseed", dest="port_seed", default=os.getpid(), type='int', help="The seed to use for assigning port numbers (default: current process id)")
+        parser.add_option("--portseed", dest="port_seed", default=os.getpid(), type='int', help="Number identifying this test instance, which test_runner.py names its tmpdir after. Does not affect port numbers (default: current process id)")
+        parser.add_option("--portdir", dest="portdir", default=os.path.join(tempfile.gettempdir(), "evrmore_test_ports"), help="Directory of the port lock files shared by all concurrently running tests (default: %default)")
         parser.add_option("--srcdir", dest="srcdir", default=os.path.normpath(os.path.dirname(os.path.realpath(__file__)) + "/../../../src"), help="Source directory containing evrmored/evrmore-cli (default: %default)")
         parser.add_option("--tmpdir", dest="tmpdir", help="Root directory for datadirs")
         parser.add_option("--tracerpc", dest="trace_rpc", default=False, action="store_true", help="Print out all RPC calls as they are made")
+        parser.add_option("--rpcstatsdir", dest="rpcstatsdir", help="Record per-node, per-method RPC latency and size statistics and write them as JSON into this directory")
+        parser.add_option("--nodepool", dest="nodepool", help="Directory of a warm node pool started by test_runner.py --nodepool. Poolable tests lease their nodes from it instead of starting them")
+        parser.add_option("--trace", dest="trace", help="Write a timeline of RPC calls, P2P messages, sync waits and node log events in Chrome trace event format to this file")
+        parser.add_option("--timeprofile", dest="timeprofile", help="Attribute the test's wall time to node startup/shutdown, RPCs, waits and Python, log a summary and write folded stacks for flame graphs to this file")
 
         self.add_options(parser)
         (self.options, self.args) = parser.parse_args()
 
-        PortSeed.n = self.options.port_seed
+        util.port_broker = PortBroker(self.options.portdir)
 
         os.environ['PATH'] = self.options.srcdir + ":" + self.options.srcdir + "/qt:" + os.environ['PATH']
 
         check_json_precision()
 
+        if self.options.timeprofile:
+            timeprofile.enable()
+
+        if self.options.trace:
+            tracing.enable()
+
+        if self.options.rpcstatsdir:
+            self.rpc_stats = RPCStats()
+
         self.options.cachedir = os.path.abspath(self.options.cachedir)
 
         # Set up temp directory and start logging
@@ -106,8 +131,11 @@ class EvrmoreTestFramework:
         success = TestStatus.FAILED
 
         try:
+            timeprofile.set_phase("setup_chain")
             self.setup_chain()
+            timeprofile.set_phase("setup_network")
             self.setup_network()
+            timeprofile.set_phase("run_test")
             self.run_test()
             success = TestStatus.PASSED
         except JSONRPCException as e:
@@ -128,15 +156,37 @@ class EvrmoreTestFramework:
             self.log.info("Testcase failed. Attaching python debugger. Enter ? for help")
             pdb.set_trace()
 
+        timeprofile.set_phase("shutdown")
         if not self.options.noshutdown:
-            self.log.info("Stopping nodes")
-            if self.nodes:
+            if self.pool_lease is not None:
+                self.log.info("Returning nodes to the node pool")
+                self.pool_lease.release(os.path.basename(sys.argv[0]))
+            elif self.nodes:
+                self.log.info("Stopping nodes")
                 self.stop_nodes()
+            release_ports()
         else:
             for node in self.nodes:
                 node.cleanup_on_exit = False
             self.log.info("Note: evrmored's were not stopped and may still be running")
 
+        if self.rpc_stats is not None:
+            stats_file = self.rpc_stats.dump(self.options.rpcstatsdir, os.path.basename(sys.argv[0]))
+            self.log.debug("RPC statistics written to %s" % stats_file)
+
+        tracer = tracing.get_tracer()
+        if tracer is not None:
+            for node in self.nodes:
+                tracer.add_node_log("node%d" % node.index, node.debug_log)
+            tracer.write(self.options.trace)
+            self.log.info("Trace written to %s" % self.options.trace)
+
+        profile = timeprofile.get_profile()
+        if profile is not None:
+            profile.finish()
+            profile.write_folded(self.options.timeprofile)
+            self.log.info("Wall time profile (folded stacks written to %s):\n%s" % (self.options.timeprofile, profile.format_report()))
+
         if not self.options.nocleanup and not self.options.noshutdown and success != TestStatus.FAILED:
             self.log.info("Cleaning up")
             shutil.rmtree(self.options.tmpdir)
@@ -166,7 +216,15 @@ class EvrmoreTestFramework:
     def setup_chain(self):
         """Override this method to customize blockchain setup"""
         self.log.info("Initializing test directory " + self.options.tmpdir)
-        if self.setup_clean_chain:
+        if self.options.nodepool and self._can_use_pool():
+            self.pool_lease = NodePool(self.options.nodepool).lease(self.num_nodes, rpc_stats=self.rpc_stats, coverage_dir=self.options.coveragedir)
+            if self.pool_lease is not None:
+                self.log.info("Using %d nodes of the node pool (logs are in %s)" % (self.num_nodes, self.options.nodepool))
+                return
+            self.log.info("Not enough idle nodes in the node pool, starting nodes")
+        if self.fixture is not None:
+            self._initialize_chain_from_fixture()
+        elif self.setup_clean_chain:
             self._initialize_chain_clean()
         else:
             self._initialize_chain()
@@ -189,6 +247,9 @@ class EvrmoreTestFramework:
         extra_args = None
         if hasattr(self, "extra_args"):
             extra_args = self.extra_args
+        if self.pool_lease is not None:
+            self.nodes = self.pool_lease.nodes
+            return
         self.add_nodes(self.num_nodes, extra_args, False)
         self.start_nodes()
 
@@ -210,7 +271,7 @@ class EvrmoreTestFramework:
         for i in range(num_nodes):
             self.nodes.append(
                 TestNode(i, self.options.tmpdir, extra_args[i], rpchost, timewait=timewait, binary=binary[i],
-                         stderr=None, mocktime=self.mocktime, coverage_dir=self.options.coveragedir))
+                         stderr=None, mocktime=self.mocktime, coverage_dir=self.options.coveragedir, rpc_stats=self.rpc_stats))
 
     def start_node(self, i, extra_args=None, stderr=None):
         """Start a evrmored"""
@@ -232,8 +293,8 @@ class EvrmoreTestFramework:
         try:
             for i, node in enumerate(self.nodes):
                 node.start(extra_args[i])
-            for node in self.nodes:
-                node.wait_for_rpc_connection()
+            with timeprofile.section("node startup"):
+                map_nodes(lambda node: node.wait_for_rpc_connection(), self.nodes)
         except Exception:
             # If one node failed to start, stop the others
             self.stop_nodes()
@@ -250,13 +311,10 @@ class EvrmoreTestFramework:
 
     def stop_nodes(self):
         """Stop multiple evrmored test nodes"""
-        for node in self.nodes:
-            # Issue RPC to stop nodes
-            node.stop_node()
-
-        for node in self.nodes:
-            # Wait for nodes to stop
-            node.wait_until_stopped()
+        with timeprofile.section("node shutdown"):
+            # Issue RPC to stop nodes, then wait for them to stop
+            map_nodes(lambda node: node.stop_node(), self.nodes)
+            map_nodes(lambda node: node.wait_until_stopped(), self.nodes)
 
     def restart_node(self, i, extra_args=None):
         """Stop and start a test node"""
@@ -363,77 +421,125 @@ class EvrmoreTestFramework:
             rpc_handler.setLevel(logging.DEBUG)
             rpc_logger.addHandler(rpc_handler)
 
+    def _can_use_pool(self):
+        """Whether the test can run on pooled nodes, which run with default arguments on the cached chain."""
+        return (self.poolable and not self.setup_clean_chain and self.fixture is None and self.mocktime == 0 and
+                not any(getattr(self, "extra_args", None) or []))
+
     def _initialize_chain(self):
         """Initialize a pre-mined blockchain for use by the test.
 
-        Create a cache of a 200-block-long chain (with wallet) for MAX_NODES
-        Afterward, create num_nodes copies from the cache."""
+        Clone the datadirs of a 200-block-long chain (with wallet) for MAX_NODES
+        from the chain cache, building it first if this binary has no cache
+        entry yet. Nodes beyond MAX_NODES start with an empty datadir and sync
+        the chain from their peers."""
+
+        cache = ChainCache(self.options.cachedir)
+        key = cache.default_chain_key(os.getenv("EVRMORED", "evrmored"))
+        cache_dir = cache.get(key, self._create_cache)
+
+        for i in range(self.num_nodes):
+            if i < MAX_NODES:
+                from_dir = os.path.join(cache_dir, "node" + str(i))
+                to_dir = os.path.join(self.options.tmpdir, "node" + str(i))
+                counts = clone_tree(from_dir, to_dir)
+                self.log.debug("Cloned node%d from cache entry %s: %s" % (i, key, counts))
+            initialize_data_dir(self.options.tmpdir, i)  # Overwrite port/rpcport in evrmore.conf
 
-        assert self.num_nodes <= MAX_NODES
-        create_cache = False
+    def _create_cache(self, cache_dir):
+        """Create a 200-block-long chain in the datadirs of MAX_NODES nodes under cache_dir."""
+        self.log.debug("Creating cached datadirs in %s" % cache_dir)
+
+        # Create cache directories, run evrmoreds:
         for i in range(MAX_NODES):
-            if not os.path.isdir(os.path.join(self.options.cachedir, 'node' + str(i))):
-                create_cache = True
-                break
-
-        if create_cache:
-            self.log.debug("Creating data directories from cached datadir")
-
-            # find and delete old cache directories if any exist
-            for i in range(MAX_NODES):
-                if os.path.isdir(os.path.join(self.options.cachedir, "node" + str(i))):
-                    shutil.rmtree(os.path.join(self.options.cachedir, "node" + str(i)))
-
-            # Create cache directories, run evrmoreds:
-            for i in range(MAX_NODES):
-                datadir = initialize_data_dir(self.options.cachedir, i)
-                args = [os.getenv("EVRMORED", "evrmored"), "-server", "-keypool=1", "-datadir=" + datadir, "-discover=0"]
-                if i > 0:
-                    args.append("-connect=127.0.0.1:" + str(p2p_port(0)))
-                self.nodes.append(
-                    TestNode(i, self.options.cachedir, extra_args=[], rpchost=None, timewait=None, binary=None,
-                             stderr=None, mocktime=self.mocktime, coverage_dir=None))
-                self.nodes[i].args = args
-                self.start_node(i)
-
-            # Wait for RPC connections to be ready
-            for node in self.nodes:
-                node.wait_for_rpc_connection()
-
-            # Create a 200-block-long chain; each of the 4 first nodes
-            # gets 25 mature blocks and 25 immature.
-            # Note: To preserve compatibility with older versions of
-            # initialize_chain, only 4 nodes will generate coins.
-            #
-            # blocks are created with timestamps 10 minutes apart
-            # starting from 2010 minutes in the past
-            self.enable_mocktime()
-            block_time = self.mocktime - (201 * 1 * 60)
-            for i in range(2):
-                for peer in range(4):
-                    for _ in range(25):
-                        set_node_times(self.nodes, block_time)
-                        self.nodes[peer].generate(1)
-                        block_time += 1 * 60
-                    # Must sync before next peer starts generating blocks
-                    sync_blocks(self.nodes)
-
-            # Shut them down, and clean up cache directories:
-            self.stop_nodes()
-            self.nodes = []
-            self.disable_mocktime()
-            for i in range(MAX_NODES):
-                os.remove(log_filename(self.options.cachedir, i, "debug.log"))
-                os.remove(log_filename(self.options.cachedir, i, "db.log"))
-                os.remove(log_filename(self.options.cachedir, i, "peers.dat"))
-                os.remove(log_filename(self.options.cachedir, i, "fee_estimates.dat"))
+            datadir = initialize_data_dir(cache_dir, i)
+            args = [os.getenv("EVRMORED", "evrmored"), "-server", "-keypool=1", "-datadir=" + datadir, "-discover=0"]
+            if i > 0:
+                args.append("-connect=127.0.0.1:" + str(p2p_port(0)))
+            self.nodes.append(
+                TestNode(i, cache_dir, extra_args=[], rpchost=None, timewait=None, binary=None,
+                         stderr=None, mocktime=self.mocktime, coverage_dir=None))
+            self.nodes[i].args = args
+            self.nodes[i].start()
+
+        # Wait for RPC connections to be ready
+        with timeprofile.section("node startup"):
+            map_nodes(lambda node: node.wait_for_rpc_connection(), self.nodes)
+
+        # Create a 200-block-long chain; each of the 4 first nodes
+        # gets 25 mature blocks and 25 immature.
+        # Note: To preserve compatibility with older versions of
+        # initialize_chain, only 4 nodes will generate coins.
+        #
+        # blocks are created with timestamps 10 minutes apart
+        # starting from 2010 minutes in the past
+        self.enable_mocktime()
+        block_time = self.mocktime - (201 * 1 * 60)
+        for i in range(2):
+            for peer in range(4):
+                for _ in range(25):
+                    set_node_times(self.nodes, block_time)
+                    self.nodes[peer].generate(1)
+                    block_time += 1 * 60
+                # Must sync before next peer starts generating blocks
+                sync_blocks(self.nodes)
+
+        # Shut them down, and clean up cache directories:
+        self.stop_nodes()
+        self.nodes = []
+        self.disable_mocktime()
+        for i in range(MAX_NODES):
+            os.remove(log_filename(cache_dir, i, "debug.log"))
+            os.remove(log_filename(cache_dir, i, "db.log"))
+            os.remove(log_filename(cache_dir, i, "peers.dat"))
+            os.remove(log_filename(cache_dir, i, "fee_estimates.dat"))
+
+    def _initialize_chain_from_fixture(self):
+        """Initialize the chain state declared by self.fixture for use by the test.
+
+        The fixture is built once per binary, num_nodes, extra_args and
+        fixture parameters and then cloned from the chain cache."""
+        fixture = get_fixture(self.fixture)
+        params = fixture.params(self.fixture_params)
+        extra_args = getattr(self, "extra_args", None) or [[]] * self.num_nodes
+        cache = ChainCache(self.options.cachedir)
+        key = cache.key(os.getenv("EVRMORED", "evrmored"), {
+            'fixture': self.fixture,
+            'params': params,
+            'nodes': self.num_nodes,
+            'extra_args': extra_args,
+            # Rebuild before the tip gets old enough to count as initial block download
+            'epoch': int(time.time() // FIXTURE_MAX_AGE),
+        })
+        fixture_dir = cache.get(key, lambda cache_dir: self._create_fixture(fixture, params, extra_args, cache_dir))
 
         for i in range(self.num_nodes):
-            from_dir = os.path.join(self.options.cachedir, "node" + str(i))
-            to_dir = os.path.join(self.options.tmpdir, "node" + str(i))
-            shutil.copytree(from_dir, to_dir)
+            counts = clone_tree(os.path.join(fixture_dir, "node" + str(i)), os.path.join(self.options.tmpdir, "node" + str(i)))
+            self.log.debug("Cloned node%d from fixture %s (%s): %s" % (i, self.fixture, key, counts))
             initialize_data_dir(self.options.tmpdir, i)  # Overwrite port/rpcport in evrmore.conf
 
+    def _create_fixture(self, fixture, params, extra_args, cache_dir):
+        """Build fixture on a clean chain of num_nodes nodes under cache_dir."""
+        self.log.info("Building fixture %s %s" % (fixture.name, params))
+        for i in range(self.num_nodes):
+            initialize_data_dir(cache_dir, i)
+            self.nodes.append(
+                TestNode(i, cache_dir, extra_args=extra_args[i], rpchost=None, timewait=None, binary=None,
+                         stderr=None, mocktime=self.mocktime, coverage_dir=None))
+        self.start_nodes()
+        for i in range(self.num_nodes - 1):
+            connect_nodes_bi(self.nodes, i, i + 1)
+        self.sync_all()
+
+        fixture.build(self, **params)
+
+        self.stop_nodes()
+        self.nodes = []
+        for i in range(self.num_nodes):
+            for filename in ("debug.log", "db.log", "peers.dat", "fee_estimates.dat"):
+                if os.path.exists(log_filename(cache_dir, i, filename)):
+                    os.remove(log_filename(cache_dir, i, filename))
+
     def _initialize_chain_clean(self):
         """Initialize empty blockchain for use by the test.
 
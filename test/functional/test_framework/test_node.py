@@ -6,6 +6,7 @@
 
 """Class for evrmored node under test"""
 
+import contextlib
 import decimal
 import errno
 import http.client
@@ -13,13 +14,23 @@ import json
 import logging
 import os
 import re
+import socket
 import subprocess
 import time
 
-from .util import assert_equal, get_rpc_proxy, rpc_url, wait_until
+from .util import assert_equal, get_auth_cookie, get_rpc_proxy, rpc_port, rpc_url
 from .authproxy import JSONRPCException, AuthServiceProxy
+from .logwatch import LogWatcher
+from . import timeprofile, tracing
 
 EVRMORED_PROC_WAIT_TIMEOUT = 60
+# Logged by evrmored at the very end of its initialization
+INIT_DONE_MARKER = "init message: Done Loading"
+# Bounds of the backoff while waiting for a node to come up
+STARTUP_POLL_MIN = 0.005
+STARTUP_POLL_MAX = 0.05
+# Until the init marker shows up, probe the RPC interface at most this often
+RPC_PROBE_INTERVAL = 0.25
 
 
 class TestNode:
@@ -34,9 +45,9 @@ class TestNode:
     To make things easier for the test writer, a bit of magic is happening under the covers.
     Any unrecognised messages will be dispatched to the RPC connection."""
 
-    def __init__(self, i, dirname, extra_args, rpchost, timewait, binary, stderr, mocktime, coverage_dir):
+    def __init__(self, i, dirname, extra_args, rpchost, timewait, binary, stderr, mocktime, coverage_dir, rpc_stats=None, datadir=None):
         self.index = i
-        self.datadir = os.path.join(dirname, "node" + str(i))
+        self.datadir = datadir or os.path.join(dirname, "node" + str(i))
         self.rpchost = rpchost
         if timewait:
             self.rpc_timeout = timewait
@@ -49,6 +60,7 @@ class TestNode:
             self.binary = binary
         self.stderr = stderr
         self.coverage_dir = coverage_dir
+        self.rpc_stats = rpc_stats
         # Most callers will just need to add extra args to the standard list below. For those callers that need more flexibility, they can just set the args property directly.
         self.extra_args = extra_args
         self.args = [self.binary, "-datadir=" + self.datadir, "-server", "-keypool=2", "-discover=0", "-rest", "-logtimemicros", "-debug", "-debugexclude=libevent", "-debugexclude=leveldb", "-bip44=1", "-mocktime=" + str(mocktime), "-uacomment=testnode%d" % i]
@@ -58,6 +70,12 @@ class TestNode:
         self.running = False
         AuthServiceProxy.running = False
         self.process = None
+        self.debug_log = os.path.join(self.datadir, "regtest", "debug.log")
+        self.startup_log_offset = 0
+        # When the node was last asked to start or stop, for --trace
+        self.lifecycle_start = None
+        # Reads debug.log from where the node was last started, see wait_for_log()
+        self.log_watcher = LogWatcher(self.debug_log)
         self.rpc_connected = False
         self.rpc = None
         self.url = None
@@ -80,54 +98,103 @@ class TestNode:
         assert self.rpc_connected and self.rpc is not None, "Error: no RPC connection"
         return self.rpc.__getattr__(*args, **kwargs)
 
+    @timeprofile.profiled("node startup")
     def start(self, extra_args=None, stderr=None):
         """Start the node."""
         if extra_args is None:
             extra_args = self.extra_args
         if stderr is None:
             stderr = self.stderr
+        # debug.log is appended to across restarts; only look at what this run writes
+        try:
+            self.startup_log_offset = os.path.getsize(self.debug_log)
+        except OSError:
+            self.startup_log_offset = 0
+        self.log_watcher = LogWatcher(self.debug_log, self.startup_log_offset)
+        self.lifecycle_start = time.time()
         self.process = subprocess.Popen(self.args + extra_args, stderr=stderr)
         self.running = True
         AuthServiceProxy.running = True
         self.log.debug("evrmored started, waiting for RPC to come up")
 
+    @timeprofile.profiled("node startup")
     def wait_for_rpc_connection(self):
-        """Sets up an RPC connection to the evrmored process. Returns False if unable to connect."""
-        # Poll at a rate of four times per second
-        poll_per_s = 4
-        for _ in range(poll_per_s * self.rpc_timeout):
+        """Sets up an RPC connection to the evrmored process once it has finished initializing.
+
+        Readiness is detected from the init marker in debug.log. Until it
+        shows up the RPC interface is probed too, but only once the RPC port
+        is open and the credentials (cookie file or evrmore.conf) exist."""
+        deadline = time.time() + self.rpc_timeout
+        startup_log = LogWatcher(self.debug_log, self.startup_log_offset)
+        next_probe = 0
+        delay = STARTUP_POLL_MIN
+        while time.time() < deadline:
             assert self.process.poll() is None, "evrmored exited with status %i during initialization" % self.process.returncode
-            try:
-                self.rpc = get_rpc_proxy(rpc_url(self.datadir, self.index, self.rpchost), self.index, timeout=self.rpc_timeout, coverage_dir=self.coverage_dir)
-                self.rpc.getblockcount()
-                # If the call to getblockcount() succeeds then the RPC connection is up
-                self.rpc_connected = True
-                self.url = self.rpc.url
-                self.log.debug("RPC successfully started")
-                return
-            except IOError as e:
-                if e.errno != errno.ECONNREFUSED:  # Port not yet open?
-                    raise  # unknown IO error
-            except JSONRPCException as e:  # Initialization phase
-                if e.error['code'] != -28:  # RPC in warmup?
-                    raise  # unknown JSON RPC exception
-            except ValueError as e:  # cookie file not found and no rpcuser or rpcassword. evrmored still starting
-                if "No RPC credentials" not in str(e):
-                    raise
-            time.sleep(1.0 / poll_per_s)
+            ready = any(INIT_DONE_MARKER in event.message for event in startup_log.read())
+            if ready or (time.time() >= next_probe and self._rpc_port_open() and self._has_credentials()):
+                next_probe = time.time() + RPC_PROBE_INTERVAL
+                if self._try_rpc_connection():
+                    self._trace_lifecycle("startup")
+                    return
+            time.sleep(delay)
+            delay = min(delay * 2, STARTUP_POLL_MAX)
         raise AssertionError("Unable to connect to evrmored")
 
+    def _rpc_port_open(self):
+        if self.rpchost:
+            return True
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+            return sock.connect_ex(("127.0.0.1", rpc_port(self.index))) == 0
+
+    def _has_credentials(self):
+        try:
+            get_auth_cookie(self.datadir)
+            return True
+        except ValueError:
+            return False
+
+    def _try_rpc_connection(self):
+        """Connect to the RPC interface. Returns False if the node is still starting up."""
+        try:
+            self.rpc = get_rpc_proxy(rpc_url(self.datadir, self.index, self.rpchost), self.index, timeout=self.rpc_timeout, coverage_dir=self.coverage_dir, rpc_stats=self.rpc_stats)
+            self.rpc.getblockcount()
+            # If the call to getblockcount() succeeds then the RPC connection is up
+            self.rpc_connected = True
+            self.url = self.rpc.url
+            self.log.debug("RPC successfully started")
+            return True
+        except IOError as e:
+            if e.errno != errno.ECONNREFUSED:  # Port not yet open?
+                raise  # unknown IO error
+        except JSONRPCException as e:  # Initialization phase
+            if e.error['code'] != -28:  # RPC in warmup?
+                raise  # unknown JSON RPC exception
+        except ValueError as e:  # cookie file not found and no rpcuser or rpcassword. evrmored still starting
+            if "No RPC credentials" not in str(e):
+                raise
+        return False
+
+    def attach(self):
+        """Connect to an evrmored that is already running on this datadir (see nodepool.py) instead of starting one.
+
+        The node is not stopped at the end of the test."""
+        if not self._try_rpc_connection():
+            raise AssertionError("Unable to connect to evrmored")
+        self.log_watcher.mark()
+
     def get_wallet_rpc(self, wallet_name):
         assert self.rpc_connected
         assert self.rpc
         wallet_path = "wallet/%s" % wallet_name
         return self.rpc / wallet_path
 
+    @timeprofile.profiled("node shutdown")
     def stop_node(self):
         """Stop the node."""
         if not self.running:
             return
         self.log.debug("Stopping node")
+        self.lifecycle_start = time.time()
         try:
             self.stop()
         except http.client.CannotSendRequest:
@@ -154,33 +221,44 @@ class TestNode:
         self.log.debug("Node stopped")
         return True
 
+    @timeprofile.profiled("node shutdown")
     def wait_until_stopped(self, timeout=EVRMORED_PROC_WAIT_TIMEOUT):
-        wait_until(self.is_node_stopped, err_msg="Wait until Stopped", timeout=timeout)
-
+        if self.running:
+            try:
+                self.process.wait(timeout)
+            except subprocess.TimeoutExpired:
+                raise AssertionError("Wait until Stopped: node%d still running after %d seconds" % (self.index, timeout))
+            self._trace_lifecycle("shutdown")
+        self.is_node_stopped()
+
+    def _trace_lifecycle(self, name):
+        """Record the startup or shutdown that began at lifecycle_start in the --trace timeline."""
+        tracer = tracing.get_tracer()
+        if tracer is not None and self.lifecycle_start is not None:
+            tracer.complete("node%d" % self.index, "lifecycle", name, self.lifecycle_start, time.time())
+        self.lifecycle_start = None
+
+    @timeprofile.profiled("wait_for_log", wait=True)
+    def wait_for_log(self, pattern, timeout=60):
+        """Wait for a debug.log line matching the regular expression pattern and return it as a LogEvent.
+
+        Only looks at lines logged since the node was started that no
+        earlier call has consumed."""
+        return self.log_watcher.wait_for_log(pattern, timeout)
+
+    @contextlib.contextmanager
     def assert_debug_log(self, expected_msgs, timeout=2):
-        time_end = time.time() + timeout
-        debug_log = os.path.join(self.datadir, self.chain, 'debug.log')
-        with open(debug_log, encoding='utf-8') as dl:
-            dl.seek(0, 2)
-            prev_size = dl.tell()
+        """Assert that each of expected_msgs is logged while the with block runs (or up to timeout seconds later).
+
+        A message ending in a newline must end a log line."""
+        watcher = LogWatcher(self.debug_log)
+        watcher.mark()
 
         yield
 
-        while True:
-            found = True
-            with open(debug_log, encoding='utf-8') as dl:
-                dl.seek(prev_size)
-                log = dl.read()
-            print_log = " - " + "\n - ".join(log.splitlines())
-            for expected_msg in expected_msgs:
-                if re.search(re.escape(expected_msg), log, flags=re.MULTILINE) is None:
-                    found = False
-            if found:
-                return
-            if time.time() >= time_end:
-                break
-            time.sleep(0.05)
-        self._raise_assertion_error('Expected messages "{}" does not partially match log:\n\n{}\n\n'.format(str(expected_msgs), print_log))
+        patterns = [re.escape(msg.rstrip("\n")) + ("$" if msg.endswith("\n") else "") for msg in expected_msgs]
+        with timeprofile.section("wait_for_log", wait=True):
+            watcher.wait_for(patterns, timeout)
 
     def node_encrypt_wallet(self, passphrase):
         """"Encrypts the wallet.
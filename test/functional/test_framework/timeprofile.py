@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# Copyright (c) 2017-2020 The Raven Core developers
+# Distributed under the MIT software license, see the accompanying
+# file COPYING or http://www.opensource.org/licenses/mit-license.php.
+
+"""Wall-time attribution for a test run (--timeprofile).
+
+The framework marks the sections of a test where it waits on something:
+node startup and shutdown, RPC calls, wait_until, the sync_* helpers and
+mininode waits. Only the outermost section on the main thread is charged, so
+an RPC made while polling in wait_until counts as waiting. Time outside of
+any section is split into Python CPU time of the main thread and the rest
+(idle, e.g. sleeping).
+
+Totals are kept per phase (setup_chain, setup_network, run_test, shutdown),
+category and detail, and written as folded stacks that flamegraph.pl and
+speedscope read directly:
+
+    run_test;rpc;generate 1234567
+
+The unit is microseconds. Waits are also recorded per call site in test code,
+so the slowest wait_until/sync_*/mininode calls can be reported by file and line.
+"""
+
+from collections import defaultdict
+import functools
+import os
+import sys
+import threading
+import time
+
+# Waits called from these files are attributed to their caller
+FRAMEWORK_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class _NoopSection:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP = _NoopSection()
+
+
+class _Section:
+    __slots__ = ("profile", "category", "detail", "site", "outermost")
+
+    def __init__(self, profile, category, detail, site):
+        self.profile = profile
+        self.category = category
+        self.detail = detail
+        self.site = site
+
+    def __enter__(self):
+        self.outermost = self.profile.depth == 0
+        self.profile.depth += 1
+        if self.outermost:
+            self.profile.account_gap()
+        return self
+
+    def __exit__(self, *exc):
+        self.profile.depth -= 1
+        if self.outermost:
+            elapsed = self.profile.account_gap(charge_gap=False)
+            self.profile.record(self.category, self.detail, elapsed, self.site)
+        return False
+
+
+class TimeProfile:
+    """Wall-time totals of one test process."""
+
+    def __init__(self):
+        self.phase = "init"
+        self.depth = 0
+        self.stacks = defaultdict(float)
+        self.sites = defaultdict(lambda: [0, 0.0])
+        self.start_time = time.perf_counter()
+        self.last_wall = self.start_time
+        self.last_cpu = time.thread_time()
+
+    def account_gap(self, charge_gap=True):
+        """Close the interval since the last section boundary. Returns its length.
+
+        If charge_gap, the interval was spent outside of any section and is
+        charged to Python CPU / idle."""
+        now_wall = time.perf_counter()
+        now_cpu = time.thread_time()
+        gap = now_wall - self.last_wall
+        if charge_gap:
+            cpu = min(now_cpu - self.last_cpu, gap)
+            self.stacks[(self.phase, "python", None)] += cpu
+            self.stacks[(self.phase, "idle", None)] += gap - cpu
+        self.last_wall = now_wall
+        self.last_cpu = now_cpu
+        return gap
+
+    def set_phase(self, phase):
+        self.account_gap()
+        self.phase = phase
+
+    def record(self, category, detail, elapsed, site):
+        self.stacks[(self.phase, category, detail)] += elapsed
+        if site is not None:
+            entry = self.sites[(category, detail, site)]
+            entry[0] += 1
+            entry[1] += elapsed
+
+    def finish(self):
+        self.account_gap()
+
+    def categories(self):
+        """Return a dict of category to total seconds."""
+        totals = defaultdict(float)
+        for (_, category, _), elapsed in self.stacks.items():
+            totals[category] += elapsed
+        return totals
+
+    def total_time(self):
+        return self.last_wall - self.start_time
+
+    def top_waits(self, top=10):
+        """Return the slowest wait call sites as (category, detail, site, count, total seconds)."""
+        waits = [(category, detail, site, count, elapsed) for (category, detail, site), (count, elapsed) in self.sites.items()]
+        return sorted(waits, key=lambda wait: wait[4], reverse=True)[:top]
+
+    def write_folded(self, filename):
+        """Write the totals as folded stacks (microseconds) for flame graph tools."""
+        with open(filename, 'w', encoding='utf8') as f:
+            for (phase, category, detail), elapsed in sorted(self.stacks.items(), key=lambda item: [str(part) for part in item[0]]):
+                frames = [phase, category] + ([detail] if detail is not None else [])
+                f.write("%s %d\n" % (";".join(frame.replace(";", ":").replace(" ", "_") for frame in frames), round(elapsed * 1e6)))
+
+    def format_report(self, top=10):
+        total = self.total_time() or 1
+        lines = ["%-24s %10s %7s" % ("CATEGORY", "TIME(s)", "SHARE")]
+        for category, elapsed in sorted(self.categories().items(), key=lambda item: item[1], reverse=True):
+            lines.append("%-24s %10.3f %6.1f%%" % (category, elapsed, 100 * elapsed / total))
+        lines.append("%-24s %10.3f" % ("total", self.total_time()))
+        waits = self.top_waits(top)
+        if waits:
+            lines.append("")
+            lines.append("%-40s %-32s %6s %10s" % ("WAIT", "CALLED FROM", "COUNT", "TIME(s)"))
+            for category, detail, site, count, elapsed in waits:
+                name = category if detail is None else "%s:%s" % (category, detail)
+                lines.append("%-40s %-32s %6d %10.3f" % (name, site, count, elapsed))
+        return "\n".join(lines)
+
+
+# The profile of this process, if --timeprofile is enabled
+_profile = None
+
+
+def enable():
+    global _profile
+    _profile = TimeProfile()
+    return _profile
+
+
+def get_profile():
+    return _profile
+
+
+def set_phase(phase):
+    if _profile is not None:
+        _profile.set_phase(phase)
+
+
+def _call_site():
+    """Return file:line of the innermost caller outside of the test framework."""
+    frame = sys._getframe(2)
+    while frame is not None and os.path.dirname(os.path.abspath(frame.f_code.co_filename)) == FRAMEWORK_DIR:
+        frame = frame.f_back
+    if frame is None:
+        return "?"
+    return "%s:%d" % (os.path.basename(frame.f_code.co_filename), frame.f_lineno)
+
+
+def section(category, detail=None, wait=False):
+    """Context manager charging the enclosed wall time to category (and detail).
+
+    For waits, the call site in test code is recorded too. This is a no-op
+    unless profiling is enabled, and on threads other than the main thread."""
+    if _profile is None or threading.current_thread() is not threading.main_thread():
+        return _NOOP
+    return _Section(_profile, category, detail, _call_site() if wait and _profile.depth == 0 else None)
+
+
+def profiled(category, wait=False):
+    """Decorator charging every call of the function to category."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with section(category, wait=wait):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# Copyright (c) 2017-2020 The Raven Core developers
+# Distributed under the MIT software license, see the accompanying
+# file COPYING or http://www.opensource.org/licenses/mit-license.php.
+
+"""Timeline of a test run in Chrome trace event format (--trace).
+
+The file can be opened in chrome://tracing or https://ui.perfetto.dev. The
+test process and each node get a track of their own:
+
+- test: sync_* waits
+- nodeN/rpc: RPC calls made to the node, with their duration
+- nodeN/p2p: messages sent to and received from the node by mininode
+- nodeN/lifecycle: startup and shutdown
+- nodeN/log: UpdateTip events and, with -debug=bench, the block connect
+  phases, read from the node's debug.log at the end of the test
+
+Timestamps are wall-clock times, so events from debug.log line up with the
+ones recorded in the test process.
+"""
+
+import functools
+import json
+import threading
+import time
+
+from .benchlog import UPDATE_TIP, parse_bench_line
+from .logwatch import LogWatcher
+
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+class _Span:
+    __slots__ = ("tracer", "process", "thread", "name", "args", "start")
+
+    def __init__(self, tracer, process, thread, name, args):
+        self.tracer = tracer
+        self.process = process
+        self.thread = thread
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.complete(self.process, self.thread, self.name, self.start, time.time(), self.args)
+        return False
+
+
+class Tracer:
+    """Trace events of one test process."""
+
+    def __init__(self):
+        self.start_time = time.time()
+        self.events = []
+        self.pids = {}
+        self.tids = {}
+        self.lock = threading.Lock()
+
+    def _ids(self, process, thread):
+        with self.lock:
+            if process not in self.pids:
+                self.pids[process] = len(self.pids)
+            if (process, thread) not in self.tids:
+                self.tids[(process, thread)] = len(self.tids)
+            return self.pids[process], self.tids[(process, thread)]
+
+    def complete(self, process, thread, name, start, end, args=None):
+        """Record an event that lasted from start to end (seconds since the epoch)."""
+        pid, tid = self._ids(process, thread)
+        event = {'ph': 'X', 'name': name, 'pid': pid, 'tid': tid, 'ts': start * 1e6, 'dur': (end - start) * 1e6}
+        if args:
+            event['args'] = args
+        self.events.append(event)
+
+    def instant(self, process, thread, name, timestamp=None, args=None):
+        pid, tid = self._ids(process, thread)
+        event = {'ph': 'i', 's': 't', 'name': name, 'pid': pid, 'tid': tid, 'ts': (timestamp or time.time()) * 1e6}
+        if args:
+            event['args'] = args
+        self.events.append(event)
+
+    def add_node_log(self, process, debug_log):
+        """Add the UpdateTip and bench events that debug_log has for the time since the test started."""
+        for event in LogWatcher(debug_log).read():
+            if event.time is None or event.time < self.start_time:
+                continue
+            match = UPDATE_TIP.search(event.message)
+            if match:
+                self.instant(process, "log", "UpdateTip", event.time, {'height': int(match.group(2)), 'hash': match.group(1)})
+                continue
+            line = parse_bench_line(event.message)
+            if line is not None:
+                # Phases are logged when they end
+                self.complete(process, "log", line.phase, event.time - line.milliseconds / 1e3, event.time,
+                              dict(line.counts, level=line.level))
+
+    def write(self, filename):
+        metadata = []
+        for process, pid in self.pids.items():
+            metadata.append({'ph': 'M', 'name': 'process_name', 'pid': pid, 'args': {'name': process}})
+            metadata.append({'ph': 'M', 'name': 'process_sort_index', 'pid': pid, 'args': {'sort_index': pid}})
+        for (process, thread), tid in self.tids.items():
+            metadata.append({'ph': 'M', 'name': 'thread_name', 'pid': self.pids[process], 'tid': tid, 'args': {'name': thread}})
+        with open(filename, 'w', encoding='utf8') as f:
+            json.dump({'traceEvents': metadata + self.events, 'displayTimeUnit': 'ms'}, f)
+
+
+# The tracer of this process, if --trace is enabled
+_tracer = None
+
+
+def enable():
+    global _tracer
+    _tracer = Tracer()
+    return _tracer
+
+
+def get_tracer():
+    return _tracer
+
+
+def instant(process, thread, name, args=None):
+    if _tracer is not None:
+        _tracer.instant(process, thread, name, args=args)
+
+
+def span(process, thread, name, args=None):
+    """Context manager recording the enclosed block as an event. A no-op unless tracing is enabled."""
+    if _tracer is None:
+        return _NOOP
+    return _Span(_tracer, process, thread, name, args)
+
+
+def traced(process, thread, name=None):
+    """Decorator recording every call of the function as an event."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(process, thread, name or func.__name__):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# Copyright (c) 2017-2020 The Raven Core developers
+# Distributed under the MIT software license, see the accompanying
+# file COPYING or http://www.opensource.org/licenses/mit-license.php.
+
+"""Build and sign transactions without a wallet.
+
+TxBuilder spends P2PKH (optionally asset-tagged), P2SH-multisig and
+P2SH-P2WPKH outputs with ECKeys and pays to arbitrary scripts, including
+asset transfers. Signatures use RFC6979 nonces like the node's wallet does,
+so the result is byte-identical to what signrawtransaction returns for the
+same unsigned transaction and keys.
+
+sign_transactions() signs many builders at once and spreads the ECDSA work
+over a process pool (see key.sign_many()):
+
+    builders = []
+    for utxo in utxos:
+        builder = TxBuilder()
+        builder.add_p2pkh_input(utxo.txid, utxo.vout, key)
+        builder.add_output(p2pkh_script(hash160(pubkey)), utxo.value - fee)
+        builders.append(builder)
+    sign_transactions(builders)
+    node.sendrawtransaction(builders[0].serialize())
+"""
+
+from .key import sign_many
+from .messages import COutPoint, CScriptTransfer, CTransaction, CTxIn, CTxInWitness, CTxOut
+from .script import (
+    CScript,
+    CScriptOp,
+    hash160,
+    OP_0,
+    OP_CHECKMULTISIG,
+    OP_CHECKSIG,
+    OP_DROP,
+    OP_DUP,
+    OP_EQUAL,
+    OP_EQUALVERIFY,
+    OP_EVR_ASSET,
+    OP_HASH160,
+    SighashCache,
+    SIGHASH_ALL,
+)
+from .util import bytes_to_hex_str
+
+P2PKH = "p2pkh"
+P2SH_MULTISIG = "p2sh-multisig"
+P2SH_P2WPKH = "p2sh-p2wpkh"
+
+
+def p2pkh_script(pubkey_hash):
+    return CScript([OP_DUP, OP_HASH160, pubkey_hash, OP_EQUALVERIFY, OP_CHECKSIG])
+
+
+def p2sh_script(redeem_script):
+    return CScript([OP_HASH160, hash160(redeem_script), OP_EQUAL])
+
+
+def multisig_redeem_script(nrequired, pubkeys):
+    return CScript([CScriptOp.encode_op_n(nrequired)] + list(pubkeys) + [CScriptOp.encode_op_n(len(pubkeys)), OP_CHECKMULTISIG])
+
+
+def p2sh_p2wpkh_redeem_script(pubkey):
+    return CScript([OP_0, hash160(pubkey)])
+
+
+def asset_transfer_script(script_pub_key, asset_name, asset_amount):
+    """Append an asset transfer of asset_amount (in satoshis) of asset_name to a destination script."""
+    transfer = CScriptTransfer()
+    transfer.name = asset_name.encode('ascii') if isinstance(asset_name, str) else asset_name
+    transfer.amount = asset_amount
+    return CScript(bytes(script_pub_key) + bytes(CScript([OP_EVR_ASSET, b'evrt' + transfer.serialize(), OP_DROP])))
+
+
+class TxBuilder:
+    """Builds one transaction and signs each of its inputs with its hash type (SIGHASH_ALL by default)."""
+
+    def __init__(self, version=2, locktime=0):
+        # Same defaults as createrawtransaction
+        self.tx = CTransaction()
+        self.tx.nVersion = version
+        self.tx.nLockTime = locktime
+        self.spends = []
+
+    def _add_input(self, txid, vout, sequence):
+        self.tx.vin.append(CTxIn(COutPoint(int(txid, 16), vout), b"", sequence))
+
+    def add_p2pkh_input(self, txid, vout, key, script_pub_key=None, sequence=0xffffffff, hash_type=SIGHASH_ALL):
+        """Spend a P2PKH output. Pass the scriptPubKey when it carries an asset."""
+        pubkey = key.get_pubkey().get_bytes()
+        if script_pub_key is None:
+            script_pub_key = p2pkh_script(hash160(pubkey))
+        self._add_input(txid, vout, sequence)
+        self.spends.append((P2PKH, [key], CScript(script_pub_key), None, hash_type))
+
+    def add_p2sh_multisig_input(self, txid, vout, keys, redeem_script, sequence=0xffffffff, hash_type=SIGHASH_ALL):
+        """Spend a P2SH-multisig output, signing with the first nrequired of keys in redeem script order."""
+        redeem_script = CScript(redeem_script)
+        elements = list(redeem_script)
+        nrequired = elements[0]  # iterating a CScript decodes OP_N to N
+        keys_by_pubkey = {key.get_pubkey().get_bytes(): key for key in keys}
+        signers = [keys_by_pubkey[pubkey] for pubkey in elements[1:-2] if pubkey in keys_by_pubkey][:nrequired]
+        assert len(signers) == nrequired, "need %d of the multisig keys, got %d" % (nrequired, len(signers))
+        self._add_input(txid, vout, sequence)
+        self.spends.append((P2SH_MULTISIG, signers, redeem_script, None, hash_type))
+
+    def add_p2sh_p2wpkh_input(self, txid, vout, key, amount, sequence=0xffffffff, hash_type=SIGHASH_ALL):
+        """Spend a P2SH-P2WPKH output of amount satoshis."""
+        self._add_input(txid, vout, sequence)
+        self.spends.append((P2SH_P2WPKH, [key], p2pkh_script(hash160(key.get_pubkey().get_bytes())), amount, hash_type))
+
+    def add_output(self, script_pub_key, value):
+        """Pay value satoshis to script_pub_key."""
+        self.tx.vout.append(CTxOut(value, bytes(script_pub_key)))
+
+    def add_asset_transfer_output(self, script_pub_key, asset_name, asset_amount):
+        self.add_output(asset_transfer_script(script_pub_key, asset_name, asset_amount), 0)
+
+    def signing_jobs(self):
+        """Return a (key, sighash) pair per signature needed, in input order."""
+        jobs = []
+        cache = SighashCache(self.tx)
+        for i, (kind, keys, script_code, amount, hash_type) in enumerate(self.spends):
+            if kind == P2SH_P2WPKH:
+                sighash = cache.segwit_version1_signature_hash(script_code, i, hash_type, amount)
+            else:
+                sighash = cache.signature_hash(script_code, i, hash_type)[0]
+            jobs.extend((key, sighash) for key in keys)
+        return jobs
+
+    def finalize(self, signatures):
+        """Fill in the scriptSigs and witnesses from signatures, as returned by sign_many() for signing_jobs()."""
+        signatures = iter(signatures)
+        witnesses = []
+        for txin, (kind, keys, script_code, _, hash_type) in zip(self.tx.vin, self.spends):
+            sigs = [next(signatures) + bytes([hash_type]) for _ in keys]
+            witness = CTxInWitness()
+            if kind == P2PKH:
+                txin.scriptSig = CScript([sigs[0], keys[0].get_pubkey().get_bytes()])
+            elif kind == P2SH_MULTISIG:
+                txin.scriptSig = CScript([OP_0] + sigs + [script_code])
+            else:
+                pubkey = keys[0].get_pubkey().get_bytes()
+                txin.scriptSig = CScript([p2sh_p2wpkh_redeem_script(pubkey)])
+                witness.scriptWitness.stack = [sigs[0], pubkey]
+            witnesses.append(witness)
+        self.tx.wit.vtxinwit = witnesses
+        self.tx.rehash()
+        return self.tx
+
+    def sign(self):
+        return self.finalize(sign_many(self.signing_jobs(), processes=1))
+
+    def serialize(self):
+        """Return the transaction as a hex string, with witness data if it has any."""
+        return bytes_to_hex_str(self.tx.serialize_with_witness())
+
+
+def sign_transactions(builders, processes=None):
+    """Sign all builders, in a pool of processes (default: one per CPU) if there is enough work.
+
+    Returns the signed CTransactions in order."""
+    jobs = [builder.signing_jobs() for builder in builders]
+    flat_jobs = [job for builder_jobs in jobs for job in builder_jobs]
+    signatures = sign_many(flat_jobs, processes=processes)
+    signed = []
+    start = 0
+    for builder, builder_jobs in zip(builders, jobs):
+        signed.append(builder.finalize(signatures[start:start + len(builder_jobs)]))
+        start += len(builder_jobs)
+    return signed
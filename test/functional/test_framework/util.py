@@ -10,6 +10,7 @@ from base64 import b64encode
 from binascii import hexlify, unhexlify
 from datetime import datetime, timezone
 from decimal import Decimal, ROUND_DOWN
+import fcntl
 import hashlib
 import json
 import logging
@@ -18,10 +19,13 @@ import random
 import re
 import subprocess
 from subprocess import CalledProcessError
+import tempfile
 import time
 import socket
+import sys
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import closing
-from . import coverage
+from . import coverage, timeprofile, tracing
 from .authproxy import AuthServiceProxy, JSONRPCException
 
 logger = logging.getLogger("TestFramework.utils")
@@ -291,16 +295,22 @@ def wait_until(predicate, *, err_msg, attempts=float('inf'), timeout=float('inf'
     attempt = 0
     timeout += time.time()
 
-    while attempt < attempts and time.time() < timeout:
-        if lock:
-            with lock:
+    caller = sys._getframe(1).f_code
+    if os.path.basename(caller.co_filename) == "mininode.py":
+        profile_section = timeprofile.section("mininode", caller.co_name, wait=True)
+    else:
+        profile_section = timeprofile.section("wait_until", wait=True)
+    with profile_section:
+        while attempt < attempts and time.time() < timeout:
+            if lock:
+                with lock:
+                    if predicate():
+                        return
+            else:
                 if predicate():
                     return
-        else:
-            if predicate():
-                return
-        attempt += 1
-        time.sleep(0.05)
+            attempt += 1
+            time.sleep(0.05)
 
     # Print the cause of the timeout
     assert_greater_than(attempts, attempt, err_msg + " ~~ Exceeded Attempts")
@@ -312,50 +322,111 @@ def wait_until(predicate, *, err_msg, attempts=float('inf'), timeout=float('inf'
 #                       RPC/P2P connection constants and functions
 ##########################################################################################
 
-# The maximum number of nodes a single test can spawn
+# The number of nodes the pre-mined chain cache is created for
 MAX_NODES = 8
 # Don't assign rpc or p2p ports lower than this
 PORT_MIN = 11000
 # The number of ports to "reserve" for p2p and rpc, each
 PORT_RANGE = 5000
-# List to store P2P ports
-p2p_ports = [-1, -1, -1, -1, -1, -1, -1, -1]
-# List to store RPC ports
-rpc_ports = [-1, -1, -1, -1, -1, -1, -1, -1]
+# Ports handed out to the nodes of this process, by node number
+p2p_ports = {}
+rpc_ports = {}
 
 
-class PortSeed:
-    # Must be initialized with a unique integer for each process
-    n = None
-
-
-def find_free_port():
+class PortBroker:
     """
-    Ask the system for a free port.
-    In case of error return error message.
-    :return: {Tuple}
+    Hands out free ports, coordinating with the other test processes on this host.
+
+    A port is claimed by taking an exclusive flock on a file named after it in
+    lock_dir and holding it until the port is released. The kernel drops the
+    lock when a process dies, so ports of crashed tests are never leaked.
+    Ports are picked from [PORT_MIN, PORT_MIN + 2 * PORT_RANGE), below the
+    ephemeral range, and must also be bindable when they are handed out.
     """
-    port = None
-    error = {}
+
+    def __init__(self, lock_dir):
+        self.lock_dir = lock_dir
+        self.locks = {}
+        os.makedirs(lock_dir, exist_ok=True)
+
+    def _lock(self, port):
+        """Try to claim port. Returns the open lock file descriptor, or None if somebody else holds it."""
+        path = os.path.join(self.lock_dir, "port.%d" % port)
+        fd = os.open(path, os.O_CREAT | os.O_RDWR)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            # The previous owner may have removed the file between our open and flock
+            if os.fstat(fd).st_ino == os.stat(path).st_ino:
+                return fd
+        except (BlockingIOError, FileNotFoundError):
+            pass
+        os.close(fd)
+        return None
+
+    def allocate(self):
+        for _ in range(2 * PORT_RANGE):
+            port = random.randrange(PORT_MIN, PORT_MIN + 2 * PORT_RANGE)
+            if port in self.locks:
+                continue
+            fd = self._lock(port)
+            if fd is None:
+                continue
+            self.locks[port] = fd
+            if port_is_free(port):
+                return port
+            self.release(port)
+        raise RuntimeError("No free port left between %d and %d" % (PORT_MIN, PORT_MIN + 2 * PORT_RANGE))
+
+    def release(self, port):
+        fd = self.locks.pop(port)
+        os.remove(os.path.join(self.lock_dir, "port.%d" % port))
+        os.close(fd)
+
+    def release_all(self):
+        for port in list(self.locks):
+            self.release(port)
+
+
+# Set up by the test framework (--portdir); created on first use otherwise
+port_broker = None
+
+
+def get_port_broker():
+    global port_broker
+    if port_broker is None:
+        port_broker = PortBroker(os.path.join(tempfile.gettempdir(), "evrmore_test_ports"))
+    return port_broker
+
+
+def port_is_free(port):
+    """Check that nothing on this host is bound to port."""
     with closing(socket.socket(socket.AF_INET, socket.SOCK_STREAM)) as s:
         try:
-            s.bind(('', 0))
-            sock_name = s.getsockname()
-            if type(sock_name) is tuple and len(sock_name) == 2:
-                port = sock_name[1]
-        except socket.error as e:
-            error = {'errno': e.errno, 'msg': str(e)}
+            s.bind(('', port))
+        except OSError:
+            return False
+    return True
 
-        return port, error
 
+def release_ports():
+    """Give the ports of all nodes of this process back to the broker."""
+    broker = get_port_broker()
+    for port in list(p2p_ports.values()) + list(rpc_ports.values()):
+        # Ports of pooled nodes are held by the process running the pool
+        if port in broker.locks:
+            broker.release(port)
+    p2p_ports.clear()
+    rpc_ports.clear()
 
-def get_rpc_proxy(url, node_number, timeout=None, coverage_dir=None):
+
+def get_rpc_proxy(url, node_number, timeout=None, coverage_dir=None, rpc_stats=None):
     """
     Args:
         url (str): URL of the RPC server to call
         node_number (int): the node number (or id) that this calls to
         timeout: time to wait
         coverage_dir: directory to watch
+        rpc_stats (RPCStats): if specified, record latency and sizes of each call
 
     Returns:
         AuthServiceProxy. convenience object for making RPC calls.
@@ -363,7 +434,7 @@ def get_rpc_proxy(url, node_number, timeout=None, coverage_dir=None):
     proxy_kwargs = {}
     if timeout is not None:
         proxy_kwargs['timeout'] = timeout
-    proxy = AuthServiceProxy(url, **proxy_kwargs)
+    proxy = AuthServiceProxy(url, rpc_stats=rpc_stats, node_label="node%d" % node_number, **proxy_kwargs)
     proxy.url = url  # store URL on proxy for info
 
     coverage_logfile = coverage.get_filename(
@@ -373,21 +444,15 @@ def get_rpc_proxy(url, node_number, timeout=None, coverage_dir=None):
 
 
 def p2p_port(n):
-    if p2p_ports[n] == -1:
-        # Port isn't in the list, find one that is available
-        p2p_ports[n] = find_free_port()[0]
-        return p2p_ports[n]
-    else:
-        return p2p_ports[n]
+    if n not in p2p_ports:
+        p2p_ports[n] = get_port_broker().allocate()
+    return p2p_ports[n]
 
 
 def rpc_port(n):
-    if rpc_ports[n] == -1:
-        # Port isn't in the list, find one that is available
-        rpc_ports[n] = find_free_port()[0]
-        return rpc_ports[n]
-    else:
-        return rpc_ports[n]
+    if n not in rpc_ports:
+        rpc_ports[n] = get_port_broker().allocate()
+    return rpc_ports[n]
 
 
 def rpc_url(data_dir, i, rpchost=None):
@@ -512,6 +577,24 @@ def wait_for_block_sync(nodes, a, b, timeout=60):
         cur_time = time.time()
 
 
+def map_nodes(func, nodes):
+    """Call func on every node (or RPC connection) concurrently and return the results in order.
+
+    Each node is only ever used by one thread at a time. Exceptions are
+    raised once all calls finished."""
+    if len(nodes) <= 1:
+        return [func(node) for node in nodes]
+    with ThreadPoolExecutor(max_workers=len(nodes)) as executor:
+        return list(executor.map(func, nodes))
+
+
+def _poll_ms(seconds):
+    # A long-poll timeout of 0 means "wait forever" to the node
+    return max(1, int(seconds * 1000))
+
+
+@timeprofile.profiled("sync_blocks", wait=True)
+@tracing.traced("test", "sync")
 def sync_blocks(rpc_connections, *, wait=1, timeout=60):
     """
     Wait until everybody has the same tip.
@@ -520,15 +603,17 @@ def sync_blocks(rpc_connections, *, wait=1, timeout=60):
     one node already synced to the latest, stable tip, otherwise there's a
     chance it might return before all nodes are stably synced.
     """
+    rpc_connections = list(rpc_connections)
     # Use getblockcount() instead of waitforblockheight() to determine the
     # initial max height because the two RPCs look at different internal global
     # variables (chainActive vs latestBlock) and the former gets updated
     # earlier.
-    max_height = max(x.getblockcount() for x in rpc_connections)
+    max_height = max(map_nodes(lambda r: r.getblockcount(), rpc_connections))
     start_time = cur_time = time.time()
     tips = None
     while cur_time <= start_time + timeout:
-        tips = [r.waitforblockheight(max_height, int(wait * 1000)) for r in rpc_connections]
+        # All nodes long-poll at once, so a round lasts as long as the slowest node
+        tips = map_nodes(lambda r: r.waitforblockheight(max_height, _poll_ms(wait)), rpc_connections)
         if all(t["height"] == max_height for t in tips):
             if all(t["hash"] == tips[0]["hash"] for t in tips):
                 return
@@ -537,34 +622,59 @@ def sync_blocks(rpc_connections, *, wait=1, timeout=60):
     raise AssertionError("Block sync to height {} timed out:{}".format(max_height, "".join("\n  {!r}".format(tip) for tip in tips)))
 
 
+@timeprofile.profiled("sync_chain", wait=True)
+@tracing.traced("test", "sync")
 def sync_chain(rpc_connections, *, wait=1, timeout=60):
     """
     Wait until everybody has the same best block
     """
-    while timeout > 0:
-        best_hash = [x.getbestblockhash() for x in rpc_connections]
-        if best_hash == [best_hash[0]] * len(best_hash):
+    rpc_connections = list(rpc_connections)
+    deadline = time.time() + timeout
+    poll = 0.025
+    while True:
+        tips = map_nodes(lambda r: (r.getblockcount(), r.getbestblockhash()), rpc_connections)
+        if all(tip[1] == tips[0][1] for tip in tips):
             return
-        time.sleep(wait)
-        timeout -= wait
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            break
+        max_height = max(height for height, _ in tips)
+        if any(height < max_height for height, _ in tips):
+            # Nodes already at max_height return at once, the others as soon as they catch up
+            map_nodes(lambda r: r.waitforblockheight(max_height, _poll_ms(min(wait, remaining))), rpc_connections)
+        else:
+            # Competing tips at the same height: wait for them to move on
+            poll = min(poll * 2, wait, remaining)
+            map_nodes(lambda r: r.waitfornewblock(_poll_ms(poll)), rpc_connections)
     raise AssertionError("Chain sync failed: Best block hashes don't match")
 
 
+def _mempool_digest(txids):
+    return hashlib.sha256("".join(sorted(txids)).encode('ascii')).digest()
+
+
+@timeprofile.profiled("sync_mempools", wait=True)
+@tracing.traced("test", "sync")
 def sync_mempools(rpc_connections, *, wait=1, timeout=60):
     """
     Wait until everybody has the same transactions in their memory
     pools
     """
-    while timeout > 0:
-        pool = set(rpc_connections[0].getrawmempool())
-        num_match = 1
-        for i in range(1, len(rpc_connections)):
-            if set(rpc_connections[i].getrawmempool()) == pool:
-                num_match = num_match + 1
-        if num_match == len(rpc_connections):
-            return
-        time.sleep(wait)
-        timeout -= wait
+    rpc_connections = list(rpc_connections)
+    deadline = time.time() + timeout
+    poll = 0.025
+    while True:
+        # Only fetch the txids once the mempool sizes agree, and compare them by digest
+        sizes = map_nodes(lambda r: r.getmempoolinfo()["size"], rpc_connections)
+        if sizes == [sizes[0]] * len(sizes):
+            digests = map_nodes(lambda r: _mempool_digest(r.getrawmempool()), rpc_connections)
+            if digests == [digests[0]] * len(digests):
+                return
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            break
+        poll = min(poll * 2, wait)
+        time.sleep(min(poll, remaining))
     raise AssertionError("Mempool sync failed")
 
 
@@ -584,22 +694,161 @@ def find_output(node, txid, amount):
     raise RuntimeError("find_output txid %s : %s not found" % (txid, str(amount)))
 
 
-def gather_inputs(from_node, amount_needed, confirmations_required=1):
+def batch_rpc(node, method, params_list):
+    """
+    Call one RPC method once per entry of params_list, in a single batched request.
+    Returns the results in order and raises on the first error.
+    """
+    call = getattr(node, method)
+    requests = [call.get_request(*params) for params in params_list]
+    if not requests:
+        return []
+    responses = {response["id"]: response for response in node.batch(requests)}
+    results = []
+    for request in requests:
+        response = responses[request["id"]]
+        if response["error"] is not None:
+            raise JSONRPCException(response["error"])
+        results.append(response["result"])
+    return results
+
+
+def _ser_compact_size_hex(n):
+    if n < 253:
+        return "%02x" % n
+    if n < 0x10000:
+        return "fd" + n.to_bytes(2, "little").hex()
+    return "fe" + n.to_bytes(4, "little").hex()
+
+
+# The most outputs fan_out() puts in one transaction, keeping it well below the standard size limit
+MAX_FANOUT_OUTPUTS = 2000
+
+
+class UtxoPool:
+    """
+    Spendable outputs of one node's wallet, tracked locally.
+
+    The pool is loaded from listunspent by refresh() and then kept up to date
+    as transactions are built from it, so coins are handed out without a
+    listunspent round trip and shuffle per transaction. Outputs created
+    through the pool stay pending until generate() mines them (unless the
+    pool was created with minconf=0).
+    """
+
+    def __init__(self, node, minconf=1):
+        self.node = node
+        self.minconf = minconf
+        self.utxos = []
+        self.pending = []
+
+    def __len__(self):
+        return len(self.utxos)
+
+    def refresh(self):
+        """Reload the pool from the node's wallet, forgetting pending outputs."""
+        self.utxos = self.node.listunspent(self.minconf)
+        self.pending = []
+
+    def pop(self):
+        """Take a random coin out of the pool."""
+        i = random.randrange(len(self.utxos))
+        self.utxos[i], self.utxos[-1] = self.utxos[-1], self.utxos[i]
+        return self.utxos.pop()
+
+    def pop_largest(self):
+        """Take the coin with the highest amount out of the pool."""
+        i = max(range(len(self.utxos)), key=lambda j: self.utxos[j]["amount"])
+        self.utxos[i], self.utxos[-1] = self.utxos[-1], self.utxos[i]
+        return self.utxos.pop()
+
+    def add(self, txid, vout, address, amount, script_pub_key=None):
+        """Track an output of a transaction that was just sent."""
+        utxo = {"txid": txid, "vout": vout, "address": address, "amount": Decimal(amount)}
+        if script_pub_key is not None:
+            utxo["scriptPubKey"] = script_pub_key
+        (self.utxos if self.minconf == 0 else self.pending).append(utxo)
+
+    def select(self, amount_needed):
+        """
+        Take random coins that are enough to pay amount_needed.
+        Returns (total_in, inputs)
+        """
+        taken = []
+        total_in = Decimal("0.00000000")
+        while total_in < amount_needed and len(self.utxos) > 0:
+            t = self.pop()
+            total_in += t["amount"]
+            taken.append(t)
+        if total_in < amount_needed:
+            self.utxos.extend(taken)
+            raise RuntimeError("Insufficient funds: need %d, have %d" % (amount_needed, total_in))
+        return total_in, [{"txid": t["txid"], "vout": t["vout"], "address": t["address"]} for t in taken]
+
+    def generate(self, nblocks=1):
+        """
+        Mine blocks on the node and move the pending outputs that got confirmed into the pool.
+        Pending outputs that were neither mined nor are still in the mempool
+        (e.g. evicted or replaced) are dropped.
+        """
+        block_hashes = self.node.generate(nblocks)
+        if self.pending:
+            mined = set()
+            for block in batch_rpc(self.node, "getblock", [(block_hash,) for block_hash in block_hashes]):
+                mined.update(block["tx"])
+            mempool = set(self.node.getrawmempool())
+            self.utxos.extend(utxo for utxo in self.pending if utxo["txid"] in mined)
+            self.pending = [utxo for utxo in self.pending if utxo["txid"] in mempool]
+        return block_hashes
+
+    def fan_out(self, count, feerate, address=None, max_outputs=MAX_FANOUT_OUTPUTS):
+        """
+        Split the largest coins of the pool into count outputs to address.
+
+        Each coin funds one transaction with up to max_outputs equal outputs,
+        paying feerate per kB. The transactions are signed and sent in batches.
+        Returns their txids.
+        """
+        if address is None:
+            address = self.node.getnewaddress()
+        script = self.node.validateaddress(address)["scriptPubKey"]
+        sizes = [max_outputs] * (count // max_outputs)
+        if count % max_outputs:
+            sizes.append(count % max_outputs)
+        plans = []
+        for n in sizes:
+            t = self.pop_largest()
+            # Assume a P2PKH input; outputs pay to script
+            tx_size = 10 + 148 + (9 + len(script) // 2) * n
+            fee = satoshi_round(feerate * ((tx_size + 999) // 1000))
+            value = satoshi_round((t["amount"] - fee) / n)
+            plans.append((t, n, value))
+        raw_txs = batch_rpc(self.node, "createrawtransaction",
+                            [([{"txid": t["txid"], "vout": t["vout"]}], {address: value}) for t, _, value in plans])
+        fanned_txs = []
+        for raw_tx, (_, n, value) in zip(raw_txs, plans):
+            # Replace the single output with n copies of it
+            txout = int(value * 100000000).to_bytes(8, "little").hex() + _ser_compact_size_hex(len(script) // 2) + script
+            outputs_start = len(raw_tx) - 8 - len(txout) - 2
+            assert_equal(raw_tx[outputs_start:-8], "01" + txout)
+            fanned_txs.append(raw_tx[:outputs_start] + _ser_compact_size_hex(n) + txout * n + raw_tx[-8:])
+        signed = batch_rpc(self.node, "signrawtransaction", [(tx,) for tx in fanned_txs])
+        txids = batch_rpc(self.node, "sendrawtransaction", [(result["hex"],) for result in signed])
+        for txid, (_, n, value) in zip(txids, plans):
+            for vout in range(n):
+                self.add(txid, vout, address, value, script)
+        return txids
+
+
+def gather_inputs(from_node, amount_needed, confirmations_required=1, utxo_pool=None):
     """
     Return a random set of unspent txouts that are enough to pay amount_needed
     """
     assert (confirmations_required >= 0)
-    utxo = from_node.listunspent(confirmations_required)
-    random.shuffle(utxo)
-    inputs = []
-    total_in = Decimal("0.00000000")
-    while total_in < amount_needed and len(utxo) > 0:
-        t = utxo.pop()
-        total_in += t["amount"]
-        inputs.append({"txid": t["txid"], "vout": t["vout"], "address": t["address"]})
-    if total_in < amount_needed:
-        raise RuntimeError("Insufficient funds: need %d, have %d" % (amount_needed, total_in))
-    return total_in, inputs
+    if utxo_pool is None:
+        utxo_pool = UtxoPool(from_node, confirmations_required)
+        utxo_pool.refresh()
+    return utxo_pool.select(amount_needed)
 
 
 def make_change(from_node, amount_in, amount_out, fee):
@@ -620,54 +869,57 @@ def make_change(from_node, amount_in, amount_out, fee):
     return outputs
 
 
-def random_transaction(nodes, amount, min_fee, fee_increment, fee_variants):
+def random_transaction(nodes, amount, min_fee, fee_increment, fee_variants, utxo_pools=None):
     """
     Create a random transaction.
+    Pass one UtxoPool per node in utxo_pools to select coins from (and track
+    the new outputs in) the pools instead of calling listunspent.
     Returns (txid, hex-encoded-transaction-data, fee)
     """
-    from_node = random.choice(nodes)
-    to_node = random.choice(nodes)
+    from_index = random.randrange(len(nodes))
+    to_index = random.randrange(len(nodes))
+    from_node = nodes[from_index]
+    to_node = nodes[to_index]
     fee = min_fee + fee_increment * random.randint(0, fee_variants)
 
-    (total_in, inputs) = gather_inputs(from_node, amount + fee)
+    (total_in, inputs) = gather_inputs(from_node, amount + fee, utxo_pool=utxo_pools[from_index] if utxo_pools else None)
     outputs = make_change(from_node, total_in, amount, fee)
-    outputs[to_node.getnewaddress()] = float(amount)
+    to_address = to_node.getnewaddress()
+    outputs[to_address] = float(amount)
 
     rawtx = from_node.createrawtransaction(inputs, outputs)
     signresult = from_node.signrawtransaction(rawtx)
     txid = from_node.sendrawtransaction(signresult["hex"], True)
 
+    if utxo_pools:
+        # createrawtransaction keeps the outputs in the order given
+        for vout, (address, value) in enumerate(outputs.items()):
+            pool = utxo_pools[to_index] if address == to_address else utxo_pools[from_index]
+            pool.add(txid, vout, address, satoshi_round(value))
+
     return txid, signresult["hex"], fee
 
 
 # Helper to create at least "count" utxos
 # Pass in a fee that is sufficient for relay and mining new transactions.
 def create_confirmed_utxos(fee, node, count):
-    to_generate = int(0.5 * count) + 101
-    while to_generate > 0:
-        node.generate(min(25, to_generate))
-        to_generate -= 25
-    utxos = node.listunspent()
-    iterations = count - len(utxos)
-    addr1 = node.getnewaddress()
-    addr2 = node.getnewaddress()
-    if iterations <= 0:
-        return utxos
-    for _ in range(iterations):
-        t = utxos.pop()
-        inputs = [{"txid": t["txid"], "vout": t["vout"]}]
-        outputs = {}
-        send_value = t['amount'] - fee
-        outputs[addr1] = satoshi_round(send_value / 2)
-        outputs[addr2] = satoshi_round(send_value / 2)
-        raw_tx = node.createrawtransaction(inputs, outputs)
-        signed_tx = node.signrawtransaction(raw_tx)["hex"]
-        node.sendrawtransaction(signed_tx)
+    utxo_pool = UtxoPool(node)
+    utxo_pool.refresh()
+    if len(utxo_pool) >= count:
+        return utxo_pool.utxos
+    # Split every coin into at most 100 outputs, so that they stay big enough to
+    # pay for large transactions. Mine coinbases to maturity if there are too few coins.
+    outputs_per_coin = 100
+    coins_needed = (count + outputs_per_coin - 1) // outputs_per_coin
+    if len(utxo_pool) < coins_needed:
+        node.generate(coins_needed - len(utxo_pool) + 100)
+        utxo_pool.refresh()
+    utxo_pool.fan_out(count - len(utxo_pool) + coins_needed, fee, max_outputs=outputs_per_coin)
 
     while node.getmempoolinfo()['size'] > 0:
-        node.generate(1)
+        utxo_pool.generate(1)
 
-    utxos = node.listunspent()
+    utxos = utxo_pool.utxos
     assert (len(utxos) >= count)
     return utxos
 
@@ -704,22 +956,25 @@ def create_tx(node, coinbase, to_address, amount):
 
 # Create a spend of each passed-in utxo, splicing in "txouts" to each raw
 # transaction to make it large.  See gen_return_txouts() above.
+# utxos is a list of listunspent entries or a UtxoPool; a pool also tracks the change outputs.
 def create_lots_of_big_transactions(node, txouts, utxos, num, fee):
     addr = node.getnewaddress()
-    txids = []
+    spends = []
     for _ in range(num):
         t = utxos.pop()
         inputs = [{"txid": t["txid"], "vout": t["vout"]}]
         outputs = {}
         change = t['amount'] - fee
         outputs[addr] = satoshi_round(change)
-        rawtx = node.createrawtransaction(inputs, outputs)
-        newtx = rawtx[0:92]
-        newtx = newtx + txouts
-        newtx = newtx + rawtx[94:]
-        signresult = node.signrawtransaction(newtx, None, None, "NONE")
-        txid = node.sendrawtransaction(signresult["hex"], True)
-        txids.append(txid)
+        spends.append((inputs, outputs))
+    rawtxs = batch_rpc(node, "createrawtransaction", spends)
+    newtxs = [rawtx[0:92] + txouts + rawtx[94:] for rawtx in rawtxs]
+    signresults = batch_rpc(node, "signrawtransaction", [(newtx, None, None, "NONE") for newtx in newtxs])
+    txids = batch_rpc(node, "sendrawtransaction", [(signresult["hex"], True) for signresult in signresults])
+    if isinstance(utxos, UtxoPool):
+        # The change output comes after the 128 OP_RETURN outputs
+        for txid, (_, outputs) in zip(txids, spends):
+            utxos.add(txid, 128, addr, outputs[addr])
     return txids
 
 
@@ -728,10 +983,9 @@ def mine_large_block(node, utxos=None):
     # and 14 of them is close to the 1MB block limit
     num = 14
     txouts = gen_return_txouts()
-    utxos = utxos if utxos is not None else []
+    utxos = utxos if utxos is not None else UtxoPool(node)
     if len(utxos) < num:
-        utxos.clear()
-        utxos.extend(node.listunspent())
+        utxos.refresh()
     fee = 100 * node.getnetworkinfo()["relayfee"]
     create_lots_of_big_transactions(node, txouts, utxos, num, fee=fee)
-    node.generate(1)
+    utxos.generate(1)
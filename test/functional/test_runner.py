@@ -18,11 +18,13 @@ For a description of arguments recognized by test scripts, see
 
 """
 
-from collections import deque
+from collections import defaultdict, deque
 import argparse
 import configparser
 import datetime
+import json
 import os
+import selectors
 import time
 import shutil
 import signal
@@ -32,6 +34,10 @@ import tempfile
 import re
 import logging
 
+from test_framework import coverage as rpc_coverage, procstats, rpcstats, util
+from test_framework.chaincache import ChainCache, default_cache_root
+from test_framework.nodepool import NodePool
+
 # Formatting. Default colors to empty strings.
 BOLD, GREEN, RED, GREY = ("", ""), ("", ""), ("", ""), ("", "")
 
@@ -59,6 +65,13 @@ if os.name == 'posix':
 TEST_EXIT_PASSED = 0
 TEST_EXIT_SKIPPED = 77
 
+# Durations of passed tests, kept in the cache dir to schedule the longest tests first
+DURATIONS_FILE = "test_durations.json"
+# Memory to reserve per parallel job (a test runs up to MAX_NODES evrmored processes)
+MEMORY_PER_JOB = 1 << 30
+# Interval at which the runner prints progress and checks for timed out tests
+JOB_POLL_INTERVAL = 0.5
+
 EXTENDED_SCRIPTS = [
     # These tests are not run by the build process.
     # Longest test should go first, to favor running tests in parallel
@@ -88,6 +101,8 @@ BASE_SCRIPTS= [
     'feature_assets_p2sh.py',
     'feature_messaging.py',
     'feature_assets_reorg.py',
+    'feature_assets_rpc_cache.py',
+    'feature_assets_classify.py',
     'feature_assets_mempool.py',
     'feature_restricted_assets.py',
     'feature_raw_restricted_assets.py',
@@ -203,6 +218,8 @@ ALL_SCRIPTS = EXTENDED_SCRIPTS + BASE_SCRIPTS
 
 NON_SCRIPTS = [
     # These are python files that live in the functional tests directory, but are not test scripts.
+    "bench_key.py",
+    "bench_logs.py",
     "combine_logs.py",
     "create_cache.py",
     "test_runner.py",
@@ -214,6 +231,7 @@ def main():
     parser = argparse.ArgumentParser(add_help=False, usage='%(prog)s [test_runner.py options] [script options] [scripts]', description=__doc__,
                                      epilog='Help text and arguments for individual test script:', formatter_class=argparse.RawTextHelpFormatter)
     parser.add_argument('--ansi', action='store_true', default=sys.stdout.isatty(), help='Use ANSI colors and dots in output (enabled by default when standard output is a TTY)')
+    parser.add_argument('--cachedir', metavar='dir', default=default_cache_root(), help='Directory of the pregenerated chain cache. Entries are keyed by evrmored binary and chain parameters and reused across runs. Default=' + default_cache_root())
     parser.add_argument('--combinedlogslen', type=int, default=0, metavar='n', help='On failure, print a log (of length n lines) to the console, combined from the test framework and all test nodes.')
     parser.add_argument('--coverage', action='store_true', help='Generate a basic coverage report for the RPC interface.')
     parser.add_argument('--exclude', metavar='', help='Specify a comma-separated-list of scripts to exclude.')
@@ -222,12 +240,17 @@ def main():
     parser.add_argument('--filter', metavar='', help='Filter scripts to run by regular expression.')
     parser.add_argument('--force', action='store_true', help='Run tests even on platforms where they are disabled by default (e.g. windows).')
     parser.add_argument('--help', action='store_true', help='Print help text and exit.')
-    parser.add_argument('--jobs', type=int, metavar='', default=get_cpu_count(), help='How many test scripts to run in parallel. Default=.' + str(get_cpu_count()))
-    parser.add_argument('--keepcache', action='store_true', help='The default behavior is to flush the cache directory on startup. --keepcache retains the cache from the previous test-run.')
+    parser.add_argument('--jobs', type=int, metavar='', default=get_default_jobs(), help='How many test scripts to run in parallel. Default is the number of CPUs, limited by available memory: ' + str(get_default_jobs()))
+    parser.add_argument('--flushcache', action='store_true', help='Delete the chain cache on startup. Only needed if it got into a bad state: entries of other binaries are never used.')
+    parser.add_argument('--keepcache', action='store_true', help='Ignored. The chain cache is always kept, see --flushcache.')
     parser.add_argument('--list', action='store_true', help='Print list of tests and exit.')
     parser.add_argument('--loop', type=int, metavar='n', default=1, help='Run(loop) the tests n number of times.')
+    parser.add_argument('--nodepool', type=int, metavar='n', default=0, help='Keep n evrmored processes running on the cached chain and let tests that declare themselves poolable use them instead of starting their own nodes.')
     parser.add_argument('--onlyextended', action='store_true', help='Run only the extended test suite.')
     parser.add_argument('--quiet',  action='store_true', help='Only print results summary and failure logs.')
+    parser.add_argument('--resources', metavar='file', help='Sample the peak RSS, CPU time, bytes written and open fds of the evrmored processes of every test (Linux only). Show them in the results table and write them to this file, as JUnit XML if it ends in .xml and as JSON otherwise.')
+    parser.add_argument('--rpcstats', metavar='file', help='Record per-method RPC latency and size statistics for every test and write the merged suite-wide report to this JSON file.')
+    parser.add_argument('--tracedir', metavar='dir', help='Write a Chrome trace event timeline (RPC calls, P2P messages, sync waits, node log events) of every test into this directory.')
     parser.add_argument('--tmpdirprefix', metavar='', default=tempfile.gettempdir(), help='Root directory for data.')
 
 
@@ -343,8 +366,8 @@ def main():
         check_script_list(config["environment"]["SRCDIR"])
         check_script_prefixes()
 
-        if not args.keepcache:
-            shutil.rmtree("%s/test/cache" % config["environment"]["BUILDDIR"], ignore_errors=True)
+        if args.flushcache:
+            ChainCache(args.cachedir).clear()
 
         run_tests(
             test_list=test_list,
@@ -352,9 +375,14 @@ def main():
             build_dir=config["environment"]["BUILDDIR"],
             exeext=config["environment"]["EXEEXT"],
             tmpdir=tmpdir,
+            cache_dir=args.cachedir,
             use_term_control=args.ansi,
             jobs=args.jobs,
             enable_coverage=args.coverage,
+            rpc_stats_file=args.rpcstats,
+            node_pool_size=args.nodepool,
+            resources_file=args.resources,
+            trace_dir=args.tracedir,
             args=pass_on_args,
             combined_logs_len=args.combinedlogslen,
             failfast=args.failfast,
@@ -362,7 +390,7 @@ def main():
         )
 
 
-def run_tests(test_list, src_dir, build_dir, exeext, tmpdir, use_term_control, jobs=1, enable_coverage=False, args=None, combined_logs_len=0, failfast=False, last_loop=False):
+def run_tests(test_list, src_dir, build_dir, exeext, tmpdir, cache_dir, use_term_control, jobs=1, enable_coverage=False, rpc_stats_file=None, node_pool_size=0, resources_file=None, trace_dir=None, args=None, combined_logs_len=0, failfast=False, last_loop=False):
     # Warn if evrmored is already running (unix only)
     if args is None:
         args = []
@@ -372,11 +400,6 @@ def run_tests(test_list, src_dir, build_dir, exeext, tmpdir, use_term_control, j
     except (OSError, subprocess.SubprocessError):
         pass
 
-    # Warn if there is a cache directory
-    cache_dir = "%s/test/cache" % build_dir
-    if os.path.isdir(cache_dir):
-        print("%sWARNING!%s There is a cache directory here: %s. If tests fail unexpectedly, try deleting the cache directory." % (BOLD[1], BOLD[0], cache_dir))
-
     #Set env vars
     if "EVRMORED" not in os.environ:
         os.environ["EVRMORED"] = build_dir + '/src/evrmored' + exeext
@@ -384,14 +407,13 @@ def run_tests(test_list, src_dir, build_dir, exeext, tmpdir, use_term_control, j
 
     tests_dir = src_dir + '/test/functional/'
 
-    # limit number of jobs to 13
-    if jobs > 13:
-        jobs = 13
-        print("Jobs limited to 13 threads max.")
     print("Using: ", jobs, " threads")
 
     flags = ["--srcdir={}/src".format(build_dir)] + args
     flags.append("--cachedir=%s" % cache_dir)
+    # Tests claim their ports through lock files here, shared with other runners using the same --tmpdirprefix
+    port_dir = os.path.join(os.path.dirname(tmpdir), "evrmore_test_ports")
+    flags.append("--portdir=%s" % port_dir)
 
     if enable_coverage:
         coverage = RPCCoverage()
@@ -400,7 +422,14 @@ def run_tests(test_list, src_dir, build_dir, exeext, tmpdir, use_term_control, j
     else:
         coverage = None
 
-    if len(test_list) > 1 and jobs > 1:
+    if rpc_stats_file:
+        rpc_stats_dir = tempfile.mkdtemp(prefix="rpcstats")
+        flags.append("--rpcstatsdir=%s" % rpc_stats_dir)
+        logging.debug("Initializing RPC statistics directory at %s" % rpc_stats_dir)
+    else:
+        rpc_stats_dir = None
+
+    if (len(test_list) > 1 and jobs > 1) or node_pool_size:
         # Populate cache
         try:
             subprocess.check_output([tests_dir + 'create_cache.py'] + flags + ["--tmpdir=%s/cache" % tmpdir])
@@ -415,6 +444,20 @@ def run_tests(test_list, src_dir, build_dir, exeext, tmpdir, use_term_control, j
             print("\n----</test_runner>---\n")
             raise
 
+    if node_pool_size:
+        util.port_broker = util.PortBroker(port_dir)
+        node_pool = NodePool(os.path.join(tmpdir, "nodepool"))
+        cache = ChainCache(cache_dir)
+        node_pool.start(cache.entry_dir(cache.default_chain_key(os.environ["EVRMORED"])), node_pool_size)
+        flags.append("--nodepool=%s" % node_pool.pool_dir)
+        logging.debug("Started %d pooled nodes in %.1f s" % (node_pool_size, node_pool.startup_time))
+    else:
+        node_pool = None
+
+    # Run the longest tests first, so that they don't stretch the end of the run
+    durations_file = os.path.join(cache_dir, DURATIONS_FILE)
+    test_list = schedule_tests(test_list, load_durations(durations_file))
+
     #Run Tests
     job_queue = TestHandler(
         num_tests_parallel=jobs,
@@ -422,7 +465,9 @@ def run_tests(test_list, src_dir, build_dir, exeext, tmpdir, use_term_control, j
         tmpdir=tmpdir,
         use_term_control=use_term_control,
         test_list=test_list,
-        flags=flags
+        flags=flags,
+        monitor_resources=bool(resources_file) and procstats.SUPPORTED,
+        trace_dir=os.path.abspath(trace_dir) if trace_dir else None,
     )
 
     start_time = time.time()
@@ -461,6 +506,17 @@ def run_tests(test_list, src_dir, build_dir, exeext, tmpdir, use_term_control, j
                 break
 
     print_results(test_results, max_len_name, (int(time.time() - start_time)))
+    save_durations(durations_file, test_results)
+
+    if resources_file:
+        procstats.write_report(resources_file, [(r.name, r.status, r.time, r.resources) for r in test_results])
+        print("Resource usage written to %s\n" % os.path.abspath(resources_file))
+
+    if node_pool:
+        savings = node_pool.stop()
+        print("Node pool: %d tests ran on pooled nodes, saving about %.1f s (startup %.1f s + shutdown %.1f s per test, %.1f s spent resetting nodes)" % (
+            savings.tests, savings.saved_time, savings.startup_time, savings.shutdown_time, savings.reset_time))
+        shutil.rmtree(node_pool.pool_dir)
 
     if coverage:
         coverage_passed = coverage.report_rpc_coverage()
@@ -470,6 +526,10 @@ def run_tests(test_list, src_dir, build_dir, exeext, tmpdir, use_term_control, j
     else:
         coverage_passed = True
 
+    if rpc_stats_dir:
+        report_rpc_stats(rpc_stats_dir, rpc_stats_file)
+        shutil.rmtree(rpc_stats_dir)
+
     # Clear up the temp directory if all subdirectories are gone
     if not os.listdir(tmpdir):
         os.rmdir(tmpdir)
@@ -484,8 +544,41 @@ def run_tests(test_list, src_dir, build_dir, exeext, tmpdir, use_term_control, j
         sys.exit(not all_passed)
 
 
+def load_durations(filename):
+    """Return the recorded durations in seconds by test (script name and arguments)."""
+    try:
+        with open(filename, 'r', encoding='utf8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_durations(filename, test_results):
+    """Record the durations of the passed tests, keeping those of all other tests."""
+    durations = load_durations(filename)
+    for test_result in test_results:
+        if test_result.status == "Passed":
+            durations[test_result.name] = test_result.time
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    with open(filename + ".%d" % os.getpid(), 'w', encoding='utf8') as f:
+        json.dump(durations, f, indent=1, sort_keys=True)
+    os.replace(filename + ".%d" % os.getpid(), filename)
+
+
+def schedule_tests(test_list, durations):
+    """Order tests by recorded duration, longest first.
+
+    Tests without a recorded duration might be long, so they go first, in
+    the order of the test lists (which put the longest tests first)."""
+    return sorted(test_list, key=lambda test: -durations.get(test, float('inf')))
+
+
 def print_results(test_results, max_len_name, runtime):
-    results = "\n" + BOLD[1] + "%s | %s | %s\n\n" % ("TEST".ljust(max_len_name), "STATUS   ", "DURATION") + BOLD[0]
+    show_resources = any(test_result.resources is not None for test_result in test_results)
+    header = "%s | %s | %s" % ("TEST".ljust(max_len_name), "STATUS   ", "DURATION")
+    if show_resources:
+        header += " | " + procstats.format_header()
+    results = "\n" + BOLD[1] + header + "\n\n" + BOLD[0]
 
     test_results.sort(key=TestResult.sort_key)
     all_passed = True
@@ -495,6 +588,7 @@ def print_results(test_results, max_len_name, runtime):
         all_passed = all_passed and test_result.was_successful
         time_sum += test_result.time
         test_result.padding = max_len_name
+        test_result.show_resources = show_resources
         results += str(test_result)
 
     status = TICK + "Passed" if all_passed else CROSS + "Failed"
@@ -513,7 +607,7 @@ class TestHandler:
     Trigger the test scripts passed in via the list.
     """
 
-    def __init__(self, num_tests_parallel, tests_dir, tmpdir, use_term_control, test_list=None, flags=None):
+    def __init__(self, num_tests_parallel, tests_dir, tmpdir, use_term_control, test_list=None, flags=None, monitor_resources=False, trace_dir=None):
         assert(num_tests_parallel >= 1)
         self.num_jobs = num_tests_parallel
         self.tests_dir = tests_dir
@@ -521,8 +615,14 @@ class TestHandler:
         self.use_term_control = use_term_control
         self.test_list = test_list
         self.flags = flags
+        self.monitor_resources = monitor_resources
+        self.trace_dir = trace_dir
+        if trace_dir:
+            os.makedirs(trace_dir, exist_ok=True)
         self.num_running = 0
         self.jobs = []
+        # Wakes up as soon as a job exits, where pidfds are supported (Linux 5.3+)
+        self.selector = selectors.DefaultSelector()
 
 
     def get_next(self):
@@ -537,21 +637,29 @@ class TestHandler:
             test_argv = test.split()
             test_dir = "{}/{}_{}".format(self.tmpdir, re.sub(".py$", "", test_argv[0]), port_seed)
             tmpdir_arg = ["--tmpdir={}".format(test_dir)]
+            trace_arg = ["--trace={}/{}_{}.json".format(self.trace_dir, re.sub(".py$", "", test_argv[0]), port_seed)] if self.trace_dir else []
+            proc = subprocess.Popen([self.tests_dir + test_argv[0]] + test_argv[1:] + self.flags + port_seed_arg + tmpdir_arg + trace_arg, universal_newlines=True, stdout=log_stdout, stderr=log_stderr)
             self.jobs.append((test,
                               time.time(),
-                              subprocess.Popen([self.tests_dir + test_argv[0]] + test_argv[1:] + self.flags + port_seed_arg + tmpdir_arg, universal_newlines=True, stdout=log_stdout, stderr=log_stderr),
+                              proc,
                               test_dir,
                               log_stdout,
-                              log_stderr))
+                              log_stderr,
+                              procstats.ResourceMonitor(proc.pid) if self.monitor_resources else None))
+            self._watch(proc)
         if not self.jobs:
             raise IndexError('pop from empty list')
 
         dot_count = 0
+        last_dot = time.time()
         while True:
+            # One scan of /proc for the monitors of all running tests
+            processes = procstats.scan_processes() if self.monitor_resources else None
             # Return first proc that finishes
-            time.sleep(.5)
             for job in self.jobs:
-                (name, start_time, proc, test_dir, log_out, log_err) = job
+                (name, start_time, proc, test_dir, log_out, log_err, monitor) = job
+                if monitor is not None:
+                    monitor.sample(processes)
                 if int(time.time() - start_time) > 20 * 60:
                     # Timeout individual tests after 20 minutes (to stop tests hanging and not
                     # providing useful output.
@@ -568,15 +676,41 @@ class TestHandler:
                         status = "Failed"
                     self.num_running -= 1
                     self.jobs.remove(job)
+                    self._unwatch(proc)
                     if self.use_term_control:
                         clear_line = '\r' + (' ' * dot_count) + '\r'
                         print(clear_line, end='', flush=True)
 
-                    return TestResult(name, status, int(time.time() - start_time)), test_dir, stdout, stderr
+                    resources = monitor.totals() if monitor is not None else None
+                    return TestResult(name, status, int(time.time() - start_time), resources), test_dir, stdout, stderr
+            self._wait_for_exit(procstats.RESOURCE_SAMPLE_INTERVAL if self.monitor_resources else JOB_POLL_INTERVAL)
+            if time.time() - last_dot < JOB_POLL_INTERVAL:
+                continue
+            last_dot = time.time()
             if self.use_term_control:
                 print('.', end='', flush=True)
             dot_count += 1
 
+    def _watch(self, proc):
+        try:
+            fd = os.pidfd_open(proc.pid)
+        except (AttributeError, OSError):
+            return
+        self.selector.register(fd, selectors.EVENT_READ, proc)
+
+    def _unwatch(self, proc):
+        for key in list(self.selector.get_map().values()):
+            if key.data is proc:
+                self.selector.unregister(key.fd)
+                os.close(key.fd)
+
+    def _wait_for_exit(self, timeout):
+        """Block until a watched job exits or timeout seconds have passed."""
+        if self.selector.get_map():
+            self.selector.select(timeout)
+        else:
+            time.sleep(timeout)
+
     def kill_and_join(self):
         """Send SIGKILL to all jobs and block until all have ended."""
         process = [i[2] for i in self.jobs]
@@ -586,13 +720,16 @@ class TestHandler:
 
         for p in process:
             p.wait()
+            self._unwatch(p)
 
 class TestResult:
-    def __init__(self, name, status, result_time):
+    def __init__(self, name, status, result_time, resources=None):
         self.name = name
         self.status = status
         self.time = result_time
+        self.resources = resources
         self.padding = 0
+        self.show_resources = False
 
     def sort_key(self):
         if self.status == "Passed":
@@ -616,7 +753,11 @@ class TestResult:
             color = BOLD
             glyph = DASH
 
-        return color[1] + "%s | %s%s | %s s\n" % (self.name.ljust(self.padding), glyph, self.status.ljust(7), self.time) + color[0]
+        line = "%s | %s%s | %s s" % (self.name.ljust(self.padding), glyph, self.status.ljust(7), self.time)
+        if self.show_resources:
+            # Pad the duration to the width of its header
+            line = line.ljust(len(line) - len("%s s" % self.time) + len("DURATION")) + " | " + procstats.format_usage(self.resources)
+        return color[1] + line + "\n" + color[0]
 
     @property
     def was_successful(self):
@@ -655,6 +796,10 @@ def check_script_list(src_dir):
 
 
 def get_cpu_count():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        pass
     try:
         import multiprocessing
         return multiprocessing.cpu_count()
@@ -662,6 +807,36 @@ def get_cpu_count():
         return 4
 
 
+def get_available_memory():
+    """Return the available memory in bytes, or None if it is unknown."""
+    try:
+        with open('/proc/meminfo', 'r', encoding='utf8') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def get_default_jobs():
+    """One job per CPU, as long as each job has MEMORY_PER_JOB of memory."""
+    jobs = get_cpu_count()
+    memory = get_available_memory()
+    if memory is not None:
+        jobs = min(jobs, memory // MEMORY_PER_JOB)
+    return max(1, jobs)
+
+
+def report_rpc_stats(rpc_stats_dir, rpc_stats_file):
+    """Merge the RPC statistics dumped by each test, print the slowest RPCs and tests and write the JSON report."""
+    suite, tests = rpcstats.merge_stats_dir(rpc_stats_dir)
+    print(BOLD[1] + "RPC statistics (slowest methods and tests by accumulated RPC time):" + BOLD[0])
+    print(rpcstats.format_report(suite, tests))
+    rpcstats.write_report(rpc_stats_file, suite, tests)
+    print("RPC statistics written to %s\n" % os.path.abspath(rpc_stats_file))
+
+
 class RPCCoverage:
     """
     Coverage reporting utilities for test_runner.
@@ -683,10 +858,17 @@ class RPCCoverage:
 
     def report_rpc_coverage(self):
         """
-        Print out RPC commands that were unexercised by tests.
+        Print out how often and how long each RPC command was called, and the commands that were unexercised by tests.
 
         """
-        uncovered = self._get_uncovered_rpc_commands()
+        uncovered, calls = self._get_uncovered_rpc_commands()
+
+        if calls:
+            print("RPC calls by accumulated time:")
+            print("  %-32s %8s %10s %10s" % ("COMMAND", "CALLS", "TIME(s)", "AVG(ms)"))
+            for command, (count, total_time) in sorted(calls.items(), key=lambda item: item[1][1], reverse=True):
+                print("  %-32s %8d %10.3f %10.3f" % (command, count, total_time, 1000 * total_time / count))
+            print()
 
         if uncovered:
             print("Uncovered RPC commands:")
@@ -701,7 +883,8 @@ class RPCCoverage:
 
     def _get_uncovered_rpc_commands(self):
         """
-        Return a set of currently untested RPC commands.
+        Return a set of currently untested RPC commands, and a dict of the
+        tested ones to [call count, total seconds].
 
         """
         # This is shared from `test/functional/test-framework/coverage.py`
@@ -711,7 +894,7 @@ class RPCCoverage:
         coverage_ref_filename = os.path.join(self.dir, reference_filename)
         coverage_filenames = set()
         all_cmds = set()
-        covered_cmds = set()
+        calls = defaultdict(lambda: [0, 0.0])
 
         if not os.path.isfile(coverage_ref_filename):
             raise RuntimeError("No coverage reference found")
@@ -725,10 +908,11 @@ class RPCCoverage:
                     coverage_filenames.add(os.path.join(root, filename))
 
         for filename in coverage_filenames:
-            with open(filename, 'r', encoding="utf8") as coverage_file:
-                covered_cmds.update([line.strip() for line in coverage_file.readlines()])
+            for command, (count, total_time) in rpc_coverage.read_coverage_file(filename).items():
+                calls[command][0] += count
+                calls[command][1] += total_time
 
-        return all_cmds - covered_cmds
+        return all_cmds - set(calls), calls
 
 
 if __name__ == '__main__':
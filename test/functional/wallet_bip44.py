@@ -7,6 +7,7 @@
 """Test the Wallet BIP44 12 words implementation and supporting RPC"""
 
 import os
+from test_framework.bip44 import Bip44Wallet
 from test_framework.test_framework import EvrmoreTestFramework
 from test_framework.util import assert_equal, assert_does_not_contain, assert_contains, assert_raises_rpc_error
 from test_framework.wallet_util import bip39_english
@@ -91,6 +92,16 @@ class Bip44Test(EvrmoreTestFramework):
             assert_contains(word_list_2[i], bip39_english)
             assert_contains(word_list_3[i], bip39_english)
 
+        # The addresses of the wallets are the ones derived from their words and passphrase
+        self.log.info("Testing BIP-44 address derivation")
+        for node, mnemonic, passphrase in ((nodes[0], MNEMONIC_0, MNEMONIC_PASS_0), (nodes[1], MNEMONIC_1, '')):
+            wallet = Bip44Wallet(mnemonic, passphrase)
+            for _ in range(3):
+                address = node.getnewaddress()
+                assert_equal(wallet.address(node.validateaddress(address)['hdkeypath']), address)
+            change_address = node.getrawchangeaddress()
+            assert_equal(wallet.address(node.validateaddress(change_address)['hdkeypath']), change_address)
+
         # None of the words should be text-readable in the log files
         self.log.info("Testing that BIP-44 words aren't text readable")
         mnemonic_2 = nodes[2].getmywords()['word_list']